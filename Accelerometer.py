@@ -1,5 +1,7 @@
 import ImportEDF
 import EpochData
+import Logger
+import RunLength
 
 import csv
 import matplotlib.pyplot as plt
@@ -13,6 +15,9 @@ from sklearn.preprocessing import PolynomialFeatures
 import math
 
 
+logger = Logger.get_logger(__name__)
+
+
 # ====================================================================================================================
 # ================================================ WRIST ACCELEROMETER ===============================================
 # ====================================================================================================================
@@ -22,10 +27,10 @@ class Wrist:
 
     def __init__(self, subjectID=None, filepath=None, output_dir=None, load_raw=False, accel_only=False,
                  epoch_len=15, start_offset=0, end_offset=0, ecg_object=None,
-                 from_processed=True, processed_folder=None, write_results=False):
+                 from_processed=True, processed_folder=None, write_results=False, precision="float64",
+                 incremental=False):
 
-        print()
-        print("======================================== WRIST ACCELEROMETER ========================================")
+        logger.info("WRIST ACCELEROMETER")
 
         self.subjectID = subjectID
         self.filepath = filepath
@@ -33,6 +38,7 @@ class Wrist:
         self.output_dir = output_dir
 
         self.load_raw = load_raw
+        self.precision = precision
         self.accel_only = accel_only
 
         self.epoch_len = epoch_len
@@ -45,13 +51,19 @@ class Wrist:
         self.processed_folder = processed_folder
         self.write_results = write_results
 
-        # Loads raw accelerometer data and generates timestamps
+        # Loads raw accelerometer data and generates timestamps.
+        # Incremental runs only read new data records while epoching, so the whole file is not imported.
         self.raw = ImportEDF.GENEActiv(filepath=self.filepath,
                                        start_offset=self.start_offset, end_offset=self.end_offset,
-                                       load_raw=self.load_raw)
+                                       load_raw=self.load_raw and not incremental, precision=self.precision)
+
+        if incremental:
+            self.raw.read_header()
 
         self.epoch = EpochData.EpochAccel(raw_data=self.raw, accel_only=self.accel_only,
-                                          from_processed=self.from_processed, processed_folder=processed_folder)
+                                          from_processed=self.from_processed, processed_folder=processed_folder,
+                                          incremental=incremental,
+                                          checkpoint_dir=self.output_dir + "Model Output/" if incremental else None)
 
         # Model
         self.model = WristModel(accel_object=self, ecg_object=self.ecg_obejct)
@@ -74,7 +86,7 @@ class Wrist:
             writer.writerow(["Timestamp", "ActivityCount", "IntensityCategory"])
             writer.writerows(zip(self.epoch.timestamps, self.epoch.svm, self.model.epoch_intensity))
 
-        print("\n" + "Complete. File {} saved.".format(out_filename))
+        logger.info("Complete. File {} saved.".format(out_filename))
 
 
 class WristModel:
@@ -104,7 +116,7 @@ class WristModel:
            -accel_object: Data class object that contains accelerometer data (epoch)
            """
 
-        print("\n" + "Applying Powell et al. (2016) cut-points to the data...")
+        logger.info("Applying Powell et al. (2016) cut-points to the data...")
 
         # Conversion factor: epochs to minutes
         epoch_to_minutes = 60 / self.accel_object.epoch_len
@@ -163,20 +175,20 @@ class WristModel:
                                            "Vigorous": self.epoch_intensity.count(3) / epoch_to_minutes,
                                            "Vigorous%": round(self.epoch_intensity_valid.count(3) / n_valid_epochs, 3)}
 
-        print("Complete.")
+        logger.info("Complete.")
 
-        print("\n" + "WRIST MODEL SUMMARY")
-        print("Sedentary: {} minutes ({}%)".format(self.intensity_totals["Sedentary"],
-                                                   round(self.intensity_totals["Sedentary%"]*100, 3)))
+        logger.info("WRIST MODEL SUMMARY")
+        logger.info("Sedentary: {} minutes ({}%)".format(self.intensity_totals["Sedentary"],
+                                                         round(self.intensity_totals["Sedentary%"]*100, 3)))
 
-        print("Light: {} minutes ({}%)".format(self.intensity_totals["Light"],
-                                               round(self.intensity_totals["Light%"]*100, 3)))
+        logger.info("Light: {} minutes ({}%)".format(self.intensity_totals["Light"],
+                                                     round(self.intensity_totals["Light%"]*100, 3)))
 
-        print("Moderate: {} minutes ({}%)".format(self.intensity_totals["Moderate"],
-                                                  round(self.intensity_totals["Moderate%"]*100, 3)))
+        logger.info("Moderate: {} minutes ({}%)".format(self.intensity_totals["Moderate"],
+                                                        round(self.intensity_totals["Moderate%"]*100, 3)))
 
-        print("Vigorous: {} minutes ({}%)".format(self.intensity_totals["Vigorous"],
-                                                  round(self.intensity_totals["Vigorous%"]*100, 3)))
+        logger.info("Vigorous: {} minutes ({}%)".format(self.intensity_totals["Vigorous"],
+                                                        round(self.intensity_totals["Vigorous%"]*100, 3)))
 
 # ====================================================================================================================
 # ================================================ ANKLE ACCELEROMETER ===============================================
@@ -190,15 +202,15 @@ class Ankle:
                  start_offset=0, end_offset=0,
                  remove_baseline=False, ecg_object=None,
                  from_processed=True, treadmill_log_file=None,
-                 processed_folder=None, write_results=False):
+                 processed_folder=None, write_results=False, precision="float64", incremental=False):
 
-        print()
-        print("======================================== ANKLE ACCELEROMETER ========================================")
+        logger.info("ANKLE ACCELEROMETER")
 
         self.subjectID = subjectID
         self.filepath = filepath
         self.filename = self.filepath.split("/")[-1].split(".")[0]
         self.load_raw = load_raw
+        self.precision = precision
         self.accel_only = accel_only
         self.output_dir = output_dir
 
@@ -218,24 +230,25 @@ class Ankle:
         self.treadmill_complete = True
         self.write_results = write_results
 
-        # Loads raw accelerometer data and generates timestamps
+        # Loads raw accelerometer data and generates timestamps.
+        # Incremental runs only read new data records while epoching, so the whole file is not imported.
         self.raw = ImportEDF.GENEActiv(filepath=self.filepath,
                                        start_offset=self.start_offset, end_offset=self.end_offset,
-                                       load_raw=self.load_raw)
+                                       load_raw=self.load_raw and not incremental, precision=self.precision)
+
+        if incremental:
+            self.raw.read_header()
 
         self.epoch = EpochData.EpochAccel(raw_data=self.raw, epoch_len=self.epoch_len,
                                           remove_baseline=self.remove_baseline, accel_only=self.accel_only,
-                                          from_processed=self.from_processed, processed_folder=processed_folder)
+                                          from_processed=self.from_processed, processed_folder=processed_folder,
+                                          incremental=incremental,
+                                          checkpoint_dir=self.output_dir + "Model Output/" if incremental else None)
 
         if self.treadmill_log_file is None:
-            print("\n" + "Need treadmill protocol data to continue. Try again.")
+            logger.warning("Need treadmill protocol data to continue. Try again.")
 
-            plt.title("Set treadmill protocol walk indexes on datasheet")
-            plt.plot(np.arange(0, len(self.epoch.svm)), self.epoch.svm, color='black')
-            plt.ylabel("Counts")
-            plt.xlabel("Epoch Index")
-
-        # Create Treadmill object
+        # Create Treadmill object; walks are detected from the data if not set on the treadmill log
         self.treadmill = Treadmill(ankle_object=self)
 
         # Create AnkleModel object
@@ -254,9 +267,8 @@ class Ankle:
             indexes = np.arange(self.raw.sample_rate * (day - 1) * 86400, self.raw.sample_rate * day * 86400)
 
             ax1.plot(indexes[::downsample] / self.raw.sample_rate,
-                     self.raw.x[self.raw.sample_rate * (day - 1) * 86400:
-                                self.raw.sample_rate * day * 86400:
-                                downsample],
+                     self.raw.physical("x", self.raw.sample_rate * (day - 1) * 86400,
+                                       self.raw.sample_rate * day * 86400, downsample),
                      color='black', label="X-axis ({}Hz)".format(round(self.raw.sample_rate / downsample), 1))
 
             ax1.legend(loc='upper left')
@@ -341,7 +353,7 @@ class Ankle:
             writer.writerows(zip(self.model.epoch_timestamps, self.model.epoch_data,
                                  self.model.linear_speed, self.model.predicted_mets, self.model.epoch_intensity))
 
-        print("\n" + "Complete. File {}".format(out_filename))
+        logger.info("Complete. File {}".format(out_filename))
 
 
 class Treadmill:
@@ -359,12 +371,19 @@ class Treadmill:
         self.subjectID = ankle_object.subjectID
         self.log_file = ankle_object.treadmill_log_file
         self.epoch_data = ankle_object.epoch.svm
+        self.epoch_len = ankle_object.epoch_len
         self.epoch_timestamps = ankle_object.epoch.timestamps
         self.walk_indexes = []
+        self.auto_detected = False
 
         # Creates treadmill dictionary and walk speed data from spreadsheet data
         self.treadmill_dict, self.walk_speeds, self.walk_indexes = self.import_log()
 
+        # Walk indexes from the log are 15-second epochs; detected walk indexes are in current epochs
+        if len(self.walk_indexes) == 0 and self.treadmill_dict["StartIndex"] != "N/A":
+            self.walk_indexes = self.detect_walks()
+            self.auto_detected = len(self.walk_indexes) > 0
+
         self.avg_walk_counts = self.calculate_average_counts()
 
     def import_log(self):
@@ -372,8 +391,12 @@ class Treadmill:
            -Protocol start time, walking speeds in m/s, data index that corresponds to start of protocol"""
 
         # Reads in relevant treadmill protocol details
-        log = np.loadtxt(fname=self.log_file, delimiter=",", dtype="str",
-                         usecols=(0, 3, 6, 9, 11, 13, 15, 17, 22, 23, 24, 25, 26, 27, 28, 29, 30, 31), skiprows=1)
+        if self.log_file is not None:
+            log = np.loadtxt(fname=self.log_file, delimiter=",", dtype="str",
+                             usecols=(0, 3, 6, 9, 11, 13, 15, 17, 22, 23, 24, 25, 26, 27, 28, 29, 30, 31), skiprows=1,
+                             ndmin=2)
+        if self.log_file is None:
+            log = np.empty((0, 18), dtype="str")
 
         valid_data = False
 
@@ -384,9 +407,9 @@ class Treadmill:
                 date = row[1][0:4] + "/" + str(row[1][4:7]).title() + "/" + row[1][7:] + " " + row[2]
                 date_formatted = (datetime.strptime(date, "%Y/%b/%d %H:%M"))
 
-                for i, stamp in enumerate(self.epoch_timestamps):
-                    if stamp < date_formatted:
-                        epoch_start_index = i
+                # Index of last epoch that starts before the protocol
+                epoch_start_index = max(int(np.searchsorted(np.asarray(self.epoch_timestamps, dtype="datetime64[ns]"),
+                                                            np.datetime64(date_formatted, "ns"))) - 1, 0)
 
                 # Stores data and treadmill speeds (m/s) as dictionary
                 treadmill_dict = {"File": row[0], "ProtocolTime": date_formatted,
@@ -401,10 +424,10 @@ class Treadmill:
 
                 try:
                     walk_indexes = [int(row[i]) for i in range(8, len(row))]
-                    print("\n" + "Previous processed treadmill data found. Skipping processing.")
+                    logger.info("Previous processed treadmill data found. Skipping processing.")
                 except ValueError:
                     walk_indexes = []
-                    print("\n" + "No previous treadmill processing found. ")
+                    logger.info("No previous treadmill processing found. ")
                     pass
 
         # Sets treadmill_dict, walk_indexes and walk_speeds to empty objects if no treadmill data found in log
@@ -417,10 +440,79 @@ class Treadmill:
             walk_indexes = []
             walk_speeds = []
 
-            print("\n" + "No processed treadmill data found. Please try again.")
+            logger.warning("No processed treadmill data found. Please try again.")
 
         return treadmill_dict, walk_speeds, walk_indexes
 
+    def detect_walks(self, n_walks=5, search_len=4800, min_walk_len=120, smooth_len=45, edge_len=15,
+                     walk_threshold=0.2):
+        """Finds the treadmill walks in the epoched data after the protocol start (StartIndex). Walking epochs are
+           those above walk_threshold of the protocol's peak counts after a rolling median; the walks are the first
+           n_walks consecutive bouts of walking whose average counts increase with each walk.
+
+        :argument
+        -n_walks: number of walks in the protocol
+        -search_len: seconds of data after StartIndex that are searched
+        -min_walk_len: shortest walk in seconds; shorter bouts are ignored
+        -smooth_len: rolling median window in seconds; shorter than rests between walks. Removes single-epoch
+                     spikes without blurring walk edges.
+        -edge_len: seconds removed from the start and end of each walk (speed changes)
+        -walk_threshold: fraction of the 95th percentile of smoothed counts that marks walking
+
+        :returns
+        -walk_indexes: list of start and stop epoch index of each walk (current epoch length). Empty if
+                       n_walks walks were not found.
+        """
+
+        start_index = self.treadmill_dict["StartIndex"]
+
+        counts = np.asarray(self.epoch_data[start_index:start_index + int(search_len / self.epoch_len)], dtype=float)
+
+        if len(counts) == 0:
+            logger.warning("Could not detect treadmill walks: no data after protocol start.")
+            return []
+
+        # Rolling median (odd window, edges padded with edge values)
+        window = max(int(smooth_len / self.epoch_len), 1) // 2 * 2 + 1
+        padded = np.pad(counts, window // 2, mode="edge")
+        smoothed = np.median(np.lib.stride_tricks.sliding_window_view(padded, window), axis=1)
+
+        walking = smoothed > walk_threshold * np.percentile(smoothed, 95)
+
+        starts, lengths = RunLength.find_runs(walking, True)
+
+        long_enough = lengths >= min_walk_len / self.epoch_len
+        starts, stops = starts[long_enough], starts[long_enough] + lengths[long_enough]
+
+        if len(starts) < n_walks:
+            logger.warning("Could not detect treadmill walks: {} of {} walks found. "
+                           "Set walk indexes on treadmill log.".format(len(starts), n_walks))
+            return []
+
+        # Average counts of each bout from cumulative sums
+        cumulative = np.concatenate(([0], np.cumsum(counts)))
+        levels = (cumulative[stops] - cumulative[starts]) / (stops - starts)
+
+        # First set of n_walks consecutive bouts that get faster each walk
+        increasing = np.all(np.diff(np.lib.stride_tricks.sliding_window_view(levels, n_walks), axis=1) > 0, axis=1)
+
+        if not increasing.any():
+            logger.warning("Could not detect treadmill walks: no {} consecutive bouts of increasing counts. "
+                           "Set walk indexes on treadmill log.".format(n_walks))
+            return []
+
+        first_walk = int(np.argmax(increasing))
+        edge = int(np.ceil(edge_len / self.epoch_len))
+
+        walk_starts = starts[first_walk:first_walk + n_walks] + edge + start_index
+        walk_stops = stops[first_walk:first_walk + n_walks] - edge + start_index
+
+        walk_indexes = [int(index) for pair in zip(walk_starts, walk_stops) for index in pair]
+
+        logger.info("Treadmill walks detected: epoch indexes {}.".format(walk_indexes))
+
+        return walk_indexes
+
     def plot_treadmill_protocol(self, ankle_object):
         """Plots raw and epoched data during treadmill protocol on subplots or
            just epoched data if raw not available."""
@@ -456,7 +548,8 @@ class Treadmill:
             ax1.set_title("{}: Treadmill Protocol".format(ankle_object.filename))
 
             # Plots one hour of raw data (3600 seconds)
-            ax1.plot(index_list, ankle_object.raw.x[raw_start:raw_start + ankle_object.raw.sample_rate * 4800],
+            ax1.plot(index_list,
+                     ankle_object.raw.physical("x", raw_start, raw_start + ankle_object.raw.sample_rate * 4800),
                      color="black")
             ax1.set_ylabel("G's")
 
@@ -573,7 +666,11 @@ class AnkleModel:
             pass
 
     def scale_epoch_indexes(self):
-        """Scales treadmill walk indexes if epoch length is not 15 seconds. Returns new list."""
+        """Scales treadmill walk indexes if epoch length is not 15 seconds. Returns new list.
+           Detected walk indexes are already in the current epoch length."""
+
+        if self.tm_object.auto_detected:
+            return self.tm_object.walk_indexes
 
         if self.epoch_len != 15:
             self.epoch_scale = int(np.floor(15 / self.epoch_len))
@@ -615,15 +712,15 @@ class AnkleModel:
 
         # SUMMARY METRICS ---------------------------------------------------------------------------------------------
 
-        print("\n" + "Treadmill regression")
+        logger.info("Treadmill regression")
 
-        print("-Walk speeds (m/s):", self.tm_object.walk_speeds)
-        print("-Walk indexes: ", self.walk_indexes)
+        logger.info("-Walk speeds (m/s): {}".format(self.tm_object.walk_speeds))
+        logger.info("-Walk indexes: {}".format(self.walk_indexes))
 
-        print("\n" + "Linear regression:")
-        print("-Equation: y = {}x + {}".format(coefficient, y_intercept))
-        print("-Rounded equation: y = {}x + {}".format(round(coefficient, 5), round(y_intercept, 5)))
-        print("-r^2 = {}".format(round(lm.score(counts, speed), 5)))
+        logger.info("Linear regression:")
+        logger.info("-Equation: y = {}x + {}".format(coefficient, y_intercept))
+        logger.info("-Rounded equation: y = {}x + {}".format(round(coefficient, 5), round(y_intercept, 5)))
+        logger.info("-r^2 = {}".format(round(lm.score(counts, speed), 5)))
 
         # Calculates count and speed limits for different intensity levels
         light_speed = ((1.5 * self.rvo2 - self.rvo2) / 0.1) / 60  # m/s
@@ -670,7 +767,7 @@ class AnkleModel:
 
         speed = self.linear_dict["a"] * count + self.linear_dict["b"]
 
-        print("-Predicted speed for {} counts is {} m/s.".format(count, round(speed, 3)))
+        logger.info("-Predicted speed for {} counts is {} m/s.".format(count, round(speed, 3)))
 
     def calculate_quad_regression(self):
 
@@ -714,8 +811,8 @@ class AnkleModel:
         vig_counts = round((-x_term + (x_term ** 2 - 4 * x2_term * -vig_speed)**0.5) / (2 * x2_term), 1)
 
         if math.isnan(float(vig_counts)):
-            print("\n" + "QUADRATIC REGRESSION ERROR: parabola's vertex does not reach the speed that elicits "
-                         "vigorous intensity.")
+            logger.warning("QUADRATIC REGRESSION ERROR: parabola's vertex does not reach the speed that elicits "
+                           "vigorous intensity.")
             vig_counts = max(self.epoch_data)
 
         quad_reg_dict = {"a": x2_term, "b": x_term, "c": constant_term, "r2": r2,
@@ -723,20 +820,20 @@ class AnkleModel:
                          "Moderate speed": mod_speed, "Moderate counts": mod_counts,
                          "Vigorous speed": vig_speed, "Vigorous counts": vig_counts}
 
-        print("\n" + "Quadratic regression:")
-        print("-y ={}".format(equation))
-        print("-r^2 = {}".format(r2))
-        print("-Vertex at point ({} counts, {} m/s)".format(round(vertex, 0), round(vertex_speed, 2)))
+        logger.info("Quadratic regression:")
+        logger.info("-y ={}".format(equation))
+        logger.info("-r^2 = {}".format(r2))
+        logger.info("-Vertex at point ({} counts, {} m/s)".format(round(vertex, 0), round(vertex_speed, 2)))
 
         vertex_mets = round((vertex_speed * 60 * 0.1 + self.rvo2) / self.rvo2, 1)
         if vertex_mets < 1.5:
-            print("     -Vertex falls into sedentary activity ({} METs).".format(vertex_mets))
+            logger.info("     -Vertex falls into sedentary activity ({} METs).".format(vertex_mets))
         if 1.5 <= vertex_mets < 3.0:
-            print("     -Vertex falls into light activity ({} METs).".format(vertex_mets))
+            logger.info("     -Vertex falls into light activity ({} METs).".format(vertex_mets))
         if 3.0 <= vertex_mets < 6:
-            print("     -Vertex falls into moderate activity ({} METs).".format(vertex_mets))
+            logger.info("     -Vertex falls into moderate activity ({} METs).".format(vertex_mets))
         if vertex_mets >= 6:
-            print("     -Vertex falls into vigorous activity ({} METs).".format(vertex_mets))
+            logger.info("     -Vertex falls into vigorous activity ({} METs).".format(vertex_mets))
 
         return quad_reg_dict, quad_speed
 
@@ -859,18 +956,18 @@ class AnkleModel:
                             "Vigorous": intensity.count(3) / (60 / self.epoch_len),
                             "Vigorous%": round(intensity.count(3) / len(self.epoch_data), 3)}
 
-        print("\n" + "ANKLE MODEL SUMMARY")
-        print("Sedentary: {} minutes ({}%)".format(intensity_totals["Sedentary"],
-                                                   round(intensity_totals["Sedentary%"] * 100, 3)))
+        logger.info("ANKLE MODEL SUMMARY")
+        logger.info("Sedentary: {} minutes ({}%)".format(intensity_totals["Sedentary"],
+                                                         round(intensity_totals["Sedentary%"] * 100, 3)))
 
-        print("Light: {} minutes ({}%)".format(intensity_totals["Light"],
-                                               round(intensity_totals["Light%"] * 100, 3)))
+        logger.info("Light: {} minutes ({}%)".format(intensity_totals["Light"],
+                                                     round(intensity_totals["Light%"] * 100, 3)))
 
-        print("Moderate: {} minutes ({}%)".format(intensity_totals["Moderate"],
-                                                  round(intensity_totals["Moderate%"] * 100, 3)))
+        logger.info("Moderate: {} minutes ({}%)".format(intensity_totals["Moderate"],
+                                                        round(intensity_totals["Moderate%"] * 100, 3)))
 
-        print("Vigorous: {} minutes ({}%)".format(intensity_totals["Vigorous"],
-                                                  round(intensity_totals["Vigorous%"] * 100, 3)))
+        logger.info("Vigorous: {} minutes ({}%)".format(intensity_totals["Vigorous"],
+                                                        round(intensity_totals["Vigorous%"] * 100, 3)))
 
         return mets, intensity, intensity_totals
 
@@ -0,0 +1,647 @@
+import json
+import os
+import platform
+import sys
+from datetime import datetime
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+import pyedflib
+import GENEActivToActiGraph
+import Profiler
+import RPeaks
+import Subject
+import Logger
+
+
+logger = Logger.get_logger(__name__)
+
+
+# Runs the processing pipeline on synthetic GENEActiv and Bittium files so performance changes can be measured without
+# participant data. Files and logs are generated from a seed so runs are reproducible.
+
+
+# =============================================== SYNTHETIC DATA SETTINGS =============================================
+# Recording start time; day 0 of every synthetic subject
+START_TIME = datetime(2019, 11, 4, 9, 0, 0)
+
+# Activity level codes used in the per-second schedule
+SEDENTARY, LIGHT, MODERATE, VIGOROUS, SLEEP, NONWEAR, TREADMILL = 0, 1, 2, 3, 4, 5, 6
+
+# Gait acceleration amplitude (G), step frequency (Hz) and heart rate (bpm) for each level. Treadmill values are
+# set per walk from TREADMILL_SPEEDS.
+ACCEL_AMPLITUDE = {SEDENTARY: 0.01, LIGHT: 0.15, MODERATE: 0.45, VIGOROUS: 0.9, SLEEP: 0.005, NONWEAR: 0}
+STEP_FREQUENCY = {SEDENTARY: 0.5, LIGHT: 1.6, MODERATE: 1.9, VIGOROUS: 2.6, SLEEP: 0.2, NONWEAR: 0}
+HEART_RATE = {SEDENTARY: 72, LIGHT: 88, MODERATE: 112, VIGOROUS: 145, SLEEP: 58, NONWEAR: 72}
+
+# Acceleration amplitude multiplier for each placement
+PLACEMENT_SCALE = {"Wrist": 0.7, "Ankle": 1.5}
+
+# Treadmill protocol: five walks (m/s) starting PROTOCOL_DELAY hours into the recording
+TREADMILL_SPEEDS = (0.75, 1.0, 1.25, 1.5, 1.75)
+PROTOCOL_DELAY = 1
+WALK_LEN = 240  # seconds
+REST_LEN = 60  # seconds between walks
+
+# Gaussian PQRST waves: (centre from R peak in seconds, amplitude in µV, width in seconds)
+PQRST = ((-0.2, 120, 0.025), (-0.03, -100, 0.008), (0, 1100, 0.01), (0.03, -250, 0.008), (0.25, 300, 0.04))
+
+# Physical ranges of the written EDF channels
+ACCEL_RANGE = (-8, 8)  # G
+ECG_RANGE = (-8000, 8000)  # µV
+
+
+def activity_schedule(n_days, rng):
+    """Creates a per-second activity schedule: overnight sleep (23:00 - 07:00), random activity bouts, one non-wear
+       period per day, ECG noise bursts, and the treadmill protocol on the first day.
+
+    :argument
+    -n_days: recording length in days
+    -rng: numpy Generator
+
+    :returns
+    -schedule: dictionary of per-second arrays: "Level" (activity level code), "Amplitude" (G), "Step frequency" (Hz),
+               "HR" (bpm) and "ECG noise" (boolean)
+    -walk_indexes: start/stop index of each treadmill walk in 15-second epochs from the start of the recording
+    """
+
+    n_seconds = int(n_days * 86400)
+    start_sec = START_TIME.hour * 3600 + START_TIME.minute * 60 + START_TIME.second
+
+    level = np.full(n_seconds, SEDENTARY, dtype=np.int8)
+
+    # Seconds since midnight of each second of the recording
+    time_of_day = (np.arange(n_seconds) + start_sec) % 86400
+    asleep = (time_of_day >= 23 * 3600) | (time_of_day < 7 * 3600)
+
+    # Activity bouts: 2 - 30 minutes, mostly light
+    n_bouts = int(24 * n_days)
+    bout_starts = rng.integers(0, n_seconds, size=n_bouts)
+    bout_lens = rng.integers(120, 1800, size=n_bouts)
+    bout_levels = rng.choice([LIGHT, MODERATE, VIGOROUS], size=n_bouts, p=[0.65, 0.28, 0.07])
+
+    for bout_start, bout_len, bout_level in zip(bout_starts, bout_lens, bout_levels):
+        level[bout_start:bout_start + bout_len] = bout_level
+
+    level[asleep] = SLEEP
+
+    # One 60 - 120-minute non-wear period each afternoon/evening
+    for day in range(int(np.ceil(n_days))):
+        nonwear_start = day * 86400 + rng.integers(5 * 3600, 11 * 3600)
+        level[nonwear_start:nonwear_start + rng.integers(3600, 7200)] = NONWEAR
+
+    amplitude = np.zeros(n_seconds)
+    step_frequency = np.zeros(n_seconds)
+    heart_rate = np.zeros(n_seconds)
+
+    for code in ACCEL_AMPLITUDE.keys():
+        amplitude[level == code] = ACCEL_AMPLITUDE[code]
+        step_frequency[level == code] = STEP_FREQUENCY[code]
+        heart_rate[level == code] = HEART_RATE[code]
+
+    # Treadmill walks: amplitude, cadence and HR increase with speed
+    walk_indexes = []
+    protocol_start = PROTOCOL_DELAY * 3600
+
+    for walk, speed in enumerate(TREADMILL_SPEEDS):
+        walk_start = protocol_start + walk * (WALK_LEN + REST_LEN)
+
+        level[walk_start:walk_start + WALK_LEN] = TREADMILL
+        amplitude[walk_start:walk_start + WALK_LEN] = 0.4 * speed
+        step_frequency[walk_start:walk_start + WALK_LEN] = 1.3 + 0.4 * speed
+        heart_rate[walk_start:walk_start + WALK_LEN] = 80 + 30 * speed
+
+        level[walk_start + WALK_LEN:walk_start + WALK_LEN + REST_LEN] = SEDENTARY
+        amplitude[walk_start + WALK_LEN:walk_start + WALK_LEN + REST_LEN] = ACCEL_AMPLITUDE[SEDENTARY]
+        step_frequency[walk_start + WALK_LEN:walk_start + WALK_LEN + REST_LEN] = STEP_FREQUENCY[SEDENTARY]
+        heart_rate[walk_start + WALK_LEN:walk_start + WALK_LEN + REST_LEN] = HEART_RATE[SEDENTARY]
+
+        walk_indexes += [walk_start // 15, (walk_start + WALK_LEN) // 15]
+
+    # Heart rate responds over ~30 seconds; beat-to-beat variability added as a slow random walk
+    heart_rate = np.convolve(heart_rate, np.ones(30) / 30, mode="same")
+    heart_rate += np.convolve(rng.normal(0, 3, n_seconds), np.ones(60) / np.sqrt(60), mode="same")
+    heart_rate = np.clip(heart_rate, 45, 180)
+
+    # ECG motion artefact: six 2 - 10-minute bursts per day during waking hours
+    ecg_noise = np.zeros(n_seconds, dtype=bool)
+    awake_seconds = np.flatnonzero(~asleep)
+
+    for noise_start in rng.choice(awake_seconds, size=int(6 * n_days)):
+        ecg_noise[noise_start:noise_start + rng.integers(120, 600)] = True
+
+    schedule = {"Level": level, "Amplitude": amplitude, "Step frequency": step_frequency, "HR": heart_rate,
+                "ECG noise": ecg_noise}
+
+    return schedule, walk_indexes
+
+
+def accel_chunks(schedule, sample_rate, placement, rng, chunk_len=3600):
+    """Generator of triaxial accelerometer data in chunks.
+
+    :argument
+    -schedule: dictionary from activity_schedule()
+    -sample_rate: Hz
+    -placement: "Wrist" or "Ankle"; scales movement amplitude
+    -rng: numpy Generator
+    -chunk_len: seconds of data per chunk
+
+    :yields
+    -[x, y, z] for each chunk, in G
+    """
+
+    n_seconds = len(schedule["Level"])
+    scale = PLACEMENT_SCALE[placement]
+
+    for chunk_start in range(0, n_seconds, chunk_len):
+        index = np.arange(chunk_start * sample_rate, min(chunk_start + chunk_len, n_seconds) * sample_rate)
+        second = index // sample_rate
+        t = index / sample_rate
+
+        level = schedule["Level"][second]
+        phase = 2 * np.pi * schedule["Step frequency"][second] * t
+
+        # Gait: fundamental plus first harmonic
+        gait = scale * schedule["Amplitude"][second] * (np.sin(phase) + 0.3 * np.sin(2 * phase))
+
+        lying = (level == SLEEP) | (level == NONWEAR)
+        noise_sd = np.where(level == NONWEAR, 0.002, 0.01)
+
+        x = 0.35 * gait + rng.normal(0, 1, len(index)) * noise_sd
+        y = np.where(lying, 0, -1) + gait + rng.normal(0, 1, len(index)) * noise_sd
+        z = np.where(lying, 1, 0) + 0.2 * gait + rng.normal(0, 1, len(index)) * noise_sd
+
+        yield [np.clip(axis, ACCEL_RANGE[0], ACCEL_RANGE[1]) for axis in (x, y, z)]
+
+
+def ecg_chunks(schedule, sample_rate, rng, chunk_len=3600):
+    """Generator of single-lead ECG data in chunks. Beats follow the schedule's heart rate; non-wear periods contain
+       low-amplitude noise only and noise bursts contain motion artefact.
+
+    :argument
+    -schedule: dictionary from activity_schedule()
+    -sample_rate: Hz
+    -rng: numpy Generator
+    -chunk_len: seconds of data per chunk
+
+    :yields
+    -[voltage] for each chunk, in µV
+    """
+
+    n_seconds = len(schedule["Level"])
+
+    # Beat times: beat k occurs when the integral of HR reaches k beats
+    cumulative_beats = np.concatenate(([0], np.cumsum(schedule["HR"] / 60)))
+    beat_times = np.interp(np.arange(1, int(cumulative_beats[-1])), cumulative_beats, np.arange(n_seconds + 1))
+    beat_times += rng.normal(0, 0.01, len(beat_times))
+
+    beats = np.round(beat_times * sample_rate).astype(np.int64)
+    beats = beats[schedule["Level"][np.clip(beat_times.astype(int), 0, n_seconds - 1)] != NONWEAR]
+    beat_amplitude = rng.normal(1, 0.05, len(beats))
+
+    # QRS template
+    offsets = np.arange(int(-0.3 * sample_rate), int(0.45 * sample_rate))
+    template = np.zeros(len(offsets))
+
+    for centre, amplitude, width in PQRST:
+        template += amplitude * np.exp(-np.square(offsets / sample_rate - centre) / (2 * width ** 2))
+
+    for chunk_start in range(0, n_seconds, chunk_len):
+        chunk_end = min(chunk_start + chunk_len, n_seconds)
+        first, last = chunk_start * sample_rate, chunk_end * sample_rate
+
+        second = np.arange(first, last) // sample_rate
+        t = np.arange(first, last) / sample_rate
+
+        # Baseline wander, mains interference and white noise
+        voltage = 80 * np.sin(2 * np.pi * 0.3 * t) + 10 * np.sin(2 * np.pi * 60 * t) + rng.normal(0, 20, last - first)
+
+        chunk_beats = np.flatnonzero((beats >= first + offsets[0]) & (beats < last + offsets[-1]))
+
+        # Each template offset hits each beat once, so beats are added one offset at a time
+        for offset, value in zip(offsets, template):
+            index = beats[chunk_beats] + offset - first
+            in_chunk = (index >= 0) & (index < last - first)
+            voltage[index[in_chunk]] += value * beat_amplitude[chunk_beats][in_chunk]
+
+        noise = schedule["ECG noise"][second]
+        voltage[noise] += rng.normal(0, 400, np.sum(noise))
+
+        nonwear = schedule["Level"][second] == NONWEAR
+        voltage[nonwear] = rng.normal(0, 5, np.sum(nonwear))
+
+        yield [np.clip(voltage, ECG_RANGE[0], ECG_RANGE[1])]
+
+
+def write_edf(filepath, chunks, labels, sample_rate, physical_range, dimension):
+    """Writes chunks of data to an EDF+ file.
+
+    :argument
+    -filepath: pathway of file to write
+    -chunks: iterable of lists of channel data; see accel_chunks() and ecg_chunks()
+    -labels: channel labels
+    -sample_rate: Hz, all channels
+    -physical_range: (min, max) of all channels
+    -dimension: physical unit
+    """
+
+    headers = [{"label": label, "dimension": dimension, "sample_frequency": sample_rate,
+                "physical_min": physical_range[0], "physical_max": physical_range[1],
+                "digital_min": -32768, "digital_max": 32767, "transducer": "", "prefilter": ""} for label in labels]
+
+    edf_file = pyedflib.EdfWriter(filepath, len(labels), file_type=pyedflib.FILETYPE_EDFPLUS)
+
+    try:
+        edf_file.setSignalHeaders(headers)
+        edf_file.setStartdatetime(START_TIME)
+
+        for chunk in chunks:
+            edf_file.writeSamples(chunk)
+
+    finally:
+        edf_file.close()
+
+
+def edf_filepaths(edf_dir, subjectID):
+    """Returns {"Wrist", "Ankle", "ECG": pathway} of a synthetic subject, named as Subject.get_raw_filepaths()
+       expects."""
+
+    return {"Wrist": "{}OND07_WTL_{}_01_GA_LWrist_Accelerometer.EDF".format(edf_dir, subjectID),
+            "Ankle": "{}OND07_WTL_{}_01_GA_LAnkle_Accelerometer.EDF".format(edf_dir, subjectID),
+            "ECG": "{}OND07_WTL_{}_01_BF.EDF".format(edf_dir, subjectID)}
+
+
+def generate_subject(edf_dir, subjectID, n_days, accel_rate=75, ecg_rate=250, seed=0, regenerate=False):
+    """Creates synthetic wrist, ankle and ECG files for one subject. Files that already exist are kept unless
+       regenerate is True; the schedule is always recreated from the seed so logs match the files.
+
+    :argument
+    -edf_dir: folder where EDF files are written
+    -subjectID: subject ID used in filenames and logs
+    -n_days: recording length in days
+    -accel_rate, ecg_rate: sample rates, Hz
+    -seed: random seed. Each subject's data depends only on seed and subjectID.
+    -regenerate: whether existing files are overwritten
+
+    :returns
+    -subject: dictionary with "ID", "Days", "Filepaths", "Samples" ({device: data points per channel}),
+              "Walk indexes"
+    """
+
+    schedule_seed, wrist_seed, ankle_seed, ecg_seed = np.random.SeedSequence([seed, int(subjectID)]).spawn(4)
+
+    schedule, walk_indexes = activity_schedule(n_days=n_days, rng=np.random.default_rng(schedule_seed))
+
+    filepaths = edf_filepaths(edf_dir=edf_dir, subjectID=subjectID)
+
+    for placement, placement_seed in zip(("Wrist", "Ankle"), (wrist_seed, ankle_seed)):
+        if regenerate or not os.path.exists(filepaths[placement]):
+            logger.info("Generating {}...".format(filepaths[placement]))
+
+            write_edf(filepath=filepaths[placement],
+                      chunks=accel_chunks(schedule=schedule, sample_rate=accel_rate, placement=placement,
+                                          rng=np.random.default_rng(placement_seed)),
+                      labels=["Accelerometer x", "Accelerometer y", "Accelerometer z"],
+                      sample_rate=accel_rate, physical_range=ACCEL_RANGE, dimension="g")
+
+    if regenerate or not os.path.exists(filepaths["ECG"]):
+        logger.info("Generating {}...".format(filepaths["ECG"]))
+
+        write_edf(filepath=filepaths["ECG"],
+                  chunks=ecg_chunks(schedule=schedule, sample_rate=ecg_rate, rng=np.random.default_rng(ecg_seed)),
+                  labels=["ECG"], sample_rate=ecg_rate, physical_range=ECG_RANGE, dimension="uV")
+
+    n_seconds = len(schedule["Level"])
+
+    return {"ID": subjectID, "Days": n_days, "Filepaths": filepaths, "Walk indexes": walk_indexes,
+            "Samples": {"Wrist": n_seconds * accel_rate, "Ankle": n_seconds * accel_rate,
+                        "ECG": n_seconds * ecg_rate}}
+
+
+def write_logs(log_dir, subjects):
+    """Writes sleep, treadmill, crop index and demographics logs for synthetic subjects in the formats read by
+       SleepData, Accelerometer.Treadmill, ImportCropIndexes and ImportDemographics.
+
+    :argument
+    -log_dir: folder where logs are written
+    -subjects: list of dictionaries from generate_subject()
+
+    :returns
+    -logs: dictionary of {"Sleep", "Treadmill", "Crop", "Demographics": pathway}
+    """
+
+    logs = {"Sleep": log_dir + "Benchmark_SleepLogs.csv", "Treadmill": log_dir + "Benchmark_TreadmillLog.csv",
+            "Crop": log_dir + "Benchmark_CropIndexes.csv", "Demographics": log_dir + "Benchmark_Demographics.csv"}
+
+    sleep_rows, treadmill_rows, crop_rows, demos_rows = [], [], [], []
+
+    for subject in subjects:
+        file_id = "OND07_WTL_{}_01".format(subject["ID"])
+
+        # Columns read: SUBJECT, DATE, TIME_OUT_BED, NAP_START, NAP_END, TIME_IN_BED
+        for day in range(int(np.ceil(subject["Days"])) + 1):
+            date = START_TIME + timedelta(days=day)
+            sleep_rows.append([file_id, "", "", date.strftime("%Y%b%d"), "", "07:00", "", "", "", "23:00"])
+
+        # Columns read: file, date, time, speeds in columns 9 - 17 and walk indexes in columns 22 - 31
+        protocol_time = START_TIME + timedelta(hours=PROTOCOL_DELAY)
+        treadmill_row = [""] * 32
+        treadmill_row[0] = file_id
+        treadmill_row[3] = protocol_time.strftime("%Y") + protocol_time.strftime("%b").lower() + \
+            protocol_time.strftime("%d")
+        treadmill_row[6] = protocol_time.strftime("%H:%M")
+        treadmill_row[9:18:2] = [str(speed) for speed in TREADMILL_SPEEDS]
+        treadmill_row[22:32] = [str(index) for index in subject["Walk indexes"]]
+        treadmill_rows.append(treadmill_row)
+
+        # Files are already synchronized: zero offsets read the whole file
+        crop_rows.append([str(subject["ID"]), "0", "0", "0", "0", "0", "0"])
+
+        demos_rows.append([file_id, "", "", "", "40", "", "Female", "70", "170", "Right"])
+
+    for filepath, header, rows in zip((logs["Sleep"], logs["Treadmill"], logs["Crop"], logs["Demographics"]),
+                                      (["SUBJECT", "", "", "DATE", "", "TIME_OUT_BED", "", "NAP_START", "NAP_END",
+                                        "TIME_IN_BED"],
+                                       ["File"] + [""] * 31,
+                                       ["Subject", "AnkleStart", "AnkleEnd", "WristStart", "WristEnd",
+                                        "ECGStart", "ECGEnd"],
+                                       ["ID", "", "", "", "Age", "", "Sex", "Weight", "Height", "Hand"]),
+                                      (sleep_rows, treadmill_rows, crop_rows, demos_rows)):
+        with open(filepath, "w") as outfile:
+            outfile.write("\n".join([",".join(row) for row in [header] + rows]) + "\n")
+
+    return logs
+
+
+# ===================================================== BENCHMARKS ====================================================
+def stage_samples(stage_name, samples):
+    """Data points covered by a profiled stage: the device's data points (x 3 for accelerometers) for stages inside
+       ECG, Wrist or Ankle; all devices' data points otherwise."""
+
+    points = {"ECG": samples["ECG"], "Wrist": 3 * samples["Wrist"], "Ankle": 3 * samples["Ankle"]}
+
+    for device in points.keys():
+        if device in stage_name.split("/"):
+            return points[device]
+
+    return sum(points.values())
+
+
+def stage_results(profile, subject, samples_function=stage_samples):
+    """Adds scale, data points and throughput to each stage record of a profile."""
+
+    results = []
+
+    for record in profile.stages:
+        n_samples = samples_function(record["Stage"], subject["Samples"])
+
+        results.append(dict(record, Days=subject["Days"], Samples=int(n_samples),
+                            **{"Samples/s": round(n_samples / record["Wall time (s)"])
+                               if record["Wall time (s)"] > 0 else None}))
+
+    return results
+
+
+def run_subject(subject, logs, output_dir, subject_kwargs=None):
+    """Processes a synthetic subject from raw data and returns its stage results. See stage_results().
+
+    :argument
+    -subject: dictionary from generate_subject()
+    -logs: dictionary from write_logs()
+    -output_dir: folder used as Subject output_dir
+    -subject_kwargs: dictionary of Subject arguments that replace the defaults below (e.g. {"ecg_low_memory": True})
+    """
+
+    kwargs = dict(from_processed=False, raw_edf_folder=os.path.dirname(subject["Filepaths"]["ECG"]) + "/",
+                  subjectID=subject["ID"], load_wrist=True, load_ankle=True, load_ecg=True,
+                  load_raw_ecg=True, load_raw_ankle=True, load_raw_wrist=True, epoch_len=15,
+                  crop_index_file=logs["Crop"], treadmill_log_file=logs["Treadmill"],
+                  demographics_file=logs["Demographics"], sleeplog_file=logs["Sleep"],
+                  output_dir=output_dir, processed_folder=output_dir + "Model Output/", write_results=False)
+
+    kwargs.update({} if subject_kwargs is None else subject_kwargs)
+
+    x = Subject.Subject(**kwargs)
+
+    return stage_results(profile=x.profile, subject=subject)
+
+
+def run_conversion(subject):
+    """Converts a synthetic subject's wrist file to ActiGraph counts and returns its stage results."""
+
+    profile = Profiler.Profile(name="{} ActiGraph conversion".format(subject["ID"]))
+    Profiler.set_active(profile)
+
+    with profile.stage("ActiGraph conversion"):
+        raw_data = GENEActivToActiGraph.import_edf(filepath=subject["Filepaths"]["Wrist"])
+
+        with profile.stage("Conversion"):
+            GENEActivToActiGraph.ActigraphConversion(raw_data=raw_data, epoch_len=15, start_day=0,
+                                                     end_day=int(subject["Days"]))
+
+    return stage_results(profile=profile, subject=subject,
+                         samples_function=lambda stage_name, samples: 3 * samples["Wrist"])
+
+
+def environment():
+    """Returns software and hardware details recorded with benchmark results."""
+
+    import scipy
+
+    return {"Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "Platform": platform.platform(), "Processor": platform.processor(), "CPUs": os.cpu_count(),
+            "Python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+            "scipy": scipy.__version__, "pyedflib": getattr(pyedflib, "__version__", None)}
+
+
+def run_benchmark(work_dir, scales=(1, 3, 7), accel_rate=75, ecg_rate=250, seed=0, conversion=True,
+                  regenerate=False, output_file=None, subject_kwargs=None):
+    """Generates synthetic data at each scale and profiles the processing pipeline on it.
+
+    :argument
+    -work_dir: folder for synthetic files, logs and outputs (created if needed)
+    -scales: recording lengths in days. Subject IDs are 9000 + hours.
+    -accel_rate, ecg_rate: sample rates, Hz
+    -seed: random seed for synthetic data
+    -conversion: whether ActiGraph count conversion is also profiled (scales of at least one day)
+    -regenerate: whether existing synthetic files are overwritten
+    -output_file: .json file results are written to. Not written if None.
+    -subject_kwargs: dictionary of Subject arguments; see run_subject()
+
+    :returns
+    -benchmark: dictionary with "Environment", "Settings" and "Results" (list of stage records with "Days", "Stage",
+                "Depth", "Wall time (s)", "CPU time (s)", "Peak RSS (MB)", "RSS change (MB)", "Samples" and
+                "Samples/s")
+    """
+
+    edf_dir = os.path.join(work_dir, "EDF") + "/"
+    output_dir = os.path.join(work_dir, "Output") + "/"
+
+    for folder in (edf_dir, output_dir, output_dir + "Model Output/"):
+        os.makedirs(folder, exist_ok=True)
+
+    subjects = [generate_subject(edf_dir=edf_dir, subjectID=9000 + int(round(24 * n_days)), n_days=n_days,
+                                 accel_rate=accel_rate, ecg_rate=ecg_rate, seed=seed, regenerate=regenerate)
+                for n_days in scales]
+
+    logs = write_logs(log_dir=os.path.join(work_dir, ""), subjects=subjects)
+
+    results = []
+
+    for subject in subjects:
+        results += run_subject(subject=subject, logs=logs, output_dir=output_dir, subject_kwargs=subject_kwargs)
+
+        # Conversion processes whole days only
+        if conversion and subject["Days"] >= 1:
+            results += run_conversion(subject=subject)
+
+    benchmark = {"Environment": environment(),
+                 "Settings": {"Scales": list(scales), "Accel sample rate": accel_rate, "ECG sample rate": ecg_rate,
+                              "Seed": seed, "Subject arguments": subject_kwargs},
+                 "Results": results}
+
+    if output_file is not None:
+        with open(output_file, "w") as outfile:
+            json.dump(benchmark, outfile, indent=4, default=str)
+
+        logger.info("Complete. File {} saved.".format(output_file))
+
+    return benchmark
+
+
+def smoke_test(work_dir, scales=(0.25,)):
+    """Runs the benchmark on a few hours of synthetic data to check that every pipeline stage runs end to end.
+
+    :argument
+    -work_dir: folder for synthetic files, logs and outputs
+    -scales: recording lengths in days
+
+    :returns
+    -benchmark: dictionary from run_benchmark()
+
+    :raises
+    -RuntimeError if a stage has no results
+    """
+
+    benchmark = run_benchmark(work_dir=work_dir, scales=scales, regenerate=True)
+
+    stages = [result["Stage"] for result in benchmark["Results"]]
+
+    missing = [stage for stage in ("Subject/ECG", "Subject/Wrist", "Subject/Ankle", "Subject/Sleep",
+                                   "Subject/Validity", "Subject/Daily report") if stage not in stages]
+
+    if len(missing) > 0:
+        raise RuntimeError("Benchmark smoke test: no results for {}.".format(missing))
+
+    logger.info("Benchmark smoke test complete: {} stage results.".format(len(stages)))
+
+    return benchmark
+
+
+def hrv_test(sample_rate=250, epoch_len=15, n_epochs=40, rr=(800, 840), edge_peak=78):
+    """Checks beat-level HRV against a peak train with known RR intervals. Each epoch is treated as a separately
+       detected window with a spurious peak edge_peak samples after its start, as the detector produces.
+
+    :argument
+    -sample_rate: Hz
+    -epoch_len: epoch length in seconds
+    -n_epochs: number of epochs
+    -rr: RR intervals (ms) that alternate through the recording
+    -edge_peak: sample index of the spurious peak in each epoch
+
+    :returns
+    -hrv: pandas DataFrame from RPeaks.PeakStore.hrv()
+
+    :raises
+    -RuntimeError if an interval touching an edge peak or crossing an epoch boundary is used, or if the metrics
+     differ from the known values
+    """
+
+    epoch_samples = epoch_len * sample_rate
+
+    rr_samples = np.resize(np.asarray(rr) * sample_rate // 1000, epoch_samples * n_epochs)
+    beats = np.cumsum(rr_samples)
+    beats = beats[beats < epoch_samples * n_epochs]
+
+    epoch_peaks = []
+
+    for epoch in range(n_epochs):
+        start = epoch * epoch_samples
+        peaks = np.sort(np.append(beats[(beats >= start) & (beats < start + epoch_samples)] - start, edge_peak))
+
+        epoch_peaks.append(RPeaks.interior_peaks(peaks=peaks, n_samples=epoch_samples) + start)
+
+    peak_offsets = np.concatenate(([0], np.cumsum([len(peaks) for peaks in epoch_peaks])))
+
+    store = RPeaks.PeakStore(peaks=np.concatenate(epoch_peaks), peak_offsets=peak_offsets,
+                             sample_rate=sample_rate, epoch_len=epoch_len)
+
+    used = np.unique(store.rr[store.rr_valid])
+
+    if not np.isin(used, rr).all():
+        raise RuntimeError("HRV test: RR intervals other than {} used: {}.".format(rr, used))
+
+    hrv = store.hrv(window_starts=[0], window_ends=[epoch_samples * n_epochs])
+
+    expected = {"Mean RR (ms)": np.mean(rr), "RMSSD (ms)": abs(rr[1] - rr[0]), "pNN50 (%)": 0}
+
+    for column, value in expected.items():
+        if abs(hrv[column].iloc[0] - value) > 1:
+            raise RuntimeError("HRV test: {} is {} (expected {}).".format(column, hrv[column].iloc[0], value))
+
+    logger.info("HRV test complete: {} of {} RR intervals used.".format(store.rr_valid.sum(), len(store.rr)))
+
+    return hrv
+
+
+def compare_results(old_file, new_file, tolerance=0.1):
+    """Compares two benchmark result files stage by stage.
+
+    :argument
+    -old_file, new_file: .json files written by run_benchmark()
+    -tolerance: fractional increase in wall time or peak RSS that counts as a regression
+
+    :returns
+    -comparison: pandas DataFrame with old/new wall time and peak RSS, their changes (%) and "Regression" for each
+                 stage and scale found in both files
+    """
+
+    def load(filepath):
+        with open(filepath, "r") as infile:
+            return pd.DataFrame(json.load(infile)["Results"])[["Days", "Stage", "Wall time (s)", "Peak RSS (MB)"]]
+
+    comparison = load(old_file).merge(load(new_file), on=["Days", "Stage"], suffixes=(" old", " new"))
+
+    for column in ("Wall time (s)", "Peak RSS (MB)"):
+        comparison[column.split(" (")[0] + " change (%)"] = \
+            (100 * (comparison[column + " new"] / comparison[column + " old"] - 1)).round(1)
+
+    comparison["Regression"] = (comparison["Wall time change (%)"] > 100 * tolerance) | \
+                               (comparison["Peak RSS change (%)"] > 100 * tolerance)
+
+    logger.info("Benchmark comparison: {} stages, {} regressions".format(len(comparison),
+                                                                         comparison["Regression"].sum()))
+
+    for index, row in comparison.loc[comparison["Regression"]].iterrows():
+        logger.warning("-{} ({} days): wall time {}%, peak RSS {}%".format(row["Stage"], row["Days"],
+                                                                       row["Wall time change (%)"],
+                                                                       row["Peak RSS change (%)"]))
+
+    return comparison
+
+
+if __name__ == "__main__":
+
+    # python Benchmark.py smoke <work_dir>: quick end-to-end check on a few hours of data
+    if len(sys.argv) > 2 and sys.argv[1] == "smoke":
+        smoke_test(work_dir=sys.argv[2])
+        sys.exit()
+
+    # python Benchmark.py hrv: HRV metrics from a peak train with known RR intervals
+    if len(sys.argv) > 1 and sys.argv[1] == "hrv":
+        hrv_test()
+        sys.exit()
+
+    run_benchmark(work_dir="/Users/kyleweber/Desktop/Benchmark/", scales=(1, 3, 7),
+                  output_file="/Users/kyleweber/Desktop/Benchmark/Benchmark_{}.json".format(
+                      datetime.now().strftime("%Y%m%d_%H%M")))
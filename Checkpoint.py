@@ -0,0 +1,62 @@
+import json
+import os
+import Logger
+
+
+logger = Logger.get_logger(__name__)
+
+
+def manifest_path(checkpoint_dir, filename):
+    """Returns pathway of the checkpoint manifest for a raw data filename (without extension)."""
+
+    return checkpoint_dir + filename + "_Checkpoint.json"
+
+
+def read_manifest(checkpoint_dir, filename, settings):
+    """Reads the checkpoint manifest of an incrementally-processed file.
+
+    :argument
+    -checkpoint_dir: folder containing manifests
+    -filename: raw data filename without extension
+    -settings: dictionary of processing settings (e.g. epoch length, start offset, filter details). The checkpoint is
+               only used if they match the settings it was written with.
+
+    :returns
+    -manifest: dictionary with "Settings", "Samples" (data points processed from start offset) and "Epochs"
+               (number of epochs that do not need to be re-processed). None if no usable checkpoint exists.
+    """
+
+    filepath = manifest_path(checkpoint_dir=checkpoint_dir, filename=filename)
+
+    if not os.path.exists(filepath):
+        logger.info("No checkpoint found for {}. Processing entire file.".format(filename))
+        return None
+
+    with open(filepath, "r") as infile:
+        manifest = json.load(infile)
+
+    # Settings are compared after a JSON round trip so tuples/lists compare equal
+    if manifest["Settings"] != json.loads(json.dumps(settings, default=str)):
+        logger.warning("Checkpoint for {} used different settings. Processing entire file.".format(filename))
+        return None
+
+    logger.info("Checkpoint found for {}: resuming from epoch {}.".format(filename, manifest["Epochs"]))
+
+    return manifest
+
+
+def write_manifest(checkpoint_dir, filename, settings, n_samples, n_epochs):
+    """Writes checkpoint manifest after processing.
+
+    :argument
+    -checkpoint_dir: folder containing manifests
+    -filename: raw data filename without extension
+    -settings: dictionary of processing settings; see read_manifest()
+    -n_samples: number of data points (from start offset) covered by n_epochs
+    -n_epochs: number of leading epochs whose results will not change when more data is added to the file
+    """
+
+    manifest = {"Settings": settings, "Samples": int(n_samples), "Epochs": int(n_epochs)}
+
+    with open(manifest_path(checkpoint_dir=checkpoint_dir, filename=filename), "w") as outfile:
+        json.dump(manifest, outfile, indent=4, default=str)
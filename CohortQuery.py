@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+import EpochTable
+
+
+# Intensity codes in the epoch table
+INTENSITIES = {"Sedentary": 0, "Light": 1, "Moderate": 2, "Vigorous": 3}
+
+MODELS = ("Wrist", "Ankle", "HR", "HR-Acc")
+
+
+def load_cohort(dataset_dir, columns=None, subjects=None, valid_only=False):
+    """Reads the cohort epoch dataset written by EpochTable.write_epoch_table(). Only requested columns are read and
+       subject/validity filters are applied while reading, so unneeded row groups and partitions are skipped.
+
+    :argument
+    -dataset_dir: cohort dataset folder
+    -columns: list of epoch table columns to read. All columns if None. "ID" and "Timestamp" are always read.
+    -subjects: list of subject IDs to read. All subjects if None.
+    -valid_only: whether only epochs that passed all validity criteria are read
+
+    :returns
+    -data: pandas DataFrame with requested columns and "Date"
+    """
+
+    if columns is not None:
+        columns = ["ID", "Timestamp"] + [column for column in columns if column not in ("ID", "Timestamp")]
+
+    filters = []
+
+    if subjects is not None:
+        filters.append(("ID", "in", [int(subject) for subject in subjects]))
+    if valid_only:
+        filters.append(("Valid", "==", True))
+
+    data = EpochTable.read_epoch_table(dataset_dir, columns=columns, filters=filters if len(filters) > 0 else None)
+
+    data["ID"] = data["ID"].astype(str)
+    data["Date"] = data["Timestamp"].dt.floor("D")
+
+    return data
+
+
+def subject_summary(data, epoch_len=15):
+    """Summarizes each subject's data.
+
+    :argument
+    -data: pandas DataFrame from load_cohort() with "ECG validity", "Valid" and "Sleep status" columns if available
+    -epoch_len: epoch length in seconds
+
+    :returns
+    -summary: pandas DataFrame indexed by ID with "Days", "Hours", "ECG valid (%)", "Valid (%)" and "Sleep (%)"
+    """
+
+    grouped = data.groupby("ID")
+
+    summary = pd.DataFrame({"Days": grouped["Date"].nunique(),
+                            "Hours": (grouped.size() * epoch_len / 3600).round(2)})
+
+    # Nullable columns: percent of non-null epochs
+    for column, name, value in (("ECG validity", "ECG valid (%)", 0), ("Valid", "Valid (%)", True)):
+        if column in data.columns:
+            summary[name] = (100 * (data[column] == value).groupby(data["ID"]).sum() /
+                             data[column].notna().groupby(data["ID"]).sum()).astype(float).round(1)
+
+    if "Sleep status" in data.columns:
+        summary["Sleep (%)"] = (100 * (data["Sleep status"] > 0).groupby(data["ID"]).mean()).astype(float).round(1)
+
+    return summary
+
+
+def daily_minutes(data, models=MODELS, intensities=("Moderate", "Vigorous"), epoch_len=15):
+    """Minutes per day in the given intensities for each model.
+
+    :argument
+    -data: pandas DataFrame from load_cohort() with "<model> intensity" columns
+    -models: models in MODELS
+    -intensities: intensity names in INTENSITIES that are counted together (default: MVPA)
+    -epoch_len: epoch length in seconds
+
+    :returns
+    -minutes: pandas DataFrame indexed by (ID, Date) with one "<model> minutes" column per model. Days without any
+              data for a model are NaN.
+    """
+
+    codes = [INTENSITIES[intensity] for intensity in intensities]
+
+    counted = pd.DataFrame({"ID": data["ID"], "Date": data["Date"]})
+
+    for model in models:
+        intensity = data[model + " intensity"]
+
+        # Null epochs are NaN so days without data stay NaN after summing
+        counted[model + " minutes"] = np.where(intensity.isna(), np.nan,
+                                               intensity.isin(codes).astype(float) * epoch_len / 60)
+
+    return counted.groupby(["ID", "Date"]).sum(min_count=1)
+
+
+def mvpa_by_day(dataset_dir, min_ecg_valid=None, min_valid=None, models=MODELS, valid_only=True, epoch_len=15,
+                intensities=("Moderate", "Vigorous")):
+    """Minutes of activity per model per day for subjects that meet data quality criteria, e.g.
+       mvpa_by_day(dataset_dir, min_ecg_valid=80) for MVPA in subjects with more than 80% valid ECG.
+
+    :argument
+    -dataset_dir: cohort dataset folder
+    -min_ecg_valid: minimum percent of valid ECG epochs. Not used if None.
+    -min_valid: minimum percent of epochs that passed all validity criteria. Not used if None.
+    -models: models in MODELS
+    -valid_only: whether only epochs that passed all validity criteria are counted
+    -epoch_len: epoch length in seconds
+    -intensities: intensity names in INTENSITIES that are counted together
+
+    :returns
+    -minutes: pandas DataFrame from daily_minutes()
+    -summary: pandas DataFrame from subject_summary() of the included subjects
+    """
+
+    # Quality criteria need every epoch; only the small validity columns are read
+    quality = load_cohort(dataset_dir, columns=["ECG validity", "Valid"])
+    summary = subject_summary(quality, epoch_len=epoch_len)
+
+    included = np.ones(len(summary), dtype=bool)
+
+    if min_ecg_valid is not None:
+        included &= summary["ECG valid (%)"].fillna(0).values > min_ecg_valid
+    if min_valid is not None:
+        included &= summary["Valid (%)"].fillna(0).values > min_valid
+
+    summary = summary.loc[included]
+
+    if len(summary) == 0:
+        return pd.DataFrame(columns=[model + " minutes" for model in models]), summary
+
+    data = load_cohort(dataset_dir, columns=[model + " intensity" for model in models],
+                       subjects=list(summary.index), valid_only=valid_only)
+
+    return daily_minutes(data, models=models, intensities=intensities, epoch_len=epoch_len), summary
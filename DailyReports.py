@@ -4,6 +4,10 @@ import numpy as np
 import matplotlib.dates as mdates
 import csv
 import statistics
+import Logger
+
+
+logger = Logger.get_logger(__name__)
 
 
 class DailyReport:
@@ -77,16 +81,15 @@ class DailyReport:
 
     def create_index_list(self):
 
+        # Timestamps may be datetime objects or datetime64 values
+        timestamps = np.asarray(self.timestamps, dtype="datetime64[ns]")
+
         # Creates a list of dates from start of first day to last day of collection
-        day_list = pd.date_range(start=self.timestamps[0].date(), end=self.timestamps[-1].date(),
-                                 periods=(self.timestamps[-1].date()-self.timestamps[0].date()).days+1)
+        day_list = np.arange(timestamps[0].astype("datetime64[D]"), timestamps[-1].astype("datetime64[D]") + 1)
 
-        # Gets indexes that correspond to start of days
-        for day in day_list:
-            for i, stamp in enumerate(self.timestamps):
-                if stamp > day:
-                    self.day_indexes.append(i)
-                    break
+        # Gets indexes that correspond to start of days: first epoch after midnight
+        day_indexes = np.searchsorted(timestamps, day_list.astype("datetime64[ns]"), side="right")
+        self.day_indexes = [int(i) for i in day_indexes if i < len(timestamps)]
 
         # Adds index of last datapoint to list
         self.day_indexes.append(len(self.timestamps)-1)
@@ -100,13 +103,16 @@ class DailyReport:
 
         self.sleep_timestamps = sleep_timestamps
 
-        # Gets indexes that correspond to each sleep event
+        timestamps = np.asarray(self.timestamps, dtype="datetime64[ns]")
+
+        # Gets indexes that correspond to each sleep event: first epoch after waking up.
+        # Events before the first epoch or after the last epoch are covered by the indexes added below.
         for i in self.sleep_timestamps:
             if i != "N/A":
-                for j, stamp in enumerate(self.timestamps):
-                    if stamp > i:
-                        self.sleep_indexes.append(j)
-                        break
+                j = int(np.searchsorted(timestamps, np.datetime64(i, "ns"), side="right"))
+
+                if 0 < j < len(timestamps):
+                    self.sleep_indexes.append(j)
 
         self.sleep_indexes.insert(0, 0)
         self.sleep_indexes.append(len(self.timestamps) - 1)
@@ -183,7 +189,7 @@ class DailyReport:
                           "Period Lengths":period_length_list}
 
         activity_report_dataframe = pd.DataFrame(dataframe_dict,index=day_num_list)
-        print(activity_report_dataframe)
+        logger.info(activity_report_dataframe)
 
 
 
@@ -1,291 +1,176 @@
 import pyedflib
 from datetime import timedelta
+import numpy as np
+import ImportEDF
+import Logger
 
 
-def crop_start(subject_object):
-    """Function that checks device starttimes and calculates the number of data points to skip at the start of the file
-       so all devices begin at the same time (within 1 second; EDF resolution).
-
-    -Checks which files exist and which starts first --> calculates values accordingly.
-
-    :argument
-    -subject_object: object of Subject class
-
-    :returns
-    -start_crop_dict: dictionary of values for each device that correspond to number of data points to skip.
-    """
-
-    # Skips device synchronization if only one device is loaded
-    if subject_object.load_ecg + subject_object.load_ankle + subject_object.load_wrist < 2:
-        start_crop_dict = {"Ankle": 0, "Wrist": 0, "ECG": 0}
-
-        return start_crop_dict
+logger = Logger.get_logger(__name__)
 
-    # Booleans for whether data exists or not
-    ankle_exists = subject_object.ankle_filepath is not None
-    wrist_exists = subject_object.wrist_filepath is not None
-    ecg_exists = subject_object.ecg_filepath is not None
 
-    # Loads EDF file headers to retrieve sample rates and start times
-    if ankle_exists:
-        ankle_file = pyedflib.EdfReader(subject_object.ankle_filepath)
-        ankle_samplerate = ankle_file.getSampleFrequencies()[1]
-        ankle_start = ankle_file.getStartdatetime()
-        ankle_duration = ankle_file.getFileDuration()
-    if not ankle_exists:
-        ankle_samplerate = 1
+# Channel used to read sample rate and sample count from each device's EDF header
+# GENEActiv files store x, y, z as separate channels with a shared sample rate; Bittium ECG is channel 0
+DEVICE_CHANNELS = {"Ankle": 1, "Wrist": 1, "ECG": 0}
 
-    if wrist_exists:
-        wrist_file = pyedflib.EdfReader(subject_object.wrist_filepath)
-        wrist_samplerate = wrist_file.getSampleFrequencies()[1]
-        wrist_start = wrist_file.getStartdatetime()
-        wrist_duration = wrist_file.getFileDuration()
 
-    if not wrist_exists:
-        wrist_samplerate = 1
+def read_header(filepath, channel=0):
+    """Reads the EDF header of one device. Only the header is read; no signal data is loaded.
 
-    if ecg_exists:
-        ecg_file = pyedflib.EdfReader(subject_object.ecg_filepath)
-        ecg_samplerate = ecg_file.getSampleFrequencies()[0]
-        ecg_start = ecg_file.getStartdatetime()
-        ecg_duration = ecg_file.getFileDuration()
-    if not ecg_exists:
-        ecg_samplerate = 1
-
-    # Values by which data is offset (indexes): default values
-    ankle_start_offset = 0
-    wrist_start_offset = 0
-    ecg_start_offset = 0
-
-    # Checks which device started last
+    :argument
+    -filepath: full pathway to EDF file
+    -channel: channel index used for sample rate and number of samples
 
-    # IF ALL DEVICES ARE USED ========================================================================================
-    if ankle_exists and wrist_exists and ecg_exists:
+    :returns
+    -header: dictionary of filepath, start time, sample rate and number of samples in channel
+    """
 
-        # If already synced at start
-        if ankle_start == wrist_start == ecg_start:
-            ankle_start_offset, wrist_start_offset, ecg_start_offset = 0, 0, 0
+    file = pyedflib.EdfReader(filepath)
 
-        # Wrist first
-        if ankle_start <= wrist_start and ecg_start <= wrist_start:
+    # Includes the EDF+ subsecond start time when the file has one
+    header = {"Filepath": filepath,
+              "Start": ImportEDF.start_datetime(file),
+              "SampleRate": file.getSampleFrequencies()[channel],
+              "Samples": int(file.getNSamples()[channel])}
 
-            ecg_start_offset = ((wrist_start - ecg_start).days * 86400 +
-                                (wrist_start - ecg_start).seconds) * ecg_samplerate
+    file.close()
 
-            ankle_start_offset = ((wrist_start - ankle_start).days * 86400 +
-                                  (wrist_start - ankle_start).seconds) * ankle_samplerate
+    return header
 
-        # Ankle first
-        if wrist_start <= ankle_start and ecg_start <= ankle_start:
 
-            ecg_start_offset = ((ankle_start - ecg_start).days * 86400 +
-                                (ankle_start - ecg_start).seconds) * ecg_samplerate
+def synchronize(headers, start_offsets=None, align_start=True):
+    """Synchronization engine for any number of devices. Calculates the window where all devices have data and the
+       number of data points to skip/read for each device so all devices cover that window.
 
-            wrist_start_offset = ((ankle_start - wrist_start).days * 86400 +
-                                  (ankle_start - wrist_start).seconds) * wrist_samplerate
+       Offsets are calculated from timedelta.total_seconds() so sub-second differences in start times are kept.
 
-        # ECG first
-        if wrist_start <= ecg_start and ankle_start <= ecg_start:
+    :argument
+    -headers: dictionary of {device name: header dictionary from read_header()}
+    -start_offsets: dictionary of existing start offsets (data points) for any device. Missing devices use 0.
+    -align_start: if True, start offsets are recalculated so all devices start at the same time.
+                  If False, start_offsets are kept and only the number of data points to read is calculated.
 
-            wrist_start_offset = ((ecg_start - wrist_start).days * 86400 +
-                                  (ecg_start - wrist_start).seconds) * wrist_samplerate
+    :returns
+    -sync_dict: dictionary with common start/end time, overlap duration in seconds,
+                "Start offsets" (data points to skip) and "Samples" (data points to read) for each device
 
-            ankle_start_offset = ((ecg_start - ankle_start).days * 86400 +
-                                  (ecg_start - ankle_start).seconds) * ankle_samplerate
+    :raises
+    -ValueError if the devices do not overlap in time
+    """
 
-    # IF ONLY WRIST AND ANKLE ARE USED ===============================================================================
-    if ankle_exists and wrist_exists and not ecg_exists:
+    if start_offsets is None:
+        start_offsets = {}
 
-        # If ankle started first
-        if ankle_start < wrist_start:
+    # Start and end time of each device after any existing start offset
+    device_starts = {}
+    device_ends = {}
 
-            ankle_start_offset = ((wrist_start - ankle_start).days * 86400 +
-                                  (wrist_start - ankle_start).seconds) * ankle_samplerate
+    for device, header in headers.items():
+        device_starts[device] = header["Start"] + timedelta(seconds=start_offsets.get(device, 0) /
+                                                                    header["SampleRate"])
+        device_ends[device] = header["Start"] + timedelta(seconds=header["Samples"] / header["SampleRate"])
 
-        # If wrist started first
-        if wrist_start < ankle_start:
+    common_start = max(device_starts.values())
+    common_end = min(device_ends.values())
 
-            wrist_start_offset = ((ankle_start - wrist_start).days * 86400 +
-                                  (ankle_start - wrist_start).seconds) * wrist_samplerate
+    # Samples of 0 would mean "read to end of file" in ImportEDF/ECG, so files would be imported unsynchronized
+    if common_end <= common_start:
+        raise ValueError("Devices do not overlap in time. Data cannot be synchronized: {}".format(
+            ", ".join(["{} {} to {}".format(device, device_starts[device], device_ends[device])
+                       for device in headers])))
 
-    # IF ONLY ECG AND ANKLE ARE USED =================================================================================
-    if ankle_exists and ecg_exists and not wrist_exists:
+    sync_dict = {"Start": common_start, "End": common_end,
+                 "Duration": (common_end - common_start).total_seconds(),
+                 "Start offsets": {}, "Samples": {}}
 
-        # If ankle started first
-        if ankle_start < ecg_start:
+    for device, header in headers.items():
+        sample_rate = header["SampleRate"]
 
-            ankle_start_offset = ((ecg_start - ankle_start).days * 86400 +
-                                  (ecg_start - ankle_start).seconds) * ankle_samplerate
+        start_offset = start_offsets.get(device, 0)
 
-        # If ECG started first
-        if ecg_start < ankle_start:
+        # Rounds to the nearest data point of the device that started earlier
+        if align_start:
+            start_offset += int(round((common_start - device_starts[device]).total_seconds() * sample_rate))
 
-            ecg_start_offset = ((ankle_start - ecg_start).days * 86400 +
-                                (ankle_start - ecg_start).seconds) * ecg_samplerate
+        device_start = header["Start"] + timedelta(seconds=start_offset / sample_rate)
 
-    # IF ONLY ECG AND WRIST ARE USED =================================================================================
-    if wrist_exists and ecg_exists and not ankle_exists:
+        sync_dict["Start offsets"][device] = start_offset
+        sync_dict["Samples"][device] = max(int(np.floor((common_end - device_start).total_seconds() * sample_rate)),
+                                           0)
 
-        # If wrist started first
-        if wrist_start < ecg_start:
+    return sync_dict
 
-            wrist_start_offset = ((ecg_start - wrist_start).days * 86400 +
-                                  (ecg_start - wrist_start).seconds) * wrist_samplerate
 
-        # If ECG started first
-        if ecg_start < wrist_start:
+def subject_headers(subject_object):
+    """Reads EDF headers for each device loaded for a Subject. Returns dictionary of {device name: header}."""
 
-            ecg_start_offset = ((wrist_start - ecg_start).days * 86400 +
-                                (wrist_start - ecg_start).seconds) * ecg_samplerate
+    filepaths = {"Ankle": subject_object.ankle_filepath,
+                 "Wrist": subject_object.wrist_filepath,
+                 "ECG": subject_object.ecg_filepath}
 
-    start_crop_dict = {"Ankle": ankle_start_offset,
-                       "Wrist": wrist_start_offset,
-                       "ECG": ecg_start_offset}
+    return {device: read_header(filepath, channel=DEVICE_CHANNELS[device])
+            for device, filepath in filepaths.items() if filepath is not None}
 
-    return start_crop_dict
 
+def sync_subject(subject_object, start_offsets=None, align_start=True):
+    """Synchronizes all devices loaded for a Subject in one pass.
 
-def crop_end(subject_object):
-    """Function that determines how many data points to read in so that all files are the same duration.
+    :argument
+    -subject_object: object of Subject class
+    -start_offsets/align_start: see synchronize()
 
     :returns
+    -start_crop_dict: dictionary of values for each device that correspond to number of data points to skip
     -end_crop_dict: dictionary of values for each device of how many data points to read in
-                    so the files are the same duration
-
-    :argument
-    -subject_object: object of class Subject. Needs to contain start_offset_dict from crop_start function.
     """
 
+    start_crop_dict = {"Ankle": 0, "Wrist": 0, "ECG": 0}
+    end_crop_dict = {"Ankle": 0, "Wrist": 0, "ECG": 0}
+
     # Skips device synchronization if only one device is loaded
     if subject_object.load_ecg + subject_object.load_ankle + subject_object.load_wrist < 2:
-        end_crop_dict = {"Ankle": 0, "Wrist": 0, "ECG": 0}
-
-        return end_crop_dict
-
-    # Booleans for whether data exists or not
-    ankle_exists = subject_object.ankle_filepath is not None
-    wrist_exists = subject_object.wrist_filepath is not None
-    ecg_exists = subject_object.ecg_filepath is not None
-
-    # Start time offset dictionary
-    start_offset_dict = subject_object.start_offset_dict
+        return start_crop_dict, end_crop_dict
 
-    # Loads EDF file headers to retrieve sample rates and start times
-    if ankle_exists:
-        ankle_file = pyedflib.EdfReader(subject_object.ankle_filepath)
-        ankle_samplerate = ankle_file.getSampleFrequencies()[1]
-        ankle_start = ankle_file.getStartdatetime() + timedelta(seconds=start_offset_dict["Ankle"] / ankle_samplerate)
-        ankle_duration = ankle_file.getFileDuration()
-        ankle_end = ankle_start + timedelta(seconds=ankle_duration)
-    if not ankle_exists:
-        ankle_samplerate = 1
-        ankle_duration = 0
-        ankle_start = None
-        ankle_end = None
+    headers = subject_headers(subject_object)
 
-    if wrist_exists:
-        wrist_file = pyedflib.EdfReader(subject_object.wrist_filepath)
-        wrist_samplerate = wrist_file.getSampleFrequencies()[1]
-        wrist_start = wrist_file.getStartdatetime() + timedelta(seconds=start_offset_dict["Wrist"] / wrist_samplerate)
-        wrist_duration = wrist_file.getFileDuration()
-        wrist_end = wrist_start + timedelta(seconds=wrist_duration)
+    if len(headers) < 2:
+        return start_crop_dict, end_crop_dict
 
-    if not wrist_exists:
-        wrist_samplerate = 1
-        wrist_duration = 0
-        wrist_start = None
-        wrist_end = None
+    sync_dict = synchronize(headers=headers, start_offsets=start_offsets, align_start=align_start)
 
-    if ecg_exists:
-        ecg_file = pyedflib.EdfReader(subject_object.ecg_filepath)
-        ecg_samplerate = ecg_file.getSampleFrequencies()[0]
-        ecg_start = ecg_file.getStartdatetime() + timedelta(seconds=start_offset_dict["ECG"] / ecg_samplerate)
-        ecg_duration = ecg_file.getFileDuration()
-        ecg_end = ecg_start + timedelta(seconds=ecg_duration)
-    if not ecg_exists:
-        ecg_samplerate = 1
-        ecg_duration = 0
+    start_crop_dict.update(sync_dict["Start offsets"])
+    end_crop_dict.update(sync_dict["Samples"])
 
-    # Values by which data is cropped at the end (indexes): default values
-    ankle_end_offset = 0
-    wrist_end_offset = 0
-    ecg_end_offset = 0
+    return start_crop_dict, end_crop_dict
 
-    # IF ALL DEVICES ARE USED ========================================================================================
-    if ankle_exists and wrist_exists and ecg_exists:
 
-        # Wrist ends first
-        if ankle_end >= wrist_end and ecg_end >= wrist_end:
-            ankle_end_offset = ((ankle_end - wrist_end).days * 86400 +
-                                (ankle_end - wrist_end).seconds) * ankle_samplerate
-
-            ecg_end_offset = ((ecg_end - wrist_end).days * 86400 + (ecg_end - wrist_end).seconds) * ecg_samplerate
-
-        # Ankle ends first
-        if wrist_end >= ankle_end and ecg_end >= ankle_end:
-
-            ecg_end_offset = ((ecg_end - ankle_end).days * 86400 + (ecg_end - ankle_end).seconds) * ecg_samplerate
-
-            wrist_end_offset = ((wrist_end - ankle_end).days * 86400 +
-                                (wrist_end - ankle_end).seconds) * wrist_samplerate
-
-        # ECG ends first
-        if wrist_end >= ecg_end and ankle_end >= ecg_end:
-
-            wrist_end_offset = ((wrist_end - ecg_end).days * 86400 + (wrist_end - ecg_end).seconds) * wrist_samplerate
-
-            ankle_end_offset = ((ankle_end - ecg_end).days * 86400 + (ankle_end - ecg_end).seconds) * ankle_samplerate
-
-    # IF ANKLE AND WRIST USED =========================================================================================
-
-    if ankle_exists and wrist_exists and not ecg_exists:
-
-        # Wrist ends first
-        if ankle_end >= wrist_end:
-
-            ankle_end_offset = ((ankle_end - wrist_end).days * 86400 +
-                                (ankle_end - wrist_end).seconds) * ankle_samplerate
-
-        # Ankle ends first
-        if wrist_end >= ankle_end:
-
-            wrist_end_offset = ((wrist_end - ankle_end).days * 86400 +
-                                (wrist_end - ankle_end).seconds) * wrist_samplerate
-
-    # IF ANKLE AND ECG USED ===========================================================================================
-
-    if ankle_exists and ecg_exists and not wrist_exists:
-
-        # ECG ends first
-        if ankle_end >= ecg_end:
-
-            ankle_end_offset = ((ankle_end - ecg_end).days * 86400 + (ankle_end - ecg_end).seconds) * ankle_samplerate
-
-        # Ankle ends first
-        if ecg_end >= ankle_end:
+def crop_start(subject_object):
+    """Function that checks device starttimes and calculates the number of data points to skip at the start of the file
+       so all devices begin at the same time.
 
-            ecg_end_offset = ((ecg_end - ankle_end).days * 86400 + (ecg_end - ankle_end).seconds) * ecg_samplerate
+    :argument
+    -subject_object: object of Subject class
 
-    # IF WRIST AND ECG USED ===========================================================================================
+    :returns
+    -start_crop_dict: dictionary of values for each device that correspond to number of data points to skip.
+    """
 
-    if wrist_exists and ecg_exists and not ankle_exists:
+    start_crop_dict, end_crop_dict = sync_subject(subject_object)
 
-        # ECG ends first
-        if wrist_end >= ecg_end:
+    return start_crop_dict
 
-            wrist_end_offset = ((wrist_end - ecg_end).days * 86400 + (wrist_end - ecg_end).seconds) * wrist_samplerate
 
-        # Wrist ends first
-        if ecg_end >= wrist_end:
+def crop_end(subject_object):
+    """Function that determines how many data points to read in so that all files are the same duration.
 
-            ecg_end_offset = ((ecg_end - wrist_end).days * 86400 + (ecg_end - wrist_end).seconds) * ecg_samplerate
+    :returns
+    -end_crop_dict: dictionary of values for each device of how many data points to read in
+                    so the files are the same duration
 
-    # FINAL VALUES ===================================================================================================
+    :argument
+    -subject_object: object of class Subject. Needs to contain start_offset_dict from crop_start function.
+    """
 
-    # Values correspond to number of data points to read in
-    # Number of all data points (duration in seconds * sample rate - offset from end)
-    end_crop_dict = {"Ankle": ankle_duration * ankle_samplerate - ankle_end_offset,
-                     "Wrist": wrist_duration * wrist_samplerate - wrist_end_offset,
-                     "ECG": ecg_duration * ecg_samplerate - ecg_end_offset}
+    start_crop_dict, end_crop_dict = sync_subject(subject_object, start_offsets=subject_object.start_offset_dict,
+                                                  align_start=False)
 
     return end_crop_dict
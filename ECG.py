@@ -1,4 +1,11 @@
 import ImportEDF
+import Filtering
+import RunLength
+import RPeaks
+import Checkpoint
+import Profiler
+import Logger
+import Timestamps
 
 from ecgdetectors import Detectors
 # https://github.com/luishowell/ecg-detectors
@@ -8,11 +15,20 @@ import numpy as np
 import statistics
 import scipy.stats as stats
 from datetime import datetime
+from datetime import timedelta
 import csv
-import progressbar
 from matplotlib.ticker import PercentFormatter
 from random import randint
 import time
+import os
+
+
+logger = Logger.get_logger(__name__)
+
+
+# Per-epoch quality check rule values cached by ECG.write_feature_cache(). Rule values are NaN if too few beats found.
+FEATURE_DTYPE = np.dtype([("HR", "f8"), ("Max RR Interval", "f8"), ("RR Ratio", "f8"), ("Voltage Range", "f8"),
+                          ("Correlation", "f8"), ("N Peaks", "i4"), ("Enough Beats", "?")])
 
 
 # --------------------------------------------------------------------------------------------------------------------
@@ -26,13 +42,21 @@ class ECG:
                  rest_hr_window=60, n_epochs_rest=10,
                  epoch_len=15,
                  filter=False, low_f=1, high_f=30, f_type="bandpass",
-                 load_raw=False, from_processed=True, write_results=True):
+                 load_raw=False, from_processed=True, write_results=True, precision="float64",
+                 low_memory=False, block_len=3600, incremental=False):
         """Class that contains raw and processed ECG data.
 
         :argument
         DATA IMPORT
         -filepath: full pathway to EDF file
         -load_raw: boolean of whether to load raw ECG data. Can be used in addition to from_processed = True
+        -precision: storage precision of raw data; "float64", "float32" or "int16". See ImportEDF.PRECISIONS.
+        -low_memory: if True with load_raw, full-length raw and filtered data are not kept. Quality check reads and
+                     filters one block at a time; raw data is only kept as per-epoch voltage ranges.
+        -block_len: block length in seconds used by the quality check when low_memory is True
+        -incremental: if True, quality check results of epochs processed by a previous incremental run are read from
+                      the checkpoint and only new data is processed. Uses the block-wise (low_memory) quality check.
+                      Committed epochs do not depend on end_offset, so synced (end-cropped) files can be resumed.
         -from_processed: boolean of whether to read in already processed data
                          (epoch timestamps, epoch HR, quality control check)
         -output_dir: where files are written to OR where processed data files are read in from
@@ -55,8 +79,7 @@ class ECG:
         -age: participant age in years. Needed for HRmax calculation.
         """
 
-        print()
-        print("============================================= ECG DATA ==============================================")
+        logger.info("ECG DATA")
 
         self.filepath = filepath
         self.filename = self.filepath.split("/")[-1].split(".")[0]
@@ -77,15 +100,50 @@ class ECG:
         self.load_raw = load_raw
         self.from_processed = from_processed
         self.write_results = write_results
+        self.precision = precision
+        self.low_memory = low_memory
+        self.block_len = block_len
+        self.incremental = incremental
+
+        # Incremental processing resumes from the last complete block of the block-wise quality check
+        if self.incremental:
+            self.load_raw = True
+            self.low_memory = True
+
+        # Number of leading epochs whose results will not change if data is appended to the file
+        self.committed_epochs = 0
+
+        # Voltage range (uV) of each epoch's raw data. Calculated by the quality check.
+        self.epoch_volt_range = None
+
+        # Per-epoch rule values (FEATURE_DTYPE) and R-peaks away from epoch edges (sample index in cropped data).
+        # Peaks in epoch i are peaks[peak_offsets[i]:peak_offsets[i+1]]. See write_feature_cache()/reapply_rules().
+        self.qc_features = None
+        self.peaks = None
+        self.peak_offsets = None
+
+        # Digital-to-physical scaling of raw data
+        self.raw_gain = 1
+        self.raw_offset = 0
+
+        # Raw data: only header details and epoch timestamps; data is read in blocks by check_quality()
+        if self.load_raw and self.low_memory:
+            self.raw = None
+            self.filtered = None
+            self.timestamps = None
+            self.sample_rate, self.n_samples, self.epoch_timestamps = self.read_header()
 
         # Raw data
-        if self.load_raw:
+        if self.load_raw and not self.low_memory:
             self.ecg = ImportEDF.Bittium(filepath=self.filepath,
                                          start_offset=self.start_offset, end_offset=self.end_offset,
-                                         filter=self.filter, low_f=self.low_f, high_f=self.high_f, f_type=self.f_type)
+                                         filter=self.filter, low_f=self.low_f, high_f=self.high_f, f_type=self.f_type,
+                                         precision=self.precision)
 
             self.sample_rate = self.ecg.sample_rate
             self.raw = self.ecg.raw
+            self.raw_gain = self.ecg.raw_gain
+            self.raw_offset = self.ecg.raw_offset
             self.filtered = self.ecg.filtered
             self.timestamps = self.ecg.timestamps
             self.epoch_timestamps = self.ecg.epoch_timestamps
@@ -96,6 +154,15 @@ class ECG:
         if not self.from_processed:
             self.epoch_validity, self.epoch_hr = self.check_quality()
 
+            if self.write_results or self.incremental:
+                self.write_feature_cache()
+
+            if self.incremental:
+                Checkpoint.write_manifest(checkpoint_dir=self.output_dir + "Model Output/", filename=self.filename,
+                                          settings=self.checkpoint_settings(),
+                                          n_samples=self.committed_epochs * self.epoch_len * self.sample_rate,
+                                          n_epochs=self.committed_epochs)
+
         # Loads epoched data from existing file
         if self.from_processed:
             self.epoch_timestamps, self.epoch_validity, self.epoch_hr = self.load_processed()
@@ -119,6 +186,7 @@ class ECG:
         if self.write_results:
             self.write_output()
 
+    @Profiler.timed("Quality check")
     def check_quality(self):
         """Performs quality check using Orphanidou et al. (2015) algorithm that has been tweaked to factor in voltage
            range as well.
@@ -126,76 +194,306 @@ class ECG:
            This function runs a loop that creates object from the class CheckQuality for each epoch in the raw data.
         """
 
-        print("\n" + "Running quality check with Orphanidou et al. (2015) algorithm...")
+        logger.info("Running quality check with Orphanidou et al. (2015) algorithm...")
 
         t0 = datetime.now()
 
         validity_list = []
         epoch_hr = []
+        self.epoch_volt_range = []
+        self.qc_features = []
+        self.peaks = []
+
+        if self.low_memory:
+            first_epoch = 0
+
+            # Results of epochs processed by a previous run are read from the checkpoint
+            if self.incremental:
+                validity_list, epoch_hr, first_epoch = self.resume_checkpoint()
 
-        bar = progressbar.ProgressBar(maxval=len(self.raw),
-                                      widgets=[progressbar.Bar('>', '', '|'), ' ',
-                                               progressbar.Percentage()])
-        bar.start()
+            new_validity, new_hr = self.check_quality_blocks(first_epoch=first_epoch)
 
-        for start_index in range(0, int(len(self.raw)), self.epoch_len*self.sample_rate):
-            bar.update(start_index + 1)
+            validity_list += new_validity
+            epoch_hr += new_hr
 
-            qc = CheckQuality(ecg_object=self, start_index=start_index, epoch_len=self.epoch_len)
+        if not self.low_memory:
+            progress = Logger.Progress(stage="Quality check", total=len(self.raw))
 
-            if qc.valid_period:
-                validity_list.append(0)
-                epoch_hr.append(round(qc.hr, 2))
-            if not qc.valid_period:
-                validity_list.append(1)
-                epoch_hr.append(0)
+            for start_index in range(0, int(len(self.raw)), self.epoch_len*self.sample_rate):
+                progress.update(self.epoch_len*self.sample_rate)
 
-        bar.finish()
+                qc = CheckQuality(ecg_object=self, start_index=start_index, epoch_len=self.epoch_len)
+
+                if qc.valid_period:
+                    validity_list.append(0)
+                    epoch_hr.append(round(qc.hr, 2))
+                if not qc.valid_period:
+                    validity_list.append(1)
+                    epoch_hr.append(0)
+
+                self.epoch_volt_range.append(qc.epoch_volt_range())
+                self.qc_features.append(qc.features())
+                self.peaks.append(qc.interior_peaks() + start_index)
+
+            progress.finish()
+
+        # Typed arrays; int32 peak indexes cover 99 days at 250 Hz
+        n_samples = len(validity_list) * self.epoch_len * self.sample_rate
+
+        self.qc_features = np.array(self.qc_features, dtype=FEATURE_DTYPE)
+        self.peak_offsets = np.concatenate(([0], np.cumsum([len(peaks) for peaks in self.peaks]))).astype(np.int64)
+        peak_dtype = np.int32 if n_samples < 2**31 else np.int64
+        self.peaks = np.concatenate(self.peaks).astype(peak_dtype) if self.peaks else np.array([], dtype=peak_dtype)
 
         t1 = datetime.now()
-        proc_time = (t1 - t0).seconds
-        print("\n" + "Quality check complete ({} seconds).".format(round(proc_time, 2)))
+        proc_time = (t1 - t0).total_seconds()
+        logger.info("Quality check complete ({} seconds).".format(round(proc_time, 2)))
+
+        return validity_list, epoch_hr
+
+    def read_header(self):
+        """Reads sample rate and number of data points from the EDF header and creates epoch timestamps without
+           loading data. Used when low_memory is True.
+
+        :returns
+        -sample_rate: Hz
+        -n_samples: number of data points after cropping with start_offset/end_offset
+        -epoch_timestamps: timestamp for start of each epoch (numpy datetime64 array)
+        """
+
+        edf_file = ImportEDF.open_mapped(self.filepath)
+
+        sample_rate = int(edf_file.sample_rates[0])
+
+        n_samples = edf_file.n_samples(0) - self.start_offset
+        if self.end_offset != 0:
+            n_samples = min(self.end_offset, n_samples)
+
+        epoch_samples = self.epoch_len * sample_rate
+        n_epochs = int(np.ceil(n_samples / epoch_samples))
+
+        starttime = edf_file.starttime + timedelta(seconds=self.start_offset / sample_rate)
+        epoch_timestamps = np.datetime64(starttime, "ns") + np.arange(n_epochs) * np.timedelta64(self.epoch_len, "s")
+
+        return sample_rate, n_samples, epoch_timestamps
+
+    def check_quality_blocks(self, first_epoch=0):
+        """Runs the quality check one block at a time. Each block is read from the memory-mapped EDF file and filtered
+           with neighbouring data as padding, so peak memory is a small multiple of one block.
+
+           Blocks are aligned to the start of the data so a run that starts at a block boundary processes exactly the
+           same data as a run from the start. Epochs are committed (see committed_epochs) once their block is full
+           and its filter padding is available in the file.
+
+        :argument
+        -first_epoch: first epoch to process; must be at a block boundary
+
+        :returns
+        -validity_list: binary list (0=valid; 1=invalid) for each epoch
+        -epoch_hr: average HR in each valid epoch (0 if invalid)
+        """
+
+        validity_list = []
+        epoch_hr = []
+
+        epoch_samples = self.epoch_len * self.sample_rate
+
+        # Blocks contain a whole number of epochs
+        block_samples = max(int(self.block_len / self.epoch_len), 1) * epoch_samples
+        pad = 10
+
+        file_samples = ImportEDF.open_mapped(self.filepath).n_samples(0)
+        self.committed_epochs = first_epoch
+
+        progress = Logger.Progress(stage="Quality check", total=self.n_samples - first_epoch * epoch_samples)
+
+        for block_start in range(first_epoch * epoch_samples, self.n_samples, block_samples):
+            block_n = min(block_samples, self.n_samples - block_start)
+
+            block = ECGWindow(filepath=self.filepath, start_index=self.start_offset + block_start,
+                              epoch_len=block_n / self.sample_rate, n=block_n,
+                              low_f=self.low_f, high_f=self.high_f, f_type=self.f_type, pad=pad)
+
+            for start_index in range(0, block_n, epoch_samples):
+                qc = CheckQuality(ecg_object=block, start_index=start_index, epoch_len=self.epoch_len)
+
+                if qc.valid_period:
+                    validity_list.append(0)
+                    epoch_hr.append(round(qc.hr, 2))
+                if not qc.valid_period:
+                    validity_list.append(1)
+                    epoch_hr.append(0)
+
+                self.epoch_volt_range.append(qc.epoch_volt_range())
+                self.qc_features.append(qc.features())
+                self.peaks.append(qc.interior_peaks() + block_start + start_index)
+
+            if block_n == block_samples and \
+                    self.start_offset + block_start + block_n + pad * self.sample_rate <= file_samples:
+                self.committed_epochs = (block_start + block_n) // epoch_samples
+
+            progress.update(block_n)
+
+        progress.finish()
 
         return validity_list, epoch_hr
 
     def generate_quality_report(self):
         """Calculates how much of the data was usable. Returns values in dictionary."""
 
-        invalid_epochs = self.epoch_validity.count(1)  # number of invalid epochs
+        invalid_epochs = int(np.sum(np.asarray(self.epoch_validity) == 1))  # number of invalid epochs
         hours_lost = round(invalid_epochs / (60 / self.epoch_len) / 60, 2)  # hours of invalid data
         perc_invalid = round(invalid_epochs / len(self.epoch_validity) * 100, 1)  # percent of invalid data
 
-        # Longest valid period
-        longest_valid = count = 0
-        current = ''
-        for epoch in self.epoch_validity:
-            if epoch == current and epoch == 0:
-                count += 1
-            else:
-                count = 1
-                current = epoch
-            longest_valid = max(count, longest_valid)
-
-        # Longest invalid
-        longest_invalid = count = 0
-        current = ''
-        for epoch in self.epoch_validity:
-            if epoch == current and epoch == 1:
-                count += 1
-            else:
-                count = 1
-                current = epoch
-            longest_invalid = max(count, longest_invalid)
+        # Valid (0) and invalid (1) runs from one run-length encoding pass
+        valid_runs = RunLength.run_summary(data=self.epoch_validity, value=0, epoch_len=self.epoch_len)
+        invalid_runs = RunLength.run_summary(data=self.epoch_validity, value=1, epoch_len=self.epoch_len)
 
         quality_report = {"Invalid epochs": invalid_epochs, "Hours lost": hours_lost,
                           "Percent invalid": perc_invalid,
-                          "Longest valid period": longest_valid, "Longest invalid period": longest_invalid,
-                          "Average valid duration (minutes)": None}
-
-        print("{}% of the data is valid.".format(round(100 - perc_invalid), 3))
+                          "Longest valid period": valid_runs["Longest (epochs)"],
+                          "Longest invalid period": invalid_runs["Longest (epochs)"],
+                          "Average valid duration (minutes)": valid_runs["Mean (minutes)"],
+                          "Longest valid duration (minutes)": valid_runs["Longest (minutes)"],
+                          "Median valid duration (minutes)": valid_runs["Median (minutes)"],
+                          "Average invalid duration (minutes)": invalid_runs["Mean (minutes)"],
+                          "Longest invalid duration (minutes)": invalid_runs["Longest (minutes)"],
+                          "Median invalid duration (minutes)": invalid_runs["Median (minutes)"],
+                          "Gap histogram": RunLength.gap_histogram(data=self.epoch_validity, value=1,
+                                                                   epoch_len=self.epoch_len)}
+
+        logger.info("{}% of the data is valid.".format(round(100 - perc_invalid), 3))
+        logger.info("-Valid periods: longest = {} minutes, average = {} minutes, median = {} minutes".format(
+                    valid_runs["Longest (minutes)"], valid_runs["Mean (minutes)"], valid_runs["Median (minutes)"]))
+        logger.info("-Invalid periods: longest = {} minutes, average = {} minutes, median = {} minutes".format(
+                    invalid_runs["Longest (minutes)"], invalid_runs["Mean (minutes)"],
+                    invalid_runs["Median (minutes)"]))
 
         return quality_report
 
+    def write_feature_cache(self):
+        """Writes per-epoch rule values from the quality check to a binary .npz file so rules can be re-applied with
+           different thresholds without re-running peak detection. R-peaks are written to the R-peak store
+           (see RPeaks.write_peaks())."""
+
+        cache_file = self.output_dir + "Model Output/" + self.filename + "_QCFeatures.npz"
+
+        np.savez(cache_file, features=self.qc_features, validity=self.epoch_validity, hr=self.epoch_hr,
+                 epoch_volt_range=self.epoch_volt_range,
+                 sample_rate=self.sample_rate, epoch_len=self.epoch_len, start_offset=self.start_offset)
+
+        logger.info("Complete. File {} saved.".format(cache_file))
+
+        RPeaks.write_peaks(file_prefix=self.output_dir + "Model Output/" + self.filename,
+                           peaks=self.peaks, peak_offsets=self.peak_offsets)
+
+    def load_feature_cache(self):
+        """Loads per-epoch rule values and memory-maps R-peak indexes written by write_feature_cache().
+
+        :returns
+        -boolean of whether the cache file was found
+        """
+
+        cache_file = self.output_dir + "Model Output/" + self.filename + "_QCFeatures.npz"
+
+        if not os.path.exists(cache_file):
+            logger.info("No quality check feature cache found for {}.".format(self.filename))
+            return False
+
+        cache = np.load(cache_file)
+
+        self.qc_features = cache["features"]
+        self.sample_rate = int(cache["sample_rate"])
+
+        self.peaks, self.peak_offsets = RPeaks.load_peaks(file_prefix=self.output_dir + "Model Output/" +
+                                                          self.filename)
+
+        logger.info("Loaded quality check features for {} epochs.".format(len(self.qc_features)))
+
+        return True
+
+    def checkpoint_settings(self):
+        """Processing settings that need to match for a checkpoint to be resumed."""
+
+        return {"Start time": str(ImportEDF.open_mapped(self.filepath).starttime), "Sample rate": self.sample_rate,
+                "Start offset": self.start_offset, "Epoch len": self.epoch_len, "Block len": self.block_len,
+                "Filter": [self.low_f, self.high_f, self.f_type]}
+
+    def resume_checkpoint(self):
+        """Reads quality check results of the committed epochs of a previous incremental run.
+
+        :returns
+        -validity_list: binary list (0=valid; 1=invalid) for each committed epoch
+        -epoch_hr: average HR in each committed epoch (0 if invalid)
+        -first_epoch: first epoch that needs to be processed
+        """
+
+        manifest = Checkpoint.read_manifest(checkpoint_dir=self.output_dir + "Model Output/", filename=self.filename,
+                                            settings=self.checkpoint_settings())
+
+        cache_file = self.output_dir + "Model Output/" + self.filename + "_QCFeatures.npz"
+
+        if manifest is None or manifest["Epochs"] == 0 or not os.path.exists(cache_file):
+            return [], [], 0
+
+        # Committed epochs are whole blocks; only blocks that are within the data after end_offset cropping are used
+        block_epochs = max(int(self.block_len / self.epoch_len), 1)
+        n_epochs = min(manifest["Epochs"],
+                       self.n_samples // (block_epochs * self.epoch_len * self.sample_rate) * block_epochs)
+
+        cache = np.load(cache_file)
+        peaks, peak_offsets = RPeaks.load_peaks(file_prefix=self.output_dir + "Model Output/" + self.filename,
+                                                mmap=False)
+
+        self.epoch_volt_range = cache["epoch_volt_range"][:n_epochs].tolist()
+        self.qc_features = cache["features"][:n_epochs].tolist()
+        self.peaks = np.split(peaks[:peak_offsets[n_epochs]], peak_offsets[1:n_epochs])
+
+        return cache["validity"][:n_epochs].tolist(), cache["hr"][:n_epochs].tolist(), n_epochs
+
+    def reapply_rules(self, hr_min=40, hr_max=180, max_rr=3, rr_ratio=2.5, voltage_thresh=250, correlation=0.66):
+        """Re-applies the Orphanidou rules to cached features with new thresholds (see apply_rules()).
+           Updates epoch_validity, epoch_hr, valid_hr and quality_report. Intensity needs to be re-calculated.
+        """
+
+        if self.qc_features is None and not self.load_feature_cache():
+            return None
+
+        valid = apply_rules(features=self.qc_features, hr_min=hr_min, hr_max=hr_max, max_rr=max_rr,
+                            rr_ratio=rr_ratio, voltage_thresh=voltage_thresh, correlation=correlation)
+
+        self.epoch_validity = [int(i) for i in np.where(valid, 0, 1)]
+        self.epoch_hr = [float(i) for i in np.where(valid, np.round(self.qc_features["HR"], 2), 0)]
+        self.valid_hr = [hr if validity == 0 else None for hr, validity in zip(self.epoch_hr, self.epoch_validity)]
+
+        self.quality_report = self.generate_quality_report()
+
+    def calculate_hrv(self, window_len=300, window_step=None):
+        """Calculates time-domain HRV metrics (SDNN, RMSSD, pNN50) over regular windows from stored R-peaks.
+           RR intervals with either beat in an invalid epoch or that span two epochs are excluded.
+
+        :argument
+        -window_len: window length in seconds
+        -window_step: seconds between window starts. Windows do not overlap if None.
+
+        :returns
+        -hrv: pandas DataFrame; see RPeaks.PeakStore.hrv(). Includes the timestamp at the start of each window.
+        """
+
+        if self.peaks is None and not self.load_feature_cache():
+            return None
+
+        store = RPeaks.PeakStore(peaks=self.peaks, peak_offsets=self.peak_offsets, sample_rate=self.sample_rate,
+                                 epoch_len=self.epoch_len, epoch_validity=self.epoch_validity)
+
+        hrv = store.hrv_windows(window_len=window_len, window_step=window_step)
+
+        start_time = np.datetime64(self.epoch_timestamps[0], "ns")
+        hrv.insert(0, "Timestamp", start_time + (hrv["Start index"].values * 10**9 //
+                                                 self.sample_rate).astype("timedelta64[ns]"))
+
+        return hrv
+
     def load_processed(self):
         """Method to load previously-processed epoched timestamp, HR and validity data.
 
@@ -205,26 +503,21 @@ class ECG:
         -epoch_hr: average HR in epoch
         """
 
-        print("\n" + "Loading existing data for {}...".format(self.filepath))
+        logger.info("Loading existing data for {}...".format(self.filepath))
 
         epoch_timestamps, epoch_validity, epoch_hr = np.loadtxt(fname=self.output_dir + "Model Output/" +
                                                                       self.filename + "_IntensityData.csv",
                                                                 delimiter=",", skiprows=1, usecols=(0, 1, 2),
                                                                 unpack=True, dtype="str")
 
-        epoch_timestamps_formatted = []
-        for epoch in epoch_timestamps:
-            try:
-                epoch_timestamps_formatted.append(datetime.strptime(epoch[:-3], "%Y-%m-%dT%H:%M:%S.%f"))
-            except ValueError:
-                epoch_timestamps_formatted.append(datetime.strptime(epoch.split(".")[0], "%Y-%m-%d %H:%M:%S"))
+        epoch_timestamps = Timestamps.parse_timestamps(epoch_timestamps)
 
-        epoch_validity = [int(i) for i in epoch_validity]
-        epoch_hr = [round(float(i), 2) for i in epoch_hr]
+        epoch_validity = epoch_validity.astype(int).tolist()
+        epoch_hr = np.round(epoch_hr.astype(float), 2).tolist()
 
-        print("Complete.")
+        logger.info("Complete.")
 
-        return epoch_timestamps_formatted, epoch_validity, epoch_hr
+        return epoch_timestamps, epoch_validity, epoch_hr
 
     def find_resting_hr(self, window_size=60, n_windows=10, sleep_status=None, start_index=None, end_index=None):
         """Function that calculates resting HR based on inputs.
@@ -248,7 +541,7 @@ class ECG:
 
         # Calculates resting HR during waking hours if sleep_log available --------------------------------------------
         if sleep_status is not None:
-            print("\n" + "Calculating resting HR from periods of wakefulness...")
+            logger.info("Calculating resting HR from periods of wakefulness...")
 
             awake_hr = [rolling_avg[i] for i in range(0, min(len(sleep_status), len(rolling_avg)))
                         if sleep_status[i] == 0 and rolling_avg[i] is not None]
@@ -257,13 +550,13 @@ class ECG:
 
             resting_hr = round(sum(sorted_hr[:n_windows]) / n_windows, 1)
 
-            print("Resting HR (average of {} lowest {}-second periods while awake) is {} bpm.".format(n_windows,
-                                                                                                      window_size,
-                                                                                                      resting_hr))
+            logger.info("Resting HR (average of {} lowest {}-second periods while awake) is {} bpm.".format(n_windows,
+                                                                                                            window_size,
+                                                                                                            resting_hr))
 
         # Calculates resting HR during all hours if sleep_log not available -------------------------------------------
         if sleep_status is None:
-            print("\n" + "Calculating resting HR from periods of all data (sleep data not available)...")
+            logger.info("Calculating resting HR from periods of all data (sleep data not available)...")
 
             awake_hr = None
 
@@ -271,10 +564,11 @@ class ECG:
 
             resting_hr = round(sum(sorted_hr[:n_windows]) / n_windows, 1)
 
-            print("No sleep data found so resting HR cannot be calculated. "
-                  "But you probably knew that since you likely got an error...")
-            print("If you did want an estimate of resting HR including sleep, 'resting heart rate' (average of {} "
-                  "lowest {}-second periods) is {} bpm.".format(n_windows, window_size, resting_hr))
+            logger.warning("No sleep data found so resting HR cannot be calculated. "
+                           "But you probably knew that since you likely got an error...")
+            logger.info("If you did want an estimate of resting HR including sleep, 'resting heart rate' "
+                        "(average of {} lowest {}-second periods) is {} bpm.".format(n_windows, window_size,
+                                                                                      resting_hr))
 
         return rolling_avg, resting_hr, awake_hr
 
@@ -367,18 +661,18 @@ class ECG:
                             "Vigorous": intensity.count(3) / (60 / self.epoch_len),
                             "Vigorous%": round(intensity.count(3) / n_valid_epochs, 3)}
 
-        print("\n" + "HEART RATE MODEL SUMMARY")
-        print("Sedentary: {} minutes ({}%)".format(intensity_totals["Sedentary"],
-                                                   round(intensity_totals["Sedentary%"] * 100, 3)))
+        logger.info("HEART RATE MODEL SUMMARY")
+        logger.info("Sedentary: {} minutes ({}%)".format(intensity_totals["Sedentary"],
+                                                         round(intensity_totals["Sedentary%"] * 100, 3)))
 
-        print("Light: {} minutes ({}%)".format(intensity_totals["Light"],
-                                               round(intensity_totals["Light%"] * 100, 3)))
+        logger.info("Light: {} minutes ({}%)".format(intensity_totals["Light"],
+                                                     round(intensity_totals["Light%"] * 100, 3)))
 
-        print("Moderate: {} minutes ({}%)".format(intensity_totals["Moderate"],
-                                                  round(intensity_totals["Moderate%"] * 100, 3)))
+        logger.info("Moderate: {} minutes ({}%)".format(intensity_totals["Moderate"],
+                                                        round(intensity_totals["Moderate%"] * 100, 3)))
 
-        print("Vigorous: {} minutes ({}%)".format(intensity_totals["Vigorous"],
-                                                  round(intensity_totals["Vigorous%"] * 100, 3)))
+        logger.info("Vigorous: {} minutes ({}%)".format(intensity_totals["Vigorous"],
+                                                        round(intensity_totals["Vigorous%"] * 100, 3)))
 
         return intensity, intensity_totals
 
@@ -415,6 +709,18 @@ class ECG:
         -start_index: able to input desired start index. If None, randomly generated
         """
 
+        # Reads only the requested window from the EDF file if raw data was not loaded or was not kept
+        if not hasattr(self, "filtered") or self.filtered is None:
+            if input_index is None:
+                edf_file = ImportEDF.open_mapped(self.filepath)
+                input_index = randint(0, edf_file.n_samples(0) - self.start_offset -
+                                      self.epoch_len * int(edf_file.sample_rates[0]))
+
+            window = ECGWindow(filepath=self.filepath, start_index=self.start_offset + input_index,
+                               epoch_len=self.epoch_len, low_f=self.low_f, high_f=self.high_f, f_type=self.f_type)
+
+            return ECG.plot_random_qc(self=window, input_index=0)
+
         # Generates random start index
         if input_index is not None:
             start_index = input_index
@@ -470,10 +776,13 @@ class ECG:
         ax1.set_ylabel("Voltage")
         ax1.legend(loc='upper left')
 
-        # Filtered ECG data
-        ax2.plot(seconds_seq_raw, self.raw[start_index:end_index], color='red', label="Raw ECG")
+        # Raw ECG data
+        raw_window = ImportEDF.to_physical(data=self.raw[start_index:end_index],
+                                           gain=self.raw_gain, offset=self.raw_offset)
+
+        ax2.plot(seconds_seq_raw, raw_window, color='red', label="Raw ECG")
         ax2.plot(validity_data.r_peaks/self.sample_rate,
-                 [self.raw[start_index+peak] for peak in validity_data.r_peaks],
+                 [raw_window[peak] for peak in validity_data.r_peaks],
                  linestyle="", marker="x", color='black')
         ax2.set_ylabel("Voltage")
         ax2.legend(loc='upper left')
@@ -498,8 +807,54 @@ class ECG:
             writer.writerows(zip(self.epoch_timestamps, self.epoch_validity, self.epoch_hr,
                                  self.perc_hrr, self.epoch_intensity))
 
-        print("\n" + "Complete. File {} saved.".format(self.output_dir + "Model Output/" +
-                                                       self.filename + "_IntensityData.csv"))
+        logger.info("Complete. File {} saved.".format(self.output_dir + "Model Output/" +
+                                                      self.filename + "_IntensityData.csv"))
+
+
+class ECGWindow:
+
+    def __init__(self, filepath, start_index, epoch_len=15, low_f=1, high_f=30, f_type="bandpass", n=None, pad=0):
+        """Class that contains raw and filtered ECG data for a single epoch. Data is read from a memory-mapped EDF
+           file so only the data records that cover the window are decoded. Has the attributes needed by
+           CheckQuality and ECG.plot_random_qc.
+
+        :argument
+        -filepath: full pathway to EDF file
+        -start_index: index of first data point in the file
+        -epoch_len: window length in seconds
+        -low_f, high_f, f_type: filter details; same filter as ImportEDF.Bittium
+        -n: number of data points in window. Calculated from epoch_len if None.
+        -pad: seconds of data on each side of the window that are filtered with the window then discarded
+        """
+
+        self.filepath = filepath
+        self.filename = self.filepath.split("/")[-1].split(".")[0]
+        self.subjectID = self.filename.split("_")[2]
+        self.start_index = start_index
+        self.epoch_len = epoch_len
+
+        # Raw data are physical values
+        self.raw_gain = 1
+        self.raw_offset = 0
+
+        edf_file = ImportEDF.open_mapped(self.filepath)
+
+        self.sample_rate = int(edf_file.sample_rates[0])
+        self.starttime = edf_file.starttime + timedelta(seconds=self.start_index / self.sample_rate)
+
+        if n is None:
+            n = int(self.epoch_len * self.sample_rate)
+
+        # Padding is limited by the start of the file
+        pad_start = max(self.start_index - int(pad * self.sample_rate), 0)
+        pad_n = self.start_index - pad_start + n + int(pad * self.sample_rate)
+
+        padded = edf_file.read_signal(chn=0, start=pad_start, n=pad_n)
+        filtered = Filtering.filter_signal(data=padded, low_f=low_f, high_f=high_f,
+                                           type=f_type, sample_f=self.sample_rate, filter_order=3)
+
+        self.raw = padded[self.start_index - pad_start:self.start_index - pad_start + n]
+        self.filtered = filtered[self.start_index - pad_start:self.start_index - pad_start + n]
 
 
 # --------------------------------------------------------------------------------------------------------------------
@@ -531,6 +886,9 @@ class CheckQuality:
         self.fs = ecg_object.sample_rate
         self.start_index = start_index
 
+        # Voltage range is scaled so int16-stored raw data is compared to voltage_thresh in uV
+        self.raw_gain = ecg_object.raw_gain
+
         self.raw_data = ecg_object.raw[self.start_index:self.start_index+self.epoch_len*self.fs]
         self.filt_data = ecg_object.filtered[self.start_index:self.start_index+self.epoch_len*self.fs]
         self.index_list = np.arange(0, len(self.raw_data), self.epoch_len*self.fs)
@@ -544,6 +902,7 @@ class CheckQuality:
 
         # prep_data parameters
         self.r_peaks = None
+        self.detected_peaks = np.array([], dtype=np.int64)
         self.removed_peak = []
         self.enough_beats = True
         self.hr = 0
@@ -600,6 +959,9 @@ class CheckQuality:
         # Uses ecgdetectors package -> stationary wavelet transformation + Pan-Tompkins peak detection algorithm
         self.r_peaks = detectors.swt_detector(unfiltered_ecg=self.filt_data)
 
+        # All detected peaks; peaks near the window edges are later removed from r_peaks
+        self.detected_peaks = np.array(self.r_peaks, dtype=np.int64)
+
         # Checks to see if there are enough potential peaks to correspond to correct HR range ------------------------
         # Requires number of beats in window that corresponds to ~40 bpm to continue
         # Prevents the math in the self.hr calculation from returning "valid" numbers with too few beats
@@ -643,7 +1005,34 @@ class CheckQuality:
             self.delta_rr = [self.delta_rr[i] for i in range(len(self.r_peaks)) if i not in self.removal_indexes]
 
         # Calculates range of ECG voltage ----------------------------------------------------------------------------
-        self.volt_range = max(self.raw_data) - min(self.raw_data)
+        # float() avoids int16 overflow when raw data are stored as digital values
+        self.volt_range = (float(np.max(self.raw_data)) - float(np.min(self.raw_data))) * self.raw_gain
+
+    def interior_peaks(self):
+        """Returns detected peaks more than median RR / 2 samples from both edges of the window, the same rule
+           prep_data() uses for r_peaks. Edge peaks are often detector artefacts so only these are stored.
+           See RPeaks.interior_peaks()."""
+
+        return RPeaks.interior_peaks(peaks=self.detected_peaks, n_samples=self.epoch_len * self.fs,
+                                     median_rr=self.median_rr)
+
+    def epoch_volt_range(self):
+        """Returns voltage range (uV) of the epoch's raw data whether or not enough beats were found."""
+
+        if len(self.raw_data) == 0:
+            return 0
+
+        return round((float(np.max(self.raw_data)) - float(np.min(self.raw_data))) * self.raw_gain, 2)
+
+    def features(self):
+        """Returns the values checked by apply_rules() as a tuple in the order of FEATURE_DTYPE. Rule values are NaN
+           if too few beats were found to apply the rules."""
+
+        if self.rr_ratio is None:
+            return np.nan, np.nan, np.nan, self.epoch_volt_range(), np.nan, len(self.detected_peaks), False
+
+        return (self.hr, max(self.delta_rr), self.rr_ratio, self.volt_range, self.average_r,
+                len(self.detected_peaks), True)
 
     def adaptive_filter(self):
         """Method that runs an adaptive filter that generates the "average" QRS template for the window of data.
@@ -678,7 +1067,7 @@ class CheckQuality:
         try:
             self.average_qrs = np.mean(self.ecg_windowed, axis=0)
         except ValueError:
-            print("Failed to calculate mean QRS template.")
+            logger.warning("Failed to calculate mean QRS template.")
 
     def calculate_correlation(self):
         """Method that runs a correlation analysis for each beat and the average QRS template.
@@ -757,3 +1146,34 @@ class CheckQuality:
                                 "RR Ratio Valid": self.valid_ratio, "RR Ratio": round(self.rr_ratio, 1),
                                 "Voltage Range Valid": self.valid_range, "Voltage Range": round(self.volt_range, 1),
                                 "Correlation Valid": self.valid_corr, "Correlation": self.average_r}
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# ------------------------------------------------- Cached Rule Values -----------------------------------------------
+# --------------------------------------------------------------------------------------------------------------------
+
+
+def apply_rules(features, hr_min=40, hr_max=180, max_rr=3, rr_ratio=2.5, voltage_thresh=250, correlation=0.66):
+    """Vectorized version of CheckQuality.apply_rules() for cached features from ECG.write_feature_cache().
+
+    :argument
+    -features: structured array with FEATURE_DTYPE fields
+    -hr_min, hr_max: valid HR range, bpm (inclusive)
+    -max_rr: all RR intervals need to be less than max_rr, seconds
+    -rr_ratio: ratio of longest to shortest RR interval needs to be less than rr_ratio
+    -voltage_thresh: raw voltage range needs to exceed voltage_thresh, uV
+    -correlation: average beat correlation with the QRS template needs to be at least correlation
+
+    :returns
+    -valid: boolean array; True = valid epoch
+    """
+
+    with np.errstate(invalid="ignore"):
+        valid = (features["Enough Beats"] &
+                 (features["HR"] >= hr_min) & (features["HR"] <= hr_max) &
+                 (features["Max RR Interval"] < max_rr) &
+                 (features["RR Ratio"] < rr_ratio) &
+                 (features["Voltage Range"] > voltage_thresh) &
+                 (features["Correlation"] >= correlation))
+
+    return valid
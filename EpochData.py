@@ -1,18 +1,28 @@
-from datetime import datetime
+import ImportEDF
+import Checkpoint
+import Profiler
+import Logger
+import Timestamps
 import numpy as np
 import math
+import os
+
+
+logger = Logger.get_logger(__name__)
 
 
 class EpochAccel:
 
     def __init__(self, raw_data=None, remove_baseline=False, from_processed=True,
-                 processed_folder=None, accel_only=False, epoch_len=15):
+                 processed_folder=None, accel_only=False, epoch_len=15, incremental=False, checkpoint_dir=None):
 
         self.epoch_len = epoch_len
         self.remove_baseline = remove_baseline
         self.from_processed = from_processed
         self.accel_only = accel_only
         self.processed_folder = processed_folder
+        self.incremental = incremental
+        self.checkpoint_dir = checkpoint_dir
         self.raw_filename = raw_data.filepath.split("/")[-1].split(".")[0]
 
         if not self.accel_only:
@@ -29,23 +39,28 @@ class EpochAccel:
         self.intensity_cat = None
 
         # Epoching from raw data
-        if not self.from_processed and raw_data is not None:
+        if not self.from_processed and raw_data is not None and not self.incremental:
             self.epoch_from_raw(raw_data=raw_data)
 
+        # Epoching only data added since the last incremental run
+        if not self.from_processed and raw_data is not None and self.incremental:
+            self.epoch_incremental(raw_data=raw_data)
+
         # Loads epoched data from existing file
         if self.from_processed:
             self.epoch_from_processed()
 
         # Removes bias from SVM by subtracting minimum value
         if self.remove_baseline and min(self.svm) != 0.0:
-            print("\n" + "Removing bias from SVM calculations...")
+            logger.info("Removing bias from SVM calculations...")
             self.svm = [i - min(self.svm) for i in self.svm]
-            print("Complete. Bias removed.")
+            logger.info("Complete. Bias removed.")
 
+    @Profiler.timed("Epoching")
     def epoch_from_raw(self, raw_data):
 
         # Calculates epochs if from_processed is False
-        print("\n" + "Epoching using raw data...")
+        logger.info("Epoching using raw data...")
 
         self.timestamps = raw_data.timestamps[::self.epoch_len * raw_data.sample_rate]
 
@@ -57,116 +72,152 @@ class EpochAccel:
                                                math.pow(raw_data.z[i], 2)) - 1), 5) for i in range(len(raw_data.x))]
 
         # Calculates activity counts
-        for i in range(0, len(raw_data.vm), int(raw_data.sample_rate * self.epoch_len)):
+        # Reshapes VM into one row per complete epoch; sums accumulate in float64 so float32 VM is not upcast
+        epoch_samples = int(raw_data.sample_rate * self.epoch_len)
+        n_epochs = len(raw_data.vm) // epoch_samples
+
+        vm_sums = np.asarray(raw_data.vm[:n_epochs * epoch_samples]).reshape(n_epochs, epoch_samples).sum(
+            axis=1, dtype=np.float64)
+
+        # Bug handling: when we combine multiple EDF files they are zero-padded
+        # When vector magnitude is calculated, it is 1
+        # Any epoch where the values were all the epoch length * sampling rate (i.e. a VM of 1 for each data point)
+        # becomes 0
+        vm_sums[vm_sums == self.epoch_len * raw_data.sample_rate] = 0
+
+        self.svm = np.round(vm_sums, 5).tolist()
+
+        logger.info("Epoching complete.")
+
+    @Profiler.timed("Epoching")
+    def epoch_incremental(self, raw_data, block_epochs=240):
+        """Epochs data read from the memory-mapped EDF file. Activity counts of epochs processed by a previous run are
+           read from the checkpoint so only data records after them are read. Only complete epochs are counted;
+           samples in a partial final epoch are read again by the next run. Epoch timestamps are spaced exactly
+           epoch_len apart.
+
+        :argument
+        -raw_data: ImportEDF.GENEActiv object (data does not need to be loaded)
+        -block_epochs: number of epochs read from the file at a time
+        """
+
+        logger.info("Epoching new data from {}...".format(raw_data.filepath))
+
+        edf_file = ImportEDF.open_mapped(raw_data.filepath)
+
+        sample_rate = int(edf_file.sample_rates[0])
+        epoch_samples = int(sample_rate * self.epoch_len)
+
+        settings = {"Start time": str(edf_file.starttime), "Sample rate": sample_rate,
+                    "Start offset": raw_data.start_offset, "Epoch len": self.epoch_len}
+
+        manifest = Checkpoint.read_manifest(checkpoint_dir=self.checkpoint_dir, filename=self.raw_filename,
+                                            settings=settings)
+
+        svm_file = self.checkpoint_dir + self.raw_filename + "_SVM.npy"
 
-            if i + self.epoch_len * raw_data.sample_rate > len(raw_data.vm):
-                break
+        svm = np.array([])
 
-            vm_sum = sum(raw_data.vm[i:i + self.epoch_len * raw_data.sample_rate])
+        if manifest is not None and os.path.exists(svm_file):
+            svm = np.load(svm_file)[:manifest["Epochs"]]
 
-            # Bug handling: when we combine multiple EDF files they are zero-padded
-            # When vector magnitude is calculated, it is 1
-            # Any epoch where the values were all the epoch length * sampling rate (i.e. a VM of 1 for each data point)
-            # becomes 0
-            if vm_sum == self.epoch_len * raw_data.sample_rate:
-                vm_sum = 0
+        n_samples = edf_file.n_samples(0) - raw_data.start_offset
+        if raw_data.end_offset != 0:
+            n_samples = min(raw_data.end_offset, n_samples)
 
-            self.svm.append(round(vm_sum, 5))
+        n_epochs = n_samples // epoch_samples
 
-        print("Epoching complete.")
+        # Checkpointed epochs past the end of the cropped data are not used
+        svm = svm[:n_epochs]
+        n_previous = len(svm)
+
+        new_counts = []
+
+        for block_start in range(len(svm), n_epochs, block_epochs):
+            block_n = min(block_epochs, n_epochs - block_start)
+
+            xyz = np.array([edf_file.read_signal(chn=chn, start=raw_data.start_offset + block_start * epoch_samples,
+                                                 n=block_n * epoch_samples) for chn in range(3)])
+
+            # Gravity-subtracted vector magnitude; negative values become zero (see ImportEDF.GENEActiv)
+            vm = np.sqrt(np.square(xyz).sum(axis=0)) - 1
+            vm[vm < 0] = 0
+
+            vm_sums = vm.reshape(block_n, epoch_samples).sum(axis=1)
+            vm_sums[vm_sums == self.epoch_len * sample_rate] = 0
+
+            new_counts.append(np.round(vm_sums, 5))
+
+        svm = np.concatenate([svm] + new_counts)
+
+        logger.info("Epoching complete: {} new epochs.".format(len(svm) - n_previous))
+
+        starttime = np.datetime64(edf_file.starttime, "ns") + \
+            np.timedelta64(int(raw_data.start_offset / sample_rate * 10**9), "ns")
+
+        self.svm = svm.tolist()
+        self.timestamps = starttime + np.arange(len(svm)) * np.timedelta64(self.epoch_len, "s")
+
+        np.save(svm_file, svm)
+        Checkpoint.write_manifest(checkpoint_dir=self.checkpoint_dir, filename=self.raw_filename, settings=settings,
+                                  n_samples=len(svm) * epoch_samples, n_epochs=len(svm))
 
     def epoch_from_processed(self):
 
-        print("\n" + "Importing data processed from {}.".format(self.processed_folder))
+        logger.info("Importing data processed from {}.".format(self.processed_folder))
 
         # Data import from .csv
         if "Wrist" in self.processed_file:
             epoch_timestamps, svm = np.loadtxt(fname=self.processed_file, delimiter=",", skiprows=1,
                                                usecols=(0, 1), unpack=True, dtype="str")
 
-            self.timestamps = []
-
-            for i in epoch_timestamps:
-                try:
-                    self.timestamps.append(datetime.strptime(i[:-3], "%Y-%m-%dT%H:%M:%S.%f"))
-                except ValueError:
-                    try:
-                        self.timestamps.append(datetime.strptime(i, "%Y-%m-%d %H:%M:%S.%f"))
-                    except ValueError:
-                        self.timestamps.append(datetime.strptime(i, "%Y-%m-%d %H:%M:%S"))
+            self.timestamps = Timestamps.parse_timestamps(epoch_timestamps)
 
-            self.epoch_len = (self.timestamps[1] - self.timestamps[0]).seconds
-            self.svm = [float(i) for i in svm]
+            self.epoch_len = Timestamps.epoch_length(self.timestamps)
+            self.svm = svm.astype(float).tolist()
 
         if "Ankle" in self.processed_file:
             epoch_timestamps, svm, pred_speed, \
             pred_mets, epoch_intensity = np.loadtxt(fname=self.processed_file, delimiter=",", skiprows=1,
                                                     usecols=(0, 1, 2, 3, 4), unpack=True, dtype="str")
 
-            self.timestamps = []
+            self.timestamps = Timestamps.parse_timestamps(epoch_timestamps)
 
-            for i in epoch_timestamps:
-                try:
-                    self.timestamps.append(datetime.strptime(i[:-3], "%Y-%m-%dT%H:%M:%S.%f"))
-                except ValueError:
-                    try:
-                        self.timestamps.append(datetime.strptime(i, "%Y-%m-%d %H:%M:%S.%f"))
-                    except ValueError:
-                        self.timestamps.append(datetime.strptime(i, "%Y-%m-%d %H:%M:%S"))
+            self.epoch_len = Timestamps.epoch_length(self.timestamps)
+            self.svm = svm.astype(float).tolist()
 
-            self.epoch_len = (self.timestamps[1] - self.timestamps[0]).seconds
-            self.svm = [float(i) for i in svm]
+            self.pred_mets = pred_mets.astype(float).tolist()
+            self.pred_speed = pred_speed.astype(float).tolist()
+            self.intensity_cat = epoch_intensity.astype(int).tolist()
 
-            self.pred_mets = [float(i) for i in pred_mets]
-            self.pred_speed = [float(i) for i in pred_speed]
-            self.intensity_cat = [int(i) for i in epoch_intensity]
-
-        print("Complete.")
+        logger.info("Complete.")
 
     def epoch_from_processed_accelonly(self):
 
-        print("\n" + "Importing accelerometer-only data processed from {}.".format(self.processed_folder))
+        logger.info("Importing accelerometer-only data processed from {}.".format(self.processed_folder))
 
         # Data import from .csv
         if "Wrist" in self.processed_file:
             epoch_timestamps, svm = np.loadtxt(fname=self.processed_file, delimiter=",", skiprows=1,
                                                usecols=(0, 1), unpack=True, dtype="str")
 
-            self.timestamps = []
-
-            for i in epoch_timestamps:
-                try:
-                    self.timestamps.append(datetime.strptime(i[:-3], "%Y-%m-%dT%H:%M:%S.%f"))
-                except ValueError:
-                    try:
-                        self.timestamps.append(datetime.strptime(i, "%Y-%m-%d %H:%M:%S.%f"))
-                    except ValueError:
-                        self.timestamps.append(datetime.strptime(i, "%Y-%m-%d %H:%M:%S"))
+            self.timestamps = Timestamps.parse_timestamps(epoch_timestamps)
 
-            self.epoch_len = (self.timestamps[1] - self.timestamps[0]).seconds
-            self.svm = [float(i) for i in svm]
+            self.epoch_len = Timestamps.epoch_length(self.timestamps)
+            self.svm = svm.astype(float).tolist()
 
         if "Ankle" in self.processed_file:
             epoch_timestamps, svm, pred_speed, \
             pred_mets, epoch_intensity = np.loadtxt(fname=self.processed_file, delimiter=",", skiprows=1,
                                                     usecols=(0, 1, 2, 3, 4), unpack=True, dtype="str")
 
-            self.timestamps = []
-
-            for i in epoch_timestamps:
-                try:
-                    self.timestamps.append(datetime.strptime(i[:-3], "%Y-%m-%dT%H:%M:%S.%f"))
-                except ValueError:
-                    try:
-                        self.timestamps.append(datetime.strptime(i, "%Y-%m-%d %H:%M:%S.%f"))
-                    except ValueError:
-                        self.timestamps.append(datetime.strptime(i, "%Y-%m-%d %H:%M:%S"))
+            self.timestamps = Timestamps.parse_timestamps(epoch_timestamps)
 
-            self.epoch_len = (self.timestamps[1] - self.timestamps[0]).seconds
-            self.svm = [float(i) for i in svm]
+            self.epoch_len = Timestamps.epoch_length(self.timestamps)
+            self.svm = svm.astype(float).tolist()
 
-            self.pred_mets = [float(i) for i in pred_mets]
-            self.pred_speed = [float(i) for i in pred_speed]
-            self.intensity_cat = [int(i) for i in epoch_intensity]
+            self.pred_mets = pred_mets.astype(float).tolist()
+            self.pred_speed = pred_speed.astype(float).tolist()
+            self.intensity_cat = epoch_intensity.astype(int).tolist()
 
-        print("Complete.")
+        logger.info("Complete.")
@@ -0,0 +1,147 @@
+import os
+import numpy as np
+import pandas as pd
+import Logger
+
+
+logger = Logger.get_logger(__name__)
+
+
+# Epoch table columns: (column, Subject attribute path, dtype). Columns of devices/models that were not run are null.
+# Sleep status: 0 = awake, 1 = nap, 2 = overnight sleep. ECG validity: 0 = valid, 1 = invalid.
+# Intensity: 0 = sedentary, 1 = light, 2 = moderate, 3 = vigorous.
+COLUMNS = (("Wrist SVM", "wrist.epoch.svm", "float32"),
+           ("Ankle SVM", "ankle.epoch.svm", "float32"),
+           ("HR", "ecg.valid_hr", "float32"),
+           ("%HRR", "ecg.perc_hrr", "float32"),
+           ("ECG validity", "ecg.epoch_validity", "Int8"),
+           ("Sleep status", "sleep.status", "Int8"),
+           ("Wrist worn", "nonwear.Wrist.wear_status", "boolean"),
+           ("Ankle worn", "nonwear.Ankle.wear_status", "boolean"),
+           ("Wrist intensity", "wrist.model.epoch_intensity", "Int8"),
+           ("Ankle intensity", "ankle.model.epoch_intensity", "Int8"),
+           ("HR intensity", "ecg.epoch_intensity", "Int8"),
+           ("HR-Acc intensity", "hr_acc.model.epoch_intensity", "Int8"))
+
+
+def get_attribute(obj, path):
+    """Returns the attribute at path (e.g. "wrist.model.epoch_intensity"; dictionary keys are also followed),
+       or None if anything along the path is missing."""
+
+    for name in path.split("."):
+        obj = obj.get(name, None) if isinstance(obj, dict) else getattr(obj, name, None)
+
+        if obj is None:
+            return None
+
+    return obj
+
+
+def epoch_column(values, data_len, dtype):
+    """Converts per-epoch values (None = no data) to a pandas array of length data_len. Null if values is None."""
+
+    column = np.full(data_len, np.nan)
+
+    if values is not None:
+        values = np.array(values[:data_len], dtype=float)
+        column[:len(values)] = values
+
+    if dtype == "float32":
+        return column.astype(np.float32)
+
+    # Nullable integer/boolean types keep missing epochs as null instead of NaN
+    return pd.Series(column).astype(dtype).array
+
+
+def epoch_table(subject_object):
+    """Combines a processed subject's epoch-level data into one typed table.
+
+    :argument
+    -subject_object: Subject instance processed from raw data
+
+    :returns
+    -table: pandas DataFrame with "ID", "Timestamp" (datetime64), "Valid" (epoch passed all validity criteria) and
+            COLUMNS. Devices are cropped to the shortest data set.
+    """
+
+    data_len = [len(values) for values in [get_attribute(subject_object, "ankle.epoch.svm"),
+                                           get_attribute(subject_object, "wrist.epoch.svm"),
+                                           get_attribute(subject_object, "ecg.epoch_timestamps")]
+                if values is not None]
+    data_len = min(data_len)
+
+    # Uses timestamps from an available device (should all be equivalent)
+    for path in ("ankle.epoch.timestamps", "wrist.epoch.timestamps", "ecg.epoch_timestamps"):
+        timestamps = get_attribute(subject_object, path)
+
+        if timestamps is not None:
+            break
+
+    table = pd.DataFrame({"ID": str(subject_object.subjectID),
+                          "Timestamp": pd.to_datetime(np.asarray(timestamps)[:data_len])})
+
+    # Final validity from ValidData ("Valid"/"Invalid")
+    validity_object = subject_object.valid_all if subject_object.valid_all is not None else \
+        subject_object.valid_accelonly
+    final_validity = get_attribute(validity_object, "final_epoch_validity")
+
+    table["Valid"] = epoch_column(None if final_validity is None else
+                                  [validity == "Valid" for validity in final_validity],
+                                  data_len=data_len, dtype="boolean")
+
+    for column, path, dtype in COLUMNS:
+        table[column] = epoch_column(get_attribute(subject_object, path), data_len=data_len, dtype=dtype)
+
+    return table
+
+
+def write_epoch_table(subject_object, dataset_dir=None):
+    """Writes a subject's epoch table (see epoch_table()) to a Parquet file in the subject's Model Output folder and,
+       optionally, to a cohort dataset partitioned by subject ID (dataset_dir/ID=<ID>/EpochData.parquet) that can be
+       scanned with read_epoch_table(dataset_dir, filters=...). Requires pyarrow or fastparquet.
+
+    :argument
+    -subject_object: Subject instance processed from raw data
+    -dataset_dir: folder of cohort dataset. Not written if None.
+
+    :returns
+    -table: pandas DataFrame written to file
+    """
+
+    table = epoch_table(subject_object=subject_object)
+
+    out_filename = "{}Model Output/OND07_WTL_{}_01_EpochData.parquet".format(subject_object.output_dir,
+                                                                           subject_object.subjectID)
+
+    try:
+        table.to_parquet(out_filename, index=False)
+
+        # Partition column is stored in the folder name
+        if dataset_dir is not None:
+            partition_dir = os.path.join(dataset_dir, "ID={}".format(subject_object.subjectID))
+            os.makedirs(partition_dir, exist_ok=True)
+
+            table.drop(columns="ID").to_parquet(os.path.join(partition_dir, "EpochData.parquet"), index=False)
+
+    except ImportError:
+        logger.warning("Parquet epoch table not written: pyarrow or fastparquet is required.")
+        return table
+
+    logger.info("Complete. File {} saved.".format(out_filename))
+
+    return table
+
+
+def read_epoch_table(filepath, columns=None, filters=None):
+    """Reads a subject's epoch table or a cohort dataset written by write_epoch_table().
+
+    :argument
+    -filepath: .parquet file or cohort dataset folder
+    -columns: list of columns to read. All columns if None.
+    -filters: pyarrow filters applied while reading, e.g. [("ID", "in", [3028, 3029]), ("Valid", "==", True)]
+
+    :returns
+    -table: pandas DataFrame
+    """
+
+    return pd.read_parquet(filepath, columns=columns, filters=filters)
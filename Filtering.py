@@ -1,7 +1,9 @@
 from scipy.signal import butter, lfilter, filtfilt
+import numpy as np
 
 
-def filter_signal(data, type, low_f=None, high_f=None, sample_f=None, filter_order=2):
+def filter_signal(data, type, low_f=None, high_f=None, sample_f=None, filter_order=2,
+                  gain=1, offset=0, block_len=None, block_pad=10):
     """Function that creates bandpass filter to ECG data.
 
     Required arguments:
@@ -10,6 +12,12 @@ def filter_signal(data, type, low_f=None, high_f=None, sample_f=None, filter_ord
     -low_f, high_f: filter cut-offs, Hz
     -sample_f: sampling frequency, Hz
     -filter_order: order of filter; integer
+
+    Optional arguments:
+    -gain, offset: digital-to-physical scaling applied to data before filtering (int16 data)
+    -block_len: number of data points filtered at a time. Non-float64 data defaults to 1 hour blocks and
+                returns float32 so the whole array is never upcast.
+    -block_pad: seconds of neighbouring data filtered with each block then discarded to remove edge effects
     """
 
     nyquist_freq = 0.5 * sample_f
@@ -17,22 +25,62 @@ def filter_signal(data, type, low_f=None, high_f=None, sample_f=None, filter_ord
     if type == "lowpass":
         low = low_f / nyquist_freq
         b, a = butter(N=filter_order, Wn=low, btype="lowpass")
-        # filtered_data = lfilter(b, a, data)
-        filtered_data = filtfilt(b, a, x=data)
 
     if type == "highpass":
         high = high_f / nyquist_freq
 
         b, a = butter(N=filter_order, Wn=high, btype="highpass")
-        # filtered_data = lfilter(b, a, data)
-        filtered_data = filtfilt(b, a, x=data)
 
     if type == "bandpass":
         low = low_f / nyquist_freq
         high = high_f / nyquist_freq
 
         b, a = butter(N=filter_order, Wn=[low, high], btype="bandpass")
+
+    if block_len is None and np.asarray(data).dtype != np.float64:
+        block_len = int(3600 * sample_f)
+
+    if block_len is None:
+        if gain != 1 or offset != 0:
+            data = data * gain + offset
+
         # filtered_data = lfilter(b, a, data)
         filtered_data = filtfilt(b, a, x=data)
 
+    if block_len is not None:
+        filtered_data = filter_blocks(b=b, a=a, data=data, block_len=block_len, pad_len=int(block_pad * sample_f),
+                                      gain=gain, offset=offset)
+
+    return filtered_data
+
+
+def filter_blocks(b, a, data, block_len, pad_len, gain=1, offset=0):
+    """Applies filtfilt to data in blocks along the last axis. Each block is filtered with pad_len data points of
+       neighbouring data on both sides which are then discarded. Only one block is upcast to float64 at a time.
+
+    :argument
+    -b, a: filter coefficients
+    -data: numpy array (int16, float32 or float64)
+    -block_len: number of data points per block
+    -pad_len: number of neighbouring data points filtered with each block
+    -gain, offset: digital-to-physical scaling applied to each block before filtering
+
+    :returns
+    -filtered_data: numpy array. float64 if data is float64, otherwise float32.
+    """
+
+    data = np.asarray(data)
+    n = data.shape[-1]
+
+    filtered_data = np.empty(data.shape, dtype=np.float64 if data.dtype == np.float64 else np.float32)
+
+    for start in range(0, n, block_len):
+        end = min(start + block_len, n)
+        pad_start = max(start - pad_len, 0)
+        pad_end = min(end + pad_len, n)
+
+        block = data[..., pad_start:pad_end] * gain + offset
+
+        filtered_data[..., start:end] = filtfilt(b, a, x=block)[..., start - pad_start:end - pad_start]
+
     return filtered_data
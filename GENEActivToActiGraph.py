@@ -4,6 +4,11 @@ import ImportEDF
 import matplotlib.pyplot as plt
 import scipy.signal
 import math
+import Logger
+
+
+logger = Logger.get_logger(__name__)
+
 
 # RAW IMPORT =========================================================================================================
 
@@ -120,21 +125,21 @@ class ActigraphConversion:
         """Downsamples data to 30Hz to match typical ActiGraph sampling rate."""
 
         # STEP 0: DOWNSAMPLES TO 30Hz =================================================================================
-        print("\n" + "Resampling data to 30Hz...")
+        logger.info("Resampling data to 30Hz...")
 
         self.accel30hz = scipy.signal.resample(x=self.raw_accel,
                                                num=int(len(self.raw_accel[0]) * 30 / self.sample_rate), axis=1)
 
         self.mag_start_30hz = scipy.signal.resample(x=self.raw_mag, num=int(len(self.raw_mag) * 30 / self.sample_rate))
 
-        print("Complete.")
+        logger.info("Complete.")
 
     def antialias_filter(self):
         """Applies 0.01 - 7.0 Hz bandpass filter to prevent aliasing."""
 
         # STEP 1: 0.01-7Hz BP FILTERING ==============================================================================
 
-        print("\n" + "Applying 0.01-7Hz bandpass filter...")
+        logger.info("Applying 0.01-7Hz bandpass filter...")
 
         self.step1_filter = Filtering.filter_signal(data=self.accel30hz, type="bandpass",
                                                     low_f=0.01, high_f=7, filter_order=1, sample_f=self.sample_rate)
@@ -143,14 +148,14 @@ class ActigraphConversion:
                                                               low_f=0.01, high_f=7,
                                                               filter_order=1, sample_f=self.sample_rate)
 
-        print("Complete.")
+        logger.info("Complete.")
 
     def actigraph_filter(self):
         """Applies 0.29 - 1.63 Hz bandpass filter to match on-board ActiGraph processing."""
 
         # STEP 2: 0.29-1.63Hz BANDPASS FILTERING =====================================================================
 
-        print("\n" + "Applying mystical Step #2 filter...")
+        logger.info("Applying mystical Step #2 filter...")
 
         self.step2_filter = Filtering.filter_signal(data=self.step1_filter, type="bandpass",
                                                     low_f=0.29, high_f=1.63, filter_order=1, sample_f=30)
@@ -158,14 +163,14 @@ class ActigraphConversion:
         self.mag_start_step2_filter = Filtering.filter_signal(data=self.mag_start_step1_filter, type="bandpass",
                                                               low_f=0.29, high_f=1.63, filter_order=1, sample_f=30)
 
-        print("Complete.")
+        logger.info("Complete.")
 
     def downsample_10hz(self):
         """Further downsamples data to 10Hz."""
 
         # STEP 3: DOWNSAMPLE TO 10HZ =================================================================================
 
-        print("\n" + "Resampling down to 10Hz...")
+        logger.info("Resampling down to 10Hz...")
 
         self.accel10hz = scipy.signal.resample(x=self.step2_filter,
                                                num=int(len(self.step2_filter[0]) * 10 / 30), axis=1)
@@ -173,14 +178,14 @@ class ActigraphConversion:
         self.mag_start_10hz = scipy.signal.resample(x=self.mag_start_step2_filter,
                                                     num=int(len(self.mag_start_step2_filter) * 10 / 30))
 
-        print("Complete.")
+        logger.info("Complete.")
 
     def truncate_data(self):
         """Truncates data to the ± 2.13 G range to match ActiGraph response range."""
 
         # STEP 4: TRUNCATE TO 2.13G's ================================================================================
 
-        print("\n" + "Truncating data to ± 2.13 G's...")
+        logger.info("Truncating data to ± 2.13 G's...")
 
         self.truncated = np.copy(self.accel10hz)
         self.truncated[self.truncated >= 2.13] = 2.13
@@ -189,26 +194,26 @@ class ActigraphConversion:
         self.mag_start_truncated = np.copy(self.mag_start_10hz)
         self.mag_start_truncated[self.mag_start_truncated >= 2.13] = 2.13
 
-        print("Complete.")
+        logger.info("Complete.")
 
     def rectify_data(self):
         """Rectifies the data."""
 
         # STEP 5: RECTIFICATION ======================================================================================
 
-        print("\n" + "Rectifying data...")
+        logger.info("Rectifying data...")
 
         self.rectified = np.absolute(self.truncated)
         self.mag_start_rectified = np.absolute(self.mag_start_truncated)
 
-        print("Complete.")
+        logger.info("Complete.")
 
     def deadband_filter(self):
         """Applies deadband filter corresponding to < 0.068 G."""
 
         # STEP 6: DEADBAND BELOW 0.068G's ============================================================================
 
-        print("\n" + "Applying deadband (< 0.068 G's) filter...")
+        logger.info("Applying deadband (< 0.068 G's) filter...")
 
         self.deadband = np.copy(self.rectified)
         self.deadband[self.deadband <= 0.068] = 0
@@ -216,7 +221,7 @@ class ActigraphConversion:
         self.mag_start_deadband = np.copy(self.mag_start_rectified)
         self.mag_start_deadband[self.mag_start_deadband <= 0.068] = 0
 
-        print("Complete.")
+        logger.info("Complete.")
 
     def convert_to_8bit(self):
         """-Converts data to the equivalent if it had been collected with 8-bit resolution.
@@ -225,7 +230,7 @@ class ActigraphConversion:
 
         # STEP 7: 8-BIT CONVERSION ===================================================================================
 
-        print("\n" + "Converting data to 8-bit resolution...")
+        logger.info("Converting data to 8-bit resolution...")
 
         # Bins representing value ranges covered by what would be 8-bit resolution: range = 0 to 2.13 G's
         bins = np.linspace(start=0, stop=2.13, num=128)
@@ -256,14 +261,14 @@ class ActigraphConversion:
                                            math.pow(self.bit8[2, i], 2)))
                              for i in range(len(self.bit8[0]))]
 
-        print("Complete.")
+        logger.info("Complete.")
 
     def epoch_data(self):
         """Epochs data by taking the sum of a jumping window."""
 
         # STEP 8: EPOCHING ===========================================================================================
 
-        print("\n" + "Epoching the data...")
+        logger.info("Epoching the data...")
 
         self.epoch_y = [sum(self.bit8[1, i:i + self.epoch_len * 10])
                         for i in np.arange(0, len(self.bit8[1]), self.epoch_len * 10)]
@@ -274,7 +279,7 @@ class ActigraphConversion:
         self.epoch_mag_end = [sum(self.mag_end_8bit[i: i + self.epoch_len * 10])
                               for i in np.arange(1, len(self.mag_end_8bit), self.epoch_len * 10)]
 
-        print("Complete.")
+        logger.info("Complete.")
 
     def plot_epoched(self):
         """Plots epoched data (single-axis and vector magnitude)."""
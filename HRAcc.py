@@ -1,4 +1,64 @@
 import csv
+import numpy as np
+import Logger
+
+
+logger = Logger.get_logger(__name__)
+
+
+# Model used for each epoch is stored as a small-int code; MODEL_LABELS[code] is the label written to file
+MODEL_LABELS = ("Invalid ECG", "Ankle", "HR")
+INVALID_ECG, ANKLE, HR = 0, 1, 2
+
+
+def combine_hracc(perc_hrr, hr_intensity, ankle_intensity, thresholds, use_ankle_during_invalid_hr=False):
+    """Combines HR and ankle models into the HR-Acc model. HR intensity is used when %HRR >= threshold; ankle
+       intensity is used when %HRR < threshold (and during invalid ECG if use_ankle_during_invalid_hr).
+
+    :argument
+    -perc_hrr: %HRR for each epoch; None/NaN = invalid ECG
+    -hr_intensity, ankle_intensity: intensity category for each epoch; None/NaN = no data
+    -thresholds: %HRR threshold. A scalar returns 1-D arrays; a 1-D array of thresholds evaluates all thresholds at
+                 once and returns arrays with one row per threshold.
+    -use_ankle_during_invalid_hr: whether ankle data is used during invalid ECG epochs
+
+    :returns
+    -intensity: float array of intensity categories (NaN = no data)
+    -model_used: int8 array of model codes (INVALID_ECG, ANKLE, HR)
+    """
+
+    # Data sets are truncated to the shortest, as with zip()
+    n = min(len(perc_hrr), len(hr_intensity), len(ankle_intensity))
+
+    hrr = np.array(perc_hrr[:n], dtype=float)
+    hr_int = np.array(hr_intensity[:n], dtype=float)
+    ankle_int = np.array(ankle_intensity[:n], dtype=float)
+
+    # Scalar threshold broadcasts to shape (n, ); vector of thresholds to shape (n_thresholds, n)
+    thresholds = np.asarray(thresholds, dtype=float)[..., None]
+
+    valid_hr = ~np.isnan(hrr)
+
+    with np.errstate(invalid="ignore"):
+        use_hr = valid_hr & (hrr >= thresholds)
+
+    use_ankle = ~use_hr & (valid_hr | use_ankle_during_invalid_hr)
+
+    model_used = np.where(use_hr, HR, np.where(use_ankle, ANKLE, INVALID_ECG)).astype(np.int8)
+    intensity = np.where(use_hr, hr_int, np.where(use_ankle, ankle_int, np.nan))
+
+    return intensity, model_used
+
+
+def intensity_to_list(intensity):
+    """Converts float intensity array (NaN = no data) to a list of integers with None for missing data."""
+
+    missing = np.isnan(intensity)
+
+    values = np.where(missing, 0, intensity).astype(int).astype(object)
+    values[missing] = None
+
+    return values.tolist()
 
 
 class HRAcc:
@@ -41,70 +101,58 @@ class HRAccModel:
         self.hracc = hracc_object
         self.use_ankle_during_invalid_hr = use_ankle_during_invalid_hr
         self.epoch_intensity = None
-        self.model_used = []
+        self.model_used = None  # int8 array of model codes; see MODEL_LABELS
 
         self.combine_models(self.use_ankle_during_invalid_hr)
         self.intensity_totals, self.model_usage = self.calculate_intensity_totals()
 
     def combine_models(self, use_ankle_during_invalid_hr):
 
-        self.epoch_intensity = []
-
-        for hrr, hr_int, ankle_int in zip(self.hracc.perc_hrr, self.hracc.hr_intensity, self.hracc.ankle_intensity):
+        intensity, self.model_used = combine_hracc(perc_hrr=self.hracc.perc_hrr,
+                                                   hr_intensity=self.hracc.hr_intensity,
+                                                   ankle_intensity=self.hracc.ankle_intensity,
+                                                   thresholds=self.hracc.hrr_threshold,
+                                                   use_ankle_during_invalid_hr=use_ankle_during_invalid_hr)
 
-            if hrr is None:
-                if use_ankle_during_invalid_hr:
-                    self.epoch_intensity.append(ankle_int)
-                    self.model_used.append("Ankle")
-                if not use_ankle_during_invalid_hr:
-                    self.epoch_intensity.append(None)
-                    self.model_used.append("Invalid ECG")
-
-            if hrr is not None:
-                if hrr >= self.hracc.hrr_threshold:
-                    self.epoch_intensity.append(hr_int)
-                    self.model_used.append("HR")
-
-                if hrr < self.hracc.hrr_threshold:
-                    self.epoch_intensity.append(ankle_int)
-                    self.model_used.append("Ankle")
+        self.epoch_intensity = intensity_to_list(intensity)
 
     def calculate_intensity_totals(self):
 
-        intensity = [i for i in self.epoch_intensity if i is not None]
+        intensity = np.array(self.epoch_intensity, dtype=float)
+        intensity = intensity[~np.isnan(intensity)].astype(int)
+
+        n_valid_epochs = max(len(intensity), 1)
 
-        if self.use_ankle_during_invalid_hr:
-            n_valid_epochs = len(intensity)
-        if not self.use_ankle_during_invalid_hr:
-            n_valid_epochs = len(intensity) - intensity.count(None)
+        counts = np.bincount(intensity, minlength=4)
+        model_counts = np.bincount(self.model_used, minlength=len(MODEL_LABELS))
 
         # Calculates time spent in each intensity category
-        intensity_totals = {"Sedentary": intensity.count(0) / (60 / self.hracc.epoch_len),
-                            "Sedentary%": round(intensity.count(0) / n_valid_epochs, 3),
-                            "Light": intensity.count(1) / (60 / self.hracc.epoch_len),
-                            "Light%": round(intensity.count(1) / n_valid_epochs, 3),
-                            "Moderate": intensity.count(2) / (60 / self.hracc.epoch_len),
-                            "Moderate%": round(intensity.count(2) / n_valid_epochs, 3),
-                            "Vigorous": intensity.count(3) / (60 / self.hracc.epoch_len),
-                            "Vigorous%": round(intensity.count(3) / n_valid_epochs, 3)}
+        intensity_totals = {"Sedentary": counts[0] / (60 / self.hracc.epoch_len),
+                            "Sedentary%": round(counts[0] / n_valid_epochs, 3),
+                            "Light": counts[1] / (60 / self.hracc.epoch_len),
+                            "Light%": round(counts[1] / n_valid_epochs, 3),
+                            "Moderate": counts[2] / (60 / self.hracc.epoch_len),
+                            "Moderate%": round(counts[2] / n_valid_epochs, 3),
+                            "Vigorous": counts[3] / (60 / self.hracc.epoch_len),
+                            "Vigorous%": round(counts[3] / n_valid_epochs, 3)}
 
-        print("\n" + "HEART RATE MODEL SUMMARY")
-        print("Sedentary: {} minutes ({}%)".format(intensity_totals["Sedentary"],
-                                                   round(intensity_totals["Sedentary%"] * 100, 3)))
+        logger.info("HEART RATE MODEL SUMMARY")
+        logger.info("Sedentary: {} minutes ({}%)".format(intensity_totals["Sedentary"],
+                                                         round(intensity_totals["Sedentary%"] * 100, 3)))
 
-        print("Light: {} minutes ({}%)".format(intensity_totals["Light"],
-                                               round(intensity_totals["Light%"] * 100, 3)))
+        logger.info("Light: {} minutes ({}%)".format(intensity_totals["Light"],
+                                                     round(intensity_totals["Light%"] * 100, 3)))
 
-        print("Moderate: {} minutes ({}%)".format(intensity_totals["Moderate"],
-                                                  round(intensity_totals["Moderate%"] * 100, 3)))
+        logger.info("Moderate: {} minutes ({}%)".format(intensity_totals["Moderate"],
+                                                        round(intensity_totals["Moderate%"] * 100, 3)))
 
-        print("Vigorous: {} minutes ({}%)".format(intensity_totals["Vigorous"],
-                                                  round(intensity_totals["Vigorous%"] * 100, 3)))
+        logger.info("Vigorous: {} minutes ({}%)".format(intensity_totals["Vigorous"],
+                                                        round(intensity_totals["Vigorous%"] * 100, 3)))
 
-        model_usage_dict = {"Ankle epochs": self.model_used.count("Ankle"),
-                            "Ankle %)": round(self.model_used.count("Ankle") / n_valid_epochs, 5),
-                            "HR epochs": self.model_used.count("HR"),
-                            "HR %": round(self.model_used.count("HR") / n_valid_epochs, 5)}
+        model_usage_dict = {"Ankle epochs": int(model_counts[ANKLE]),
+                            "Ankle %)": round(model_counts[ANKLE] / n_valid_epochs, 5),
+                            "HR epochs": int(model_counts[HR]),
+                            "HR %": round(model_counts[HR] / n_valid_epochs, 5)}
 
         return intensity_totals, model_usage_dict
 
@@ -117,7 +165,7 @@ class HRAccModel:
 
             writer.writerow(["Timestamp", "ValidHR", "ModelUsed", "IntensityCategory"])
             writer.writerows(zip(self.hracc.hr.epoch_timestamps, self.hracc.hr_validity,
-                                 self.model_used, self.epoch_intensity))
+                                 np.array(MODEL_LABELS)[self.model_used], self.epoch_intensity))
 
-        print("\n" + "Complete. File {} saved.".format(self.hracc.output_dir + "Model Output/" +
-                                                       self.hracc.filename + "_HRAcc_IntensityData.csv"))
+        logger.info("Complete. File {} saved.".format(self.hracc.output_dir + "Model Output/" +
+                                                      self.hracc.filename + "_HRAcc_IntensityData.csv"))
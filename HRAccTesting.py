@@ -0,0 +1,157 @@
+import HRAcc
+import ModelStats
+import Logger
+import numpy as np
+import pandas as pd
+
+
+# Intensity categories in order of category code
+INTENSITIES = ("Sedentary", "Light", "Moderate", "Vigorous")
+
+
+def sweep_inputs(subject_object):
+    """Extracts the data needed for a threshold sweep from a processed Subject so only these arrays need to be
+       passed to worker processes.
+
+    :argument
+    -subject_object: object of class Subject with ECG and ankle data
+
+    :returns
+    -inputs: dictionary of "SubjectID", "Perc HRR", "HR Intensity", "Ankle Intensity", "Validity" and "Epoch len".
+             Validity combines all AllDevices validity masks except HR validity (e.g. sleep, non-wear) so epochs with
+             invalid ECG are kept for the HR-Acc model.
+    """
+
+    validity = None
+
+    if subject_object.valid_all is not None:
+        validity = np.ones(subject_object.valid_all.data_len, dtype=bool)
+
+        for name, mask in subject_object.valid_all.validity_masks.items():
+            if name != "HR Valid":
+                validity &= mask
+
+    inputs = {"SubjectID": subject_object.subjectID,
+              "Perc HRR": subject_object.ecg.perc_hrr,
+              "HR Intensity": subject_object.ecg.epoch_intensity,
+              "Ankle Intensity": subject_object.ankle.model.epoch_intensity,
+              "Validity": validity,
+              "Epoch len": subject_object.epoch_len}
+
+    return inputs
+
+
+def sweep_thresholds(perc_hrr, hr_intensity, ankle_intensity, validity=None, thresholds=None, epoch_len=15,
+                     use_ankle_during_invalid_hr=False):
+    """Evaluates the HR-Acc model for a grid of %HRR thresholds in a single vectorized pass.
+
+    :argument
+    -perc_hrr: %HRR for each epoch; None/NaN = invalid ECG
+    -hr_intensity, ankle_intensity: intensity category for each epoch; None/NaN = no data
+    -validity: boolean array of epochs to include (True = include). All epochs are included if None.
+    -thresholds: 1-D array of %HRR thresholds. Defaults to 0-100 in steps of 1.
+    -epoch_len: epoch length in seconds
+    -use_ankle_during_invalid_hr: whether ankle data is used during invalid ECG epochs
+
+    :returns
+    -sweep: pandas DataFrame with one row per threshold of intensity totals (minutes and proportion of valid
+            epochs), model usage and Cohen's kappa against the HR and ankle models
+    """
+
+    if thresholds is None:
+        thresholds = np.arange(0, 101, 1)
+
+    thresholds = np.asarray(thresholds, dtype=float)
+    n_thresholds = len(thresholds)
+
+    intensity, model_used = HRAcc.combine_hracc(perc_hrr=perc_hrr, hr_intensity=hr_intensity,
+                                                ankle_intensity=ankle_intensity, thresholds=thresholds,
+                                                use_ankle_during_invalid_hr=use_ankle_during_invalid_hr)
+
+    n_epochs = intensity.shape[1]
+
+    if validity is None:
+        validity = np.ones(n_epochs, dtype=bool)
+
+    included = np.zeros(n_epochs, dtype=bool)
+    included[:min(n_epochs, len(validity))] = np.asarray(validity, dtype=bool)[:n_epochs]
+
+    # Excluded epochs are removed from all models
+    intensity = np.where(included, intensity, np.nan)
+    hr = np.where(included, np.array(hr_intensity[:n_epochs], dtype=float), np.nan)
+    ankle = np.where(included, np.array(ankle_intensity[:n_epochs], dtype=float), np.nan)
+
+    # Intensity totals: category codes 0-3, 4 = no data
+    n_codes = len(INTENSITIES) + 1
+    codes = np.where(np.isnan(intensity), len(INTENSITIES), intensity).astype(int)
+    counts = np.bincount((np.arange(n_thresholds)[:, None] * n_codes + codes).ravel(),
+                         minlength=n_thresholds * n_codes).reshape(n_thresholds, n_codes)[:, :len(INTENSITIES)]
+
+    n_valid = counts.sum(axis=1)
+
+    # Model usage of included epochs
+    n_models = len(HRAcc.MODEL_LABELS)
+    model_codes = np.where(included, model_used, n_models)
+    usage = np.bincount((np.arange(n_thresholds)[:, None] * (n_models + 1) + model_codes).ravel(),
+                        minlength=n_thresholds * (n_models + 1)).reshape(n_thresholds, n_models + 1)
+
+    sweep = pd.DataFrame({"Threshold": thresholds})
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for i, category in enumerate(INTENSITIES):
+            sweep[category] = counts[:, i] / (60 / epoch_len)
+            sweep[category + "%"] = np.round(counts[:, i] / n_valid, 3)
+
+        for code, label in [(HRAcc.ANKLE, "Ankle"), (HRAcc.HR, "HR"), (HRAcc.INVALID_ECG, "Invalid ECG")]:
+            sweep[label + " epochs"] = usage[:, code]
+            sweep[label + " %"] = np.round(usage[:, code] / n_valid, 5)
+
+    sweep["Kappa HR"] = np.round(ModelStats.kappa_from_matrices(ModelStats.pair_matrices(intensity, hr)), 4)
+    sweep["Kappa Ankle"] = np.round(ModelStats.kappa_from_matrices(ModelStats.pair_matrices(intensity, ankle)), 4)
+
+    return sweep
+
+
+def sweep_subject(inputs, thresholds=None, use_ankle_during_invalid_hr=False):
+    """Runs sweep_thresholds() on a dictionary from sweep_inputs(). Adds a "SubjectID" column."""
+
+    # The caller's context is restored afterwards when run in this process (processes=1)
+    with Logger.context(Subject=inputs["SubjectID"]):
+        progress = Logger.Progress(stage="Threshold sweep", total=1, unit="subjects")
+
+        sweep = sweep_thresholds(perc_hrr=inputs["Perc HRR"], hr_intensity=inputs["HR Intensity"],
+                                 ankle_intensity=inputs["Ankle Intensity"], validity=inputs["Validity"],
+                                 thresholds=thresholds, epoch_len=inputs["Epoch len"],
+                                 use_ankle_during_invalid_hr=use_ankle_during_invalid_hr)
+
+        sweep.insert(0, "SubjectID", inputs["SubjectID"])
+
+        progress.finish()
+
+    return sweep
+
+
+def sweep_cohort(subject_inputs, thresholds=None, use_ankle_during_invalid_hr=False, processes=None):
+    """Runs threshold sweeps for many subjects in parallel.
+
+    :argument
+    -subject_inputs: list of dictionaries from sweep_inputs()
+    -thresholds: 1-D array of %HRR thresholds
+    -use_ankle_during_invalid_hr: whether ankle data is used during invalid ECG epochs
+    -processes: number of worker processes. Uses os.cpu_count() if None; runs in this process if 1.
+
+    :returns
+    -sweep: pandas DataFrame of all subjects' sweeps
+    """
+
+    args = [(inputs, thresholds, use_ankle_during_invalid_hr) for inputs in subject_inputs]
+
+    if processes == 1:
+        sweeps = [sweep_subject(*arg) for arg in args]
+
+    # Worker log records and progress events are handled in this process
+    if processes != 1:
+        with Logger.worker_pool(processes=processes, n_subjects=len(args)) as pool:
+            sweeps = pool.starmap(sweep_subject, args)
+
+    return pd.concat(sweeps, ignore_index=True)
@@ -1,18 +1,20 @@
 import numpy as np
+import Logger
+
+
+logger = Logger.get_logger(__name__)
 
 
 def import_crop_indexes(subject, crop_file):
     """Searches file for existing crop index data. Returns separate dictionaries for start/end indexes."""
 
-    print()
-    print("======================================= DEVICE SYNCHRONIZATION ======================================")
+    logger.info("DEVICE SYNCHRONIZATION")
 
-    print("\n" + "Searching {} for existing file ".format(crop_file))
-    print("crop indexes for subject {}...".format(subject))
-    print()
+    logger.info("Searching {} for existing file ".format(crop_file))
+    logger.info("crop indexes for subject {}...".format(subject))
 
     # Reads in .csv file
-    data = np.loadtxt(fname=crop_file, delimiter=",", skiprows=1, dtype="str")
+    data = np.loadtxt(fname=crop_file, delimiter=",", skiprows=1, dtype="str", ndmin=2)
 
     # Default values
     crop_indexes_found = False
@@ -47,6 +49,6 @@ def import_crop_indexes(subject, crop_file):
                 crop_indexes_found = True
 
     if not crop_indexes_found:
-        print("\n" + "No indexes found. Checking raw data files..." + "\n")
+        logger.info("No indexes found. Checking raw data files...")
 
     return start_offset_dict, end_offset_dict, crop_indexes_found
@@ -1,5 +1,9 @@
 import numpy as np
 import os
+import Logger
+
+
+logger = Logger.get_logger(__name__)
 
 
 def import_demographics(subject_object=None):
@@ -12,13 +16,13 @@ def import_demographics(subject_object=None):
     demos_file = subject_object.demographics_file
 
     if demos_file is None:
-        print("No demographics file input.")
+        logger.info("No demographics file input.")
         return None
     if not os.path.exists(demos_file):
-        print("Demographics file does not exist.")
+        logger.warning("Demographics file does not exist.")
         return None
 
-    data = np.loadtxt(fname=demos_file, delimiter=",", skiprows=1, dtype="str")
+    data = np.loadtxt(fname=demos_file, delimiter=",", skiprows=1, dtype="str", ndmin=2)
 
     for row in data:
         if str(subject_object.subjectID) in row[0]:
@@ -1,20 +1,37 @@
 import pyedflib
 from datetime import datetime
 from datetime import timedelta
+from functools import lru_cache
+import os
 import math
 import pandas as pd
 import numpy as np
 import Filtering
+import Profiler
+import Logger
+
+
+logger = Logger.get_logger(__name__)
+
+
+# Storage precisions for imported signals
+# "float64": physical values (default); "float32": physical values at half the memory;
+# "int16": digital samples as stored in the EDF file. Physical value = digital * gain + offset
+PRECISIONS = ("float64", "float32", "int16")
+
+# GENEActiv temperature is sampled at 1/TEMPERATURE_DIVISOR of the sample rate in the file header
+TEMPERATURE_DIVISOR = 4
 
 
 class GENEActiv:
 
-    def __init__(self, filepath, load_raw, start_offset=0, end_offset=0):
+    def __init__(self, filepath, load_raw, start_offset=0, end_offset=0, precision="float64"):
 
         self.filepath = filepath
         self.start_offset = start_offset
         self.end_offset = end_offset
         self.load_raw = load_raw
+        self.precision = precision
 
         # Accelerometer data
         self.x = None
@@ -23,6 +40,9 @@ class GENEActiv:
         self.vm = None  # Vector Magnitudes
         self.timestamps = None
 
+        # Digital-to-physical scaling of x, y, z: {axis: (gain, offset)}. (1, 0) unless precision is "int16"
+        self.scale = {"x": (1, 0), "y": (1, 0), "z": (1, 0)}
+
         # Details
         self.sample_rate = 75
         self.starttime = None
@@ -32,53 +52,74 @@ class GENEActiv:
         if self.load_raw:
             self.import_file()
 
+    def physical(self, axis, start=None, stop=None, step=None):
+        """Returns a slice of one accelerometer axis in G's. Use instead of self.x/y/z wherever values are
+           plotted or compared, since these hold digital counts when precision is "int16".
+
+        :argument
+        -axis: "x", "y" or "z"
+        -start, stop, step: slice of the axis to return. Whole axis if all are None.
+        """
+
+        return to_physical(getattr(self, axis)[start:stop:step], *self.scale[axis])
+
+    def read_header(self):
+        """Reads sample rate, start time and file duration from the EDF header without loading data. Used by
+           incremental runs, which only read data records added since the last run (see EpochData.EpochAccel)."""
+
+        edf_file = open_mapped(self.filepath)
+
+        self.sample_rate = int(edf_file.sample_rates[0])
+        self.starttime = edf_file.starttime + timedelta(seconds=self.start_offset/self.sample_rate)
+        self.file_dur = round(edf_file.n_samples(0) / self.sample_rate / 3600, 3)
+
+    @Profiler.timed("Import")
     def import_file(self):
 
         t0 = datetime.now()  # Gets current time
 
-        print("Importing {}...".format(self.filepath))
+        logger.info("Importing {}...".format(self.filepath))
 
         # READS IN ACCELEROMETER DATA ================================================================================
         file = pyedflib.EdfReader(self.filepath)
 
         if self.end_offset != 0:
-            print("Importing file from index {} to {}...".format(self.start_offset, self.end_offset))
-
-            self.x = file.readSignal(chn=0, start=self.start_offset, n=self.end_offset)
-            self.y = file.readSignal(chn=1, start=self.start_offset, n=self.end_offset)
-            self.z = file.readSignal(chn=2, start=self.start_offset, n=self.end_offset)
+            logger.info("Importing file from index {} to {}...".format(self.start_offset, self.end_offset))
 
         if self.end_offset == 0:
-            print("Importing file from index {} to the end...".format(self.start_offset))
+            logger.info("Importing file from index {} to the end...".format(self.start_offset))
 
-            self.x = file.readSignal(chn=0, start=self.start_offset)
-            self.y = file.readSignal(chn=1, start=self.start_offset)
-            self.z = file.readSignal(chn=2, start=self.start_offset)
+        for chn, axis in enumerate(["x", "y", "z"]):
+            data, gain, offset = read_channel(file=file, chn=chn, start=self.start_offset, n=self.end_offset,
+                                              precision=self.precision)
+            setattr(self, axis, data)
+            self.scale[axis] = (gain, offset)
 
         # Calculates gravity-subtracted vector magnitude
         # Negative values become zero
-        self.vm = np.sqrt(np.square(np.array([self.x, self.y, self.z])).sum(axis=0)) - 1
-        self.vm[self.vm < 0] = 0
+        if self.precision == "float64":
+            self.vm = np.sqrt(np.square(np.array([self.x, self.y, self.z])).sum(axis=0)) - 1
+            self.vm[self.vm < 0] = 0
 
-        self.sample_rate = file.getSampleFrequencies()[1]  # sample rate
-        self.starttime = file.getStartdatetime() + timedelta(seconds=self.start_offset/self.sample_rate)
+        if self.precision != "float64":
+            self.vm = vector_magnitude(x=self.x, y=self.y, z=self.z, scale=self.scale)
+
+        self.sample_rate = int(file.getSampleFrequencies()[1])  # sample rate
+        self.starttime = start_datetime(file) + timedelta(seconds=self.start_offset/self.sample_rate)
         self.file_dur = round(file.getFileDuration() / 3600, 3)  # Seconds --> hours
 
         # TIMESTAMP GENERATION ========================================================================================
-        t0_stamp = datetime.now()
-
-        print("\n" + "Creating timestamps...")
+        with Profiler.stage("Timestamps") as timing:
+            logger.info("Creating timestamps...")
 
-        end_time = self.starttime + timedelta(seconds=len(self.x) / self.sample_rate)
-        self.timestamps = np.asarray(pd.date_range(start=self.starttime, end=end_time, periods=len(self.x)))
+            end_time = self.starttime + timedelta(seconds=len(self.x) / self.sample_rate)
+            self.timestamps = np.asarray(pd.date_range(start=self.starttime, end=end_time, periods=len(self.x)))
 
-        t1_stamp = datetime.now()
-        stamp_time = (t1_stamp-t0_stamp).seconds
-        print("Complete ({} seconds).".format(round(stamp_time, 2)))
+        logger.info("Complete ({} seconds).".format(timing["Wall time (s)"]))
 
         t1 = datetime.now()
-        proc_time = (t1 - t0).seconds
-        print("Import complete ({} seconds).".format(round(proc_time, 2)))
+        proc_time = (t1 - t0).total_seconds()
+        logger.info("Import complete ({} seconds).".format(round(proc_time, 2)))
 
 
 class GENEActivTemperature:
@@ -103,47 +144,46 @@ class GENEActivTemperature:
         if not self.from_processed:
             self.import_file()
 
+    @Profiler.timed("Import")
     def import_file(self):
 
         t0 = datetime.now()  # Gets current time
 
-        print("Importing {}...".format(self.filepath))
+        logger.info("Importing {}...".format(self.filepath))
 
         # READS IN ACCELEROMETER DATA ================================================================================
         file = pyedflib.EdfReader(self.filepath)
 
         self.temp = file.readSignal(chn=0)
 
-        self.sample_rate = file.getSampleFrequencies()[0]  # sample rate
-        self.starttime = file.getStartdatetime() + timedelta(seconds=self.start_offset/self.sample_rate)
+        self.sample_rate = int(file.getSampleFrequencies()[0])  # sample rate
+        self.starttime = start_datetime(file) + timedelta(seconds=self.start_offset/self.sample_rate)
         self.file_dur = round(file.getFileDuration() / 3600, 3)  # Seconds --> hours
 
         # TIMESTAMP GENERATION ========================================================================================
-        t0_stamp = datetime.now()
-
-        print("\n" + "Creating timestamps...")
+        with Profiler.stage("Timestamps") as timing:
+            logger.info("Creating timestamps...")
 
-        end_time = self.starttime + timedelta(seconds=len(self.temp) * 4 / self.sample_rate)
-        self.timestamps = np.asarray(pd.date_range(start=self.starttime, end=end_time, periods=len(self.temp)))
+            end_time = self.starttime + timedelta(seconds=len(self.temp) * TEMPERATURE_DIVISOR / self.sample_rate)
+            self.timestamps = np.asarray(pd.date_range(start=self.starttime, end=end_time, periods=len(self.temp)))
 
-        t1_stamp = datetime.now()
-        stamp_time = (t1_stamp-t0_stamp).seconds
-        print("Complete ({} seconds).".format(round(stamp_time, 2)))
+        logger.info("Complete ({} seconds).".format(timing["Wall time (s)"]))
 
         t1 = datetime.now()
-        proc_time = (t1 - t0).seconds
-        print("Import complete ({} seconds).".format(round(proc_time, 2)))
+        proc_time = (t1 - t0).total_seconds()
+        logger.info("Import complete ({} seconds).".format(round(proc_time, 2)))
 
 
 class Bittium:
 
     def __init__(self, filepath, start_offset=0, end_offset=0, epoch_len=15,
-                 filter=True, low_f=1, high_f=30, f_type="bandpass"):
+                 filter=True, low_f=1, high_f=30, f_type="bandpass", precision="float64"):
 
         self.filepath = filepath
         self.start_offset = start_offset
         self.end_offset = end_offset
         self.epoch_len = epoch_len
+        self.precision = precision
 
         # Filter details
         self.filter = filter
@@ -157,6 +197,10 @@ class Bittium:
         self.timestamps = None
         self.epoch_timestamps = None
 
+        # Digital-to-physical scaling of raw. Filtered data is always physical (float32 unless precision is "float64")
+        self.raw_gain = 1
+        self.raw_offset = 0
+
         # Details
         self.sample_rate = None
         self.starttime = None
@@ -165,53 +209,63 @@ class Bittium:
         # RUNS METHODS
         self.import_file()
 
+    @Profiler.timed("Import")
     def import_file(self):
         """Method that loads voltage channel, sample rate, starttime, and file duration.
         Creates timestamp for each data point."""
 
         t0 = datetime.now()
 
-        print("\n" + "Importing {}...".format(self.filepath))
+        logger.info("Importing {}...".format(self.filepath))
 
         file = pyedflib.EdfReader(self.filepath)
 
         # READS IN ECG DATA ===========================================================================================
         if self.end_offset == 0:
-            print("Importing file from index {} to the end...".format(self.start_offset))
-            self.raw = file.readSignal(chn=0, start=self.start_offset)
+            logger.info("Importing file from index {} to the end...".format(self.start_offset))
 
         if self.end_offset != 0:
-            print("Importing file from index {} to {}...".format(self.start_offset,
-                                                                 self.start_offset + self.end_offset))
-            self.raw = file.readSignal(chn=0, start=self.start_offset, n=self.end_offset)
+            logger.info("Importing file from index {} to {}...".format(self.start_offset,
+                                                                       self.start_offset + self.end_offset))
+
+        self.raw, self.raw_gain, self.raw_offset = read_channel(file=file, chn=0, start=self.start_offset,
+                                                                n=self.end_offset, precision=self.precision)
 
-        print("ECG data import complete.")
+        logger.info("ECG data import complete.")
 
-        self.sample_rate = file.getSampleFrequencies()[0]
-        self.starttime = file.getStartdatetime() + timedelta(seconds=self.start_offset/self.sample_rate)
+        self.sample_rate = int(file.getSampleFrequencies()[0])
+        self.starttime = start_datetime(file) + timedelta(seconds=self.start_offset/self.sample_rate)
         self.file_dur = round(file.getFileDuration() / 3600, 3)
 
         # Data filtering
-        self.filtered = Filtering.filter_signal(data=self.raw, low_f=self.low_f, high_f=self.high_f,
-                                                type=self.f_type, sample_f=self.sample_rate, filter_order=3)
+        # Non-float64 data is filtered in blocks into a float32 array so raw is never upcast as a whole
+        with Profiler.stage("Filter"):
+            self.filtered = Filtering.filter_signal(data=self.raw, low_f=self.low_f, high_f=self.high_f,
+                                                    type=self.f_type, sample_f=self.sample_rate, filter_order=3,
+                                                    gain=self.raw_gain, offset=self.raw_offset)
 
         # TIMESTAMP GENERATION ========================================================================================
-        t0_stamp = datetime.now()
-
-        print("\n" + "Creating timestamps...")
+        with Profiler.stage("Timestamps") as timing:
+            logger.info("Creating timestamps...")
 
-        # Timestamps
-        end_time = self.starttime + timedelta(seconds=len(self.raw)/self.sample_rate)
-        self.timestamps = np.asarray(pd.date_range(start=self.starttime, end=end_time, periods=len(self.raw)))
-        self.epoch_timestamps = self.timestamps[::self.epoch_len * self.sample_rate]
+            # Timestamps
+            end_time = self.starttime + timedelta(seconds=len(self.raw)/self.sample_rate)
+            self.timestamps = np.asarray(pd.date_range(start=self.starttime, end=end_time, periods=len(self.raw)))
+            self.epoch_timestamps = self.timestamps[::self.epoch_len * self.sample_rate]
 
-        t1_stamp = datetime.now()
-        stamp_time = (t1_stamp - t0_stamp).seconds
-        print("Complete ({} seconds).".format(round(stamp_time, 2)))
+        logger.info("Complete ({} seconds).".format(timing["Wall time (s)"]))
 
         t1 = datetime.now()
-        proc_time = (t1 - t0).seconds
-        print("\n" + "Import complete ({} seconds).".format(round(proc_time, 2)))
+        proc_time = (t1 - t0).total_seconds()
+        logger.info("Import complete ({} seconds).".format(round(proc_time, 2)))
+
+
+def start_datetime(file):
+    """Returns the start time of an open pyedflib.EdfReader including the EDF+ subsecond start time. pyedflib stores
+       the subsecond in units of 100 ns but getStartdatetime() converts it as if it were ns, so it is read here to
+       match MappedEDF.starttime."""
+
+    return file.getStartdatetime().replace(microsecond=0) + timedelta(microseconds=file.starttime_subsecond // 10)
 
 
 def check_file(filepath, print_summary=True):
@@ -223,14 +277,255 @@ def check_file(filepath, print_summary=True):
     edf_file = pyedflib.EdfReader(filepath)
 
     ecg_duration = edf_file.getFileDuration()
-    start_time = edf_file.getStartdatetime()
+    start_time = start_datetime(edf_file)
     end_time = start_time + timedelta(seconds=edf_file.getFileDuration())
 
     if print_summary:
-        print("\n", filepath)
-        print("Sample rate: {}Hz".format(edf_file.getSampleFrequency(0)))
-        print("Start time: ", start_time)
-        print("End time:", end_time)
-        print("Duration: {} hours".format(round(ecg_duration/3600, 2)))
+        logger.info(filepath)
+        logger.info("Sample rate: {}Hz".format(edf_file.getSampleFrequency(0)))
+        logger.info("Start time: {}".format(start_time))
+        logger.info("End time: {}".format(end_time))
+        logger.info("Duration: {} hours".format(round(ecg_duration/3600, 2)))
 
     return start_time, end_time
+
+
+def read_channel(file, chn, start=0, n=0, precision="float64"):
+    """Reads one channel from an open pyedflib.EdfReader at the requested storage precision.
+
+    :argument
+    -file: pyedflib.EdfReader object
+    -chn: channel index
+    -start: index of first data point
+    -n: number of data points. Reads to end of file if 0.
+    -precision: "float64", "float32" or "int16". See PRECISIONS.
+
+    :returns
+    -data: numpy array
+    -gain, offset: digital-to-physical scaling of data. (1, 0) if data are physical values.
+    """
+
+    if precision not in PRECISIONS:
+        raise ValueError("precision must be one of {}.".format(PRECISIONS))
+
+    if n == 0:
+        n = file.getNSamples()[chn] - start
+
+    if precision == "float64":
+        return file.readSignal(chn=chn, start=start, n=n), 1, 0
+
+    digital = file.readSignal(chn=chn, start=start, n=n, digital=True)
+
+    gain = (file.getPhysicalMaximum(chn) - file.getPhysicalMinimum(chn)) / \
+           (file.getDigitalMaximum(chn) - file.getDigitalMinimum(chn))
+    offset = file.getPhysicalMaximum(chn) - gain * file.getDigitalMaximum(chn)
+
+    if precision == "int16":
+        return digital.astype(np.int16), gain, offset
+
+    # In-place scaling keeps data float32
+    data = digital.astype(np.float32)
+    data *= gain
+    data += offset
+
+    return data, 1, 0
+
+
+def to_physical(data, gain=1, offset=0):
+    """Returns physical values of data stored as digital values. Returns data unchanged if already physical."""
+
+    if gain == 1 and offset == 0:
+        return data
+
+    return data * np.float32(gain) + np.float32(offset)
+
+
+def vector_magnitude(x, y, z, scale=None, block_len=1000000):
+    """Calculates gravity-subtracted vector magnitude as float32. Negative values become zero.
+       Calculated in blocks so digital or float32 data is not upcast as a whole.
+
+    :argument
+    -x, y, z: accelerometer axes
+    -scale: dictionary of {axis: (gain, offset)}. Axes are assumed to be physical values if None.
+    -block_len: number of data points processed at a time
+
+    :returns
+    -vm: numpy array (float32)
+    """
+
+    if scale is None:
+        scale = {"x": (1, 0), "y": (1, 0), "z": (1, 0)}
+
+    vm = np.empty(len(x), dtype=np.float32)
+
+    for start in range(0, len(x), block_len):
+        end = start + block_len
+
+        sum_squares = np.zeros(len(vm[start:end]), dtype=np.float32)
+
+        for axis, data in zip(["x", "y", "z"], [x, y, z]):
+            sum_squares += np.square(to_physical(data[start:end], *scale[axis]), dtype=np.float32)
+
+        vm[start:end] = np.sqrt(sum_squares) - 1
+
+    vm[vm < 0] = 0
+
+    return vm
+
+
+class MappedEDF:
+
+    def __init__(self, filepath):
+        """Class that memory-maps the data records of an EDF file for random-access reads. Only the header is read on
+           initialization; signal data is decoded from the data records that cover the requested samples.
+
+        :argument
+        -filepath: full pathway to EDF file
+        """
+
+        self.filepath = filepath
+
+        # Header details
+        self.starttime = None
+        self.n_records = 0
+        self.record_dur = 1
+        self.labels = []
+        self.samples_per_record = []
+        self.sample_rates = []
+        self.gain = []
+        self.offset = []
+
+        self.records = None
+
+        self.read_header()
+        self.map_records()
+
+    def read_header(self):
+        """Reads the fixed-width ASCII header and signal headers. Calculates digital-to-physical scaling for each
+           signal: physical = digital * gain + offset"""
+
+        with open(self.filepath, "rb") as file:
+            header = file.read(256).decode("latin-1")
+
+            self.header_bytes = int(header[184:192])
+            self.n_records = int(header[236:244])
+            self.record_dur = float(header[244:252])
+            n_signals = int(header[252:256])
+
+            signal_header = file.read(256 * n_signals).decode("latin-1")
+
+            # First data record; its first annotation holds the EDF+ subsecond start time
+            file.seek(self.header_bytes)
+            first_record = file.read(2 * sum(int(signal_header[n_signals * 216 + i * 8:n_signals * 216 + (i + 1) * 8])
+                                             for i in range(n_signals)))
+
+        def field(start, width):
+            """Returns values of one signal header field for all signals."""
+            return [signal_header[start + i * width:start + (i + 1) * width].strip() for i in range(n_signals)]
+
+        # Field start positions are offsets of each block of n_signals fields
+        self.labels = field(0, 16)
+        phys_min = [float(i) for i in field(n_signals * 104, 8)]
+        phys_max = [float(i) for i in field(n_signals * 112, 8)]
+        dig_min = [int(i) for i in field(n_signals * 120, 8)]
+        dig_max = [int(i) for i in field(n_signals * 128, 8)]
+        self.samples_per_record = [int(i) for i in field(n_signals * 216, 8)]
+
+        self.sample_rates = [i / self.record_dur for i in self.samples_per_record]
+        self.gain = [(pmax - pmin) / (dmax - dmin) for pmin, pmax, dmin, dmax in
+                     zip(phys_min, phys_max, dig_min, dig_max)]
+        self.offset = [pmax - gain * dmax for pmax, gain, dmax in zip(phys_max, self.gain, dig_max)]
+
+        # Start date is dd.mm.yy; 1985 is the EDF clipping year
+        day, month, year = [int(i) for i in header[168:176].split(".")]
+        hour, minute, second = [int(i) for i in header[176:184].split(".")]
+        year += 1900 if year >= 85 else 2000
+
+        self.starttime = datetime(year, month, day, hour, minute, second) + \
+            timedelta(seconds=self.start_subsecond(header, first_record))
+
+    def start_subsecond(self, header, first_record):
+        """Returns the fraction of a second the recording starts after the header start time. EDF+ files store this
+           as the onset of the first time-keeping annotation (e.g. "+0.25") in the "EDF Annotations" signal; see
+           start_datetime() for files read with pyedflib. Returns 0 for EDF files.
+
+        :argument
+        -header: main header (first 256 bytes) as a string
+        -first_record: bytes of the first data record
+        """
+
+        if not header[192:236].startswith("EDF+") or "EDF Annotations" not in self.labels:
+            return 0
+
+        chn = self.labels.index("EDF Annotations")
+        start = 2 * sum(self.samples_per_record[:chn])
+
+        tal = first_record[start:start + 2 * self.samples_per_record[chn]].decode("latin-1")
+
+        try:
+            onset = float(tal.split("\x14")[0])
+        except ValueError:
+            return 0
+
+        return onset % 1
+
+    def map_records(self):
+        """Memory-maps data records as a structured array with one int16 field per signal."""
+
+        record_dtype = np.dtype([("s{}".format(i), "<i2", (n,)) for i, n in enumerate(self.samples_per_record)])
+
+        # Number of records can be -1 in header if recording was not finalized
+        n_records = (os.path.getsize(self.filepath) - self.header_bytes) // record_dtype.itemsize
+        if self.n_records < 0 or self.n_records > n_records:
+            self.n_records = n_records
+
+        self.records = np.memmap(self.filepath, dtype=record_dtype, mode="r",
+                                 offset=self.header_bytes, shape=(self.n_records, ))
+
+    def n_samples(self, chn=0):
+        """Returns number of data points in channel."""
+
+        return self.n_records * self.samples_per_record[chn]
+
+    def read_signal(self, chn=0, start=0, n=None, digital=False):
+        """Reads n data points from channel starting at index start. Only data records that cover the requested
+           samples are decoded.
+
+        :argument
+        -chn: channel index
+        -start: index of first data point
+        -n: number of data points. Reads to end of file if None.
+        -digital: returns int16 digital values if True; physical values (float64) if False
+
+        :returns
+        -data: numpy array
+        """
+
+        spr = self.samples_per_record[chn]
+
+        if n is None:
+            n = self.n_samples(chn) - start
+
+        end = min(start + n, self.n_samples(chn))
+
+        if end <= start:
+            return np.array([], dtype="<i2" if digital else np.float64)
+
+        first_record = start // spr
+        last_record = (end - 1) // spr
+
+        data = self.records["s{}".format(chn)][first_record:last_record + 1].reshape(-1)
+        data = data[start - first_record * spr:end - first_record * spr]
+
+        if digital:
+            return np.array(data)
+
+        return data * self.gain[chn] + self.offset[chn]
+
+
+@lru_cache(maxsize=16)
+def open_mapped(filepath):
+    """Returns a cached MappedEDF for filepath so repeated window reads do not re-read the header."""
+
+    return MappedEDF(filepath)
+
@@ -0,0 +1,305 @@
+import logging
+import logging.handlers
+import multiprocessing
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Package logger; module loggers are its children (e.g. "ThesisProcessing.ECG")
+LOGGER_NAME = "ThesisProcessing"
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(subject)s] %(module)s: %(message)s"
+
+# Context fields added to every log record and progress event. Set with set_context() (e.g. by Subject).
+CONTEXT = {"Subject": None}
+
+# Seconds between progress events sent by one Progress instance
+PROGRESS_INTERVAL = 5
+
+# Queue that log records and progress events are sent to from worker processes. Set by worker_init().
+QUEUE = None
+
+
+class ContextFilter(logging.Filter):
+
+    def filter(self, record):
+        """Adds context fields to a log record. Records from worker processes keep the context they were sent with."""
+
+        if not hasattr(record, "subject"):
+            record.subject = CONTEXT["Subject"] if CONTEXT["Subject"] is not None else "-"
+
+        return True
+
+
+def get_logger(name):
+    """Returns the logger of a module; use get_logger(__name__)."""
+
+    return logging.getLogger(LOGGER_NAME + "." + name)
+
+
+def set_context(**fields):
+    """Sets context fields added to log records and progress events, e.g. set_context(Subject=3028)."""
+
+    CONTEXT.update(fields)
+
+
+@contextmanager
+def context(**fields):
+    """Sets context fields inside a with block and restores the previous values afterwards, so work run for one
+       subject or chunk in this process does not tag the caller's later records.
+
+       with Logger.context(Subject=3028):
+           ...
+    """
+
+    previous = {field: CONTEXT.get(field) for field in fields}
+    CONTEXT.update(fields)
+
+    try:
+        yield
+
+    finally:
+        CONTEXT.update(previous)
+
+
+def configure(level="WARNING", logfile=None, stream=sys.stdout):
+    """Sets up the package logger. Only warnings and errors are shown unless level is lowered.
+
+    :argument
+    -level: "DEBUG", "INFO", "WARNING" or "ERROR". "INFO" shows per-step messages and model summaries.
+    -logfile: pathway of file log records are also written to. Not written if None.
+    -stream: stream log records are written to. Not used in worker processes, which send records to QUEUE.
+    """
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level)
+    logger.propagate = False
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    if QUEUE is not None:
+        handlers = [logging.handlers.QueueHandler(QUEUE)]
+
+    if QUEUE is None:
+        handlers = [logging.StreamHandler(stream)]
+
+        if logfile is not None:
+            handlers.append(logging.FileHandler(logfile))
+
+    for handler in handlers:
+        handler.addFilter(ContextFilter())
+        logger.addHandler(handler)
+
+        # Queued records are formatted by the main process's handlers
+        if QUEUE is None:
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+
+def worker_init(queue, level="WARNING"):
+    """Pool initializer for cohort runs: log records and progress events are sent to queue, where
+       CohortProgress.listen() handles them in the main process. See worker_pool().
+
+       multiprocessing.Pool(initializer=Logger.worker_init, initargs=(queue, "INFO"))
+    """
+
+    global QUEUE
+    QUEUE = queue
+
+    configure(level=level)
+
+
+@contextmanager
+def worker_pool(processes=None, n_subjects=None):
+    """multiprocessing.Pool whose workers send log records and progress events to this process. Records are handled
+       by this process's handlers and progress is combined by a CohortProgress that logs a report every interval and
+       when the pool is closed.
+
+       with Logger.worker_pool(processes=4, n_subjects=len(subjects)) as pool:
+           results = pool.map(function, subjects)
+
+    :argument
+    -processes: number of worker processes. Uses os.cpu_count() if None.
+    -n_subjects: number of subjects in the run; see CohortProgress. None if tasks are not one per subject.
+    """
+
+    queue = multiprocessing.Queue()
+
+    cohort = CohortProgress(n_subjects=n_subjects)
+    thread = cohort.listen(queue)
+
+    # Workers log at the level set in this process
+    level = logging.getLevelName(logging.getLogger(LOGGER_NAME).level)
+
+    pool = multiprocessing.Pool(processes=processes, initializer=worker_init, initargs=(queue, level))
+
+    try:
+        yield pool
+
+    finally:
+        # Workers are joined before the listener stops so their last records and events are handled
+        pool.close()
+        pool.join()
+
+        cohort.stop(queue, thread)
+
+
+class Progress:
+
+    def __init__(self, stage, total, unit="samples", interval=PROGRESS_INTERVAL):
+        """Tracks progress of one stage for one subject. Events are sent at most once per interval so tight loops
+           can call update() every iteration.
+
+        :argument
+        -stage: stage name, e.g. "Quality check"
+        -total: amount of work in the stage, in units
+        -unit: unit of total, e.g. "samples" or "epochs"
+        -interval: minimum seconds between progress events
+        """
+
+        self.stage = stage
+        self.total = total
+        self.unit = unit
+        self.interval = interval
+
+        self.done = 0
+        self.start = time.time()
+        self.last_sent = 0
+
+        self.send()
+
+    def update(self, n=1):
+        """Adds n units of completed work."""
+
+        self.done += n
+
+        if time.time() - self.last_sent >= self.interval:
+            self.send()
+
+    def finish(self):
+        """Marks the stage as complete."""
+
+        self.done = self.total
+        self.send(finished=True)
+
+    def send(self, finished=False):
+        """Sends a progress event to QUEUE (worker processes) or COHORT (main process)."""
+
+        self.last_sent = time.time()
+
+        event = {"Subject": CONTEXT["Subject"], "Stage": self.stage, "Done": self.done, "Total": self.total,
+                 "Unit": self.unit, "Start": self.start, "Time": self.last_sent, "Finished": finished}
+
+        if QUEUE is not None:
+            QUEUE.put(event)
+
+        if QUEUE is None:
+            COHORT.update(event)
+
+
+class CohortProgress:
+
+    def __init__(self, n_subjects=None, interval=30):
+        """Combines progress events from all subjects (and worker processes) into throughput and ETA per stage.
+
+        :argument
+        -n_subjects: number of subjects in the cohort. ETA only covers subjects that have started a stage if None.
+        -interval: seconds between progress reports logged at INFO level
+        """
+
+        self.n_subjects = n_subjects
+        self.interval = interval
+
+        # Latest event for each stage and subject: {stage: {subject: event}}
+        self.events = {}
+        self.last_report = time.time()
+
+    def update(self, event):
+        """Stores a progress event; logs a report if interval has passed."""
+
+        self.events.setdefault(event["Stage"], {})[event["Subject"]] = event
+
+        if time.time() - self.last_report >= self.interval:
+            self.report()
+
+    def summary(self):
+        """Returns one dictionary per stage with "Stage", "Subjects" (started), "Finished", "Done", "Total", "Unit",
+           "Throughput" (units per second since the stage first started) and "ETA (s)"."""
+
+        rows = []
+
+        for stage, subject_events in self.events.items():
+            events = list(subject_events.values())
+
+            done = sum([event["Done"] for event in events])
+            total = sum([event["Total"] for event in events])
+
+            # Subjects that have not started are assumed to be the average size
+            if self.n_subjects is not None and self.n_subjects > len(events):
+                total += (self.n_subjects - len(events)) * total / len(events)
+
+            elapsed = max([event["Time"] for event in events]) - min([event["Start"] for event in events])
+            throughput = done / elapsed if elapsed > 0 else None
+
+            rows.append({"Stage": stage, "Subjects": len(events),
+                         "Finished": sum([event["Finished"] for event in events]),
+                         "Done": done, "Total": total, "Unit": events[0]["Unit"], "Throughput": throughput,
+                         "ETA (s)": (total - done) / throughput if throughput else None})
+
+        return rows
+
+    def report(self):
+        """Logs progress of each stage at INFO level."""
+
+        self.last_report = time.time()
+
+        logger = get_logger("Progress")
+
+        for row in self.summary():
+            logger.info("{}: {}/{} subjects finished, {}% of {} ({} {}/s, ETA {} s)".format(
+                        row["Stage"], row["Finished"], row["Subjects"] if self.n_subjects is None else self.n_subjects,
+                        round(100 * row["Done"] / row["Total"], 1) if row["Total"] > 0 else 100, row["Unit"],
+                        None if row["Throughput"] is None else round(row["Throughput"]), row["Unit"],
+                        None if row["ETA (s)"] is None else round(row["ETA (s)"])))
+
+    def listen(self, queue):
+        """Handles log records and progress events sent from worker processes in a background thread.
+           Stop with stop().
+
+        :returns
+        -thread: listener thread
+        """
+
+        def handle():
+            while True:
+                item = queue.get()
+
+                if item is None:
+                    break
+
+                if isinstance(item, dict):
+                    self.update(item)
+
+                if isinstance(item, logging.LogRecord):
+                    logging.getLogger(item.name).handle(item)
+
+        thread = threading.Thread(target=handle, daemon=True)
+        thread.start()
+
+        return thread
+
+    def stop(self, queue, thread):
+        """Stops a listener thread from listen() once queued items are handled and logs a final report."""
+
+        queue.put(None)
+        thread.join()
+
+        self.report()
+
+
+# Progress of stages run in this process
+COHORT = CohortProgress()
+
+configure()
@@ -0,0 +1,196 @@
+import ModelStats
+import Logger
+import os
+import numpy as np
+import pandas as pd
+
+
+# Intensity categories in order of category code
+INTENSITIES = ("Sedentary", "Light", "Moderate", "Vigorous")
+
+
+def subject_intensities(validity_data):
+    """Returns dictionary of {model: float array of intensity categories (NaN = invalid)} from a
+       ValidData.AllDevices object. Models without data are omitted."""
+
+    intensities = {"Ankle": validity_data.ankle, "Wrist": validity_data.wrist,
+                   "HR": validity_data.hr, "HR-Acc": validity_data.hr_acc}
+
+    return {model: np.asarray(data, dtype=float) for model, data in intensities.items() if data is not None}
+
+
+def block_matrices(intensities, pairs, block_len=240, n_categories=4):
+    """Calculates a confusion matrix for each model pair in each non-overlapping block of epochs in one np.bincount
+       pass. Blocks keep runs of consecutive epochs together so resampling blocks respects autocorrelation.
+
+    :argument
+    -intensities: dictionary of {model: float array of intensity categories (NaN = invalid)}
+    -pairs: list of pair names in ModelStats.MODEL_PAIRS
+    -block_len: number of epochs per block
+    -n_categories: number of intensity categories
+
+    :returns
+    -matrices: int array with shape (n_blocks, n_pairs * n_categories ** 2)
+    """
+
+    n_epochs = min([len(data) for data in intensities.values()])
+    n_blocks = int(np.ceil(n_epochs / block_len))
+    n_pairs = len(pairs)
+
+    # Models missing for this subject have no valid epochs
+    missing = np.full(n_epochs, np.nan)
+
+    first = np.array([intensities.get(ModelStats.MODEL_PAIRS[pair][0], missing)[:n_epochs] for pair in pairs])
+    second = np.array([intensities.get(ModelStats.MODEL_PAIRS[pair][1], missing)[:n_epochs] for pair in pairs])
+
+    # Pads last block with invalid epochs, then stacks one row per block and pair
+    padding = ((0, 0), (0, n_blocks * block_len - n_epochs))
+    first = np.pad(first, padding, constant_values=np.nan).reshape(n_pairs, n_blocks, block_len)
+    second = np.pad(second, padding, constant_values=np.nan).reshape(n_pairs, n_blocks, block_len)
+
+    matrices = ModelStats.pair_matrices(first=first.transpose(1, 0, 2).reshape(n_blocks * n_pairs, block_len),
+                                        second=second.transpose(1, 0, 2).reshape(n_blocks * n_pairs, block_len),
+                                        n_categories=n_categories)
+
+    return matrices.reshape(n_blocks, n_pairs * n_categories ** 2)
+
+
+def bootstrap_chunk(subject_blocks, n_resamples, seed, resample_subjects=True, chunk=0):
+    """Draws n_resamples cohort-level bootstrap resamples.
+
+       Each resample draws blocks with replacement within each subject (and subjects with replacement if
+       resample_subjects). Draws are stored as multinomial count matrices so each subject's resampled confusion
+       matrices are a single matrix multiplication of counts and block matrices.
+
+    :argument
+    -subject_blocks: list of block matrices from block_matrices(); one per subject
+    -n_resamples: number of resamples
+    -seed: seed or numpy SeedSequence for this chunk's random generator
+    -resample_subjects: whether subjects are also resampled with replacement
+    -chunk: chunk number; identifies this chunk's log records and progress events
+
+    :returns
+    -cohort: float array with shape (n_resamples, n_pairs * n_categories ** 2) of summed confusion matrices
+    """
+
+    # Log records and progress events are tagged with the chunk; the caller's context is restored afterwards
+    with Logger.context(Subject="Chunk {}".format(chunk)):
+        progress = Logger.Progress(stage="Bootstrap", total=len(subject_blocks), unit="subjects")
+
+        rng = np.random.default_rng(seed)
+
+        n_subjects = len(subject_blocks)
+
+        if resample_subjects:
+            subject_weights = rng.multinomial(n_subjects, np.full(n_subjects, 1 / n_subjects), size=n_resamples)
+        if not resample_subjects:
+            subject_weights = np.ones((n_resamples, n_subjects))
+
+        cohort = np.zeros((n_resamples, subject_blocks[0].shape[1]))
+
+        for subject, blocks in enumerate(subject_blocks):
+            n_blocks = len(blocks)
+
+            if n_blocks == 0:
+                continue
+
+            counts = rng.multinomial(n_blocks, np.full(n_blocks, 1 / n_blocks), size=n_resamples)
+
+            cohort += subject_weights[:, subject, None] * (counts @ blocks)
+
+            progress.update()
+
+        progress.finish()
+
+    return cohort
+
+
+def agreement_statistics(matrices, epoch_len=15, n_subjects=1):
+    """Calculates agreement statistics from confusion matrices with shape (..., n_pairs, n_categories, n_categories).
+
+    :returns
+    -statistics: dictionary of {statistic name: array with shape (..., n_pairs)}. Minute differences are the mean per
+                 subject of first model minus second model.
+    """
+
+    total = matrices.sum(axis=(-2, -1))
+
+    statistics = {"Kappa": ModelStats.kappa_from_matrices(matrices),
+                  "Weighted kappa": ModelStats.kappa_from_matrices(matrices, weights="linear")}
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        statistics["Percent agreement"] = 100 * np.trace(matrices, axis1=-2, axis2=-1) / total
+
+    # Row sums are first model's epochs in each category; column sums are second model's
+    difference = (matrices.sum(axis=-1) - matrices.sum(axis=-2)) * epoch_len / 60 / n_subjects
+
+    for i, category in enumerate(INTENSITIES):
+        statistics["{} difference (minutes)".format(category)] = difference[..., i]
+
+    return statistics
+
+
+def bootstrap_agreement(subject_data, n_resamples=2000, block_len=240, epoch_len=15, confidence=95,
+                        resample_subjects=True, processes=None, seed=None):
+    """Cohort-level block bootstrap confidence intervals for kappa, weighted kappa, percent agreement and minute
+       differences between each pair of models.
+
+    :argument
+    -subject_data: list of dictionaries from subject_intensities(); one per subject
+    -n_resamples: number of bootstrap resamples
+    -block_len: number of consecutive epochs resampled together (240 = 1 hour of 15-second epochs)
+    -epoch_len: epoch length in seconds
+    -confidence: confidence interval width, %
+    -resample_subjects: whether subjects are resampled as well as blocks within subjects
+    -processes: number of worker processes. Uses os.cpu_count() if None; runs in this process if 1.
+    -seed: seed for reproducible resamples
+
+    :returns
+    -results: pandas DataFrame with one row per pair and statistic: estimate, CI lower and CI upper
+    """
+
+    models = set([model for data in subject_data for model in data])
+    pairs = [pair for pair, (model1, model2) in ModelStats.MODEL_PAIRS.items() if model1 in models and
+             model2 in models]
+    n_categories = len(INTENSITIES)
+
+    subject_blocks = [block_matrices(intensities=data, pairs=pairs, block_len=block_len, n_categories=n_categories)
+                      for data in subject_data]
+
+    # Resamples are split into chunks with independent random streams
+    n_chunks = processes if processes is not None else os.cpu_count()
+    chunk_sizes = [len(i) for i in np.array_split(np.arange(n_resamples), n_chunks) if len(i) > 0]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+
+    args = [(subject_blocks, size, chunk_seed, resample_subjects, chunk)
+            for chunk, (size, chunk_seed) in enumerate(zip(chunk_sizes, seeds))]
+
+    if processes == 1:
+        chunks = [bootstrap_chunk(*arg) for arg in args]
+
+    # Worker log records and progress events are handled in this process
+    if processes != 1:
+        with Logger.worker_pool(processes=processes) as pool:
+            chunks = pool.starmap(bootstrap_chunk, args)
+
+    resamples = np.concatenate(chunks).reshape(n_resamples, len(pairs), n_categories, n_categories)
+    observed = np.sum([blocks.sum(axis=0) for blocks in subject_blocks], axis=0).reshape(len(pairs), n_categories,
+                                                                                          n_categories)
+
+    estimates = agreement_statistics(observed, epoch_len=epoch_len, n_subjects=len(subject_data))
+    resampled = agreement_statistics(resamples, epoch_len=epoch_len, n_subjects=len(subject_data))
+
+    alpha = (100 - confidence) / 2
+
+    rows = []
+
+    for statistic in estimates:
+        lower = np.nanpercentile(resampled[statistic], alpha, axis=0)
+        upper = np.nanpercentile(resampled[statistic], 100 - alpha, axis=0)
+
+        for i, pair in enumerate(pairs):
+            rows.append({"Pair": pair, "Statistic": statistic,
+                         "Estimate": round(float(estimates[statistic][i]), 4),
+                         "CI lower": round(float(lower[i]), 4), "CI upper": round(float(upper[i]), 4)})
+
+    return pd.DataFrame(rows, columns=["Pair", "Statistic", "Estimate", "CI lower", "CI upper"])
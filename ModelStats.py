@@ -1,4 +1,17 @@
-import sklearn
+import numpy as np
+import Logger
+
+
+logger = Logger.get_logger(__name__)
+
+
+# Model pairs compared for agreement: {kappa_dict key: (model 1, model 2)}
+MODEL_PAIRS = {"AnkleAccel-WristAccel": ("Ankle", "Wrist"),
+               "AnkleAccel-HR": ("Ankle", "HR"),
+               "AnkleAccel-HRAcc": ("Ankle", "HR-Acc"),
+               "WristAccel-HR": ("Wrist", "HR"),
+               "WristAccel-HRAcc": ("Wrist", "HR-Acc"),
+               "HR-HRAcc": ("HR", "HR-Acc")}
 
 
 class Stats:
@@ -6,107 +19,215 @@ class Stats:
     def __init__(self, subject_object):
         """Class that contains results from statistical analysis."""
 
-        print()
-        print("======================================= STATISTICAL ANALYSIS ========================================")
+        logger.info("STATISTICAL ANALYSIS")
 
         self.subject_object = subject_object
 
+        # Confusion matrices for each model pair; can be summed across subjects with cohort_agreement()
+        self.confusion_all = None
+        self.confusion_accelonly = None
+
+        self.agreement_all = None
+        self.agreement_accelonly = None
+
+        # Results of the most recent cohens_kappa() call
+        self.confusion = None
+        self.agreement = None
+
         if subject_object.valid_all is not None:
-            print("\n" + "ALL DEVICES")
+            logger.info("ALL DEVICES")
             self.kappa_all = self.cohens_kappa(subject_object.valid_all)
+            self.confusion_all, self.agreement_all = self.confusion, self.agreement
         if subject_object.valid_accelonly is not None:
-            print("\n" + "ACCELEROMETER-ONLY DATA")
+            logger.info("ACCELEROMETER-ONLY DATA")
             self.kappa_accelonly = self.cohens_kappa(subject_object.valid_accelonly)
+            self.confusion_accelonly, self.agreement_accelonly = self.confusion, self.agreement
 
     def cohens_kappa(self, validity_data):
         """Calculates Cohen's kappa for all available model comparisons. Returns results in a dictionary.
+           All model pairs are compared on the same epochs: epochs in the shared validity mask where both models
+           have data.
 
         :argument
-        -subject_object: class instance of Subject class
+        -validity_data: class instance of ValidData.AllDevices or ValidData.AccelOnly
         """
 
-        kappa_dict = {"AnkleAccel-WristAccel": None,
-                      "AnkleAccel-HR": None,
-                      "AnkleAccel-HRAcc": None,
-                      "WristAccel-HR": None,
-                      "WristAccel-HRAcc": None,
-                      "HR-HRAcc": None}
-
-        # Creates data sets excluding Nones
-        if self.subject_object.wrist_filepath is not None:
-            wrist = [i for i in validity_data.wrist if i is not None]
-        if self.subject_object.wrist_filepath is None:
-            wrist = None
-
-        if self.subject_object.ankle_filepath is not None:
-            ankle = [i for i in validity_data.ankle if i is not None]
-        if self.subject_object.ankle_filepath is None:
-            ankle = None
-
-        if self.subject_object.ecg_filepath is not None:
-            hr = [i for i in validity_data.hr if i is not None]
-        if self.subject_object.ecg_filepath is None:
-            hr = None
-
-        if self.subject_object.ankle_filepath is not None and self.subject_object.ecg_filepath is not None:
-            hr_acc = [i for i in validity_data.hr_acc if i is not None]
-        if self.subject_object.ankle_filepath is None or self.subject_object.ecg_filepath is None:
-            hr_acc = None
-
-        # Ankle-Wrist comparison
-        try:
-            kappa = round(sklearn.metrics.cohen_kappa_score(y1=ankle, y2=wrist), 4)
-            kappa_dict["AnkleAccel-WristAccel"] = kappa
-
-        except (AttributeError, ValueError, TypeError):
-            kappa_dict["AnkleAccel-WristAccel"] = None
-
-        # Ankle-HR comparison
-        try:
-            kappa = round(sklearn.metrics.cohen_kappa_score(y1=ankle, y2=hr), 4)
-            kappa_dict["AnkleAccel-HR"] = kappa
-
-        except (AttributeError, ValueError, TypeError):
-            kappa_dict["AnkleAccel-HR"] = None
-
-        # Ankle-HRAcc comparison
-        try:
-            kappa = round(sklearn.metrics.cohen_kappa_score(y1=ankle, y2=hr_acc), 4)
-            kappa_dict["AnkleAccel-HRAcc"] = kappa
-
-        except (AttributeError, ValueError, TypeError):
-            kappa_dict["AnkleAccel-HRAcc"] = None
-
-        # Wrist-HR comparison
-        try:
-            kappa = round(sklearn.metrics.cohen_kappa_score(y1=wrist, y2=hr), 4)
-            kappa_dict["WristAccel-HR"] = kappa
-
-        except (AttributeError, ValueError, TypeError):
-            kappa_dict["WristAccel-HR"] = None
-
-        # Wrist-HRAcc comparison
-        try:
-            kappa = round(sklearn.metrics.cohen_kappa_score(y1=wrist, y2=hr_acc), 4)
-            kappa_dict["WristAccel-HRAcc"] = kappa
-
-        except (AttributeError, ValueError, TypeError):
-            kappa_dict["WristAccel-HRAcc"] = None
-
-        # HR-HRAcc comparison
-        try:
-            kappa = round(sklearn.metrics.cohen_kappa_score(y1=hr, y2=hr_acc), 4)
-            kappa_dict["HR-HRAcc"] = kappa
-
-        except (AttributeError, ValueError, TypeError):
-            kappa_dict["HR-HRAcc"] = None
-
-        print("\n" + "Epoch-by-epoch agreement: Cohen's Kappa")
-        print("-Ankle-Wrist: {}".format(kappa_dict["AnkleAccel-WristAccel"]))
-        print("-Ankle-HR: {}".format(kappa_dict["AnkleAccel-HR"]))
-        print("-Ankle-HRAcc: {}".format(kappa_dict["AnkleAccel-HRAcc"]))
-        print("-Wrist-HR: {}".format(kappa_dict["WristAccel-HR"]))
-        print("-Wrist-HRAcc: {}".format(kappa_dict["WristAccel-HRAcc"]))
-        print("-HR-HRAcc: {}".format(kappa_dict["HR-HRAcc"]))
+        intensities = {"Ankle": validity_data.ankle if self.subject_object.ankle_filepath is not None else None,
+                       "Wrist": validity_data.wrist if self.subject_object.wrist_filepath is not None else None,
+                       "HR": getattr(validity_data, "hr", None) if self.subject_object.ecg_filepath is not None
+                       else None,
+                       "HR-Acc": getattr(validity_data, "hr_acc", None)
+                       if self.subject_object.ankle_filepath is not None and self.subject_object.ecg_filepath is not None
+                       else None}
+
+        self.confusion = confusion_matrices(intensities=intensities,
+                                            validity=getattr(validity_data, "valid_mask", None))
+        self.agreement = agreement(self.confusion)
+
+        kappa_dict = {pair: self.agreement[pair]["Kappa"] if pair in self.agreement else None
+                      for pair in MODEL_PAIRS}
+
+        logger.info("Epoch-by-epoch agreement: Cohen's Kappa")
+        logger.info("-Ankle-Wrist: {}".format(kappa_dict["AnkleAccel-WristAccel"]))
+        logger.info("-Ankle-HR: {}".format(kappa_dict["AnkleAccel-HR"]))
+        logger.info("-Ankle-HRAcc: {}".format(kappa_dict["AnkleAccel-HRAcc"]))
+        logger.info("-Wrist-HR: {}".format(kappa_dict["WristAccel-HR"]))
+        logger.info("-Wrist-HRAcc: {}".format(kappa_dict["WristAccel-HRAcc"]))
+        logger.info("-HR-HRAcc: {}".format(kappa_dict["HR-HRAcc"]))
 
         return kappa_dict
+
+
+# ====================================================================================================================
+# ================================================= AGREEMENT ENGINE =================================================
+# ====================================================================================================================
+
+
+def confusion_matrices(intensities, validity=None, n_categories=4):
+    """Calculates confusion matrices for all available model pairs in one np.bincount pass over joint codes.
+
+    :argument
+    -intensities: dictionary of {model: intensity categories} for "Ankle", "Wrist", "HR", "HR-Acc".
+                  None = model not available; None/NaN values = no data in epoch.
+    -validity: shared boolean mask of epochs to include (True = include). All epochs are included if None.
+    -n_categories: number of intensity categories
+
+    :returns
+    -matrices: dictionary of {pair name: n_categories x n_categories int array}; rows = first model in pair
+    """
+
+    models = [model for model, data in intensities.items() if data is not None]
+    pairs = [pair for pair, (model1, model2) in MODEL_PAIRS.items() if model1 in models and model2 in models]
+
+    if len(pairs) == 0:
+        return {}
+
+    n_epochs = min([len(intensities[model]) for model in models])
+
+    if validity is not None:
+        n_epochs = min(n_epochs, len(validity))
+
+    stacked = np.array([np.array(intensities[model][:n_epochs], dtype=float) for model in models])
+
+    if validity is not None:
+        stacked[:, ~np.asarray(validity[:n_epochs], dtype=bool)] = np.nan
+
+    # Rows of first and second model in each pair
+    first = stacked[[models.index(MODEL_PAIRS[pair][0]) for pair in pairs]]
+    second = stacked[[models.index(MODEL_PAIRS[pair][1]) for pair in pairs]]
+
+    matrices = pair_matrices(first=first, second=second, n_categories=n_categories)
+
+    return {pair: matrices[i] for i, pair in enumerate(pairs)}
+
+
+def pair_matrices(first, second, n_categories=4):
+    """Calculates one confusion matrix per row of first against the same row of second in one np.bincount pass.
+       Used by confusion_matrices(), HRAccTesting.sweep_thresholds() and ModelBootstrap.block_matrices().
+
+    :argument
+    -first: float array of intensity categories with shape (n_rows, n_epochs); NaN = no data
+    -second: float array of intensity categories with shape (n_rows, n_epochs) or (n_epochs, ); NaN = no data
+    -n_categories: number of intensity categories
+
+    :returns
+    -matrices: int array with shape (n_rows, n_categories, n_categories); [row, first category, second category]
+    """
+
+    first = np.atleast_2d(first)
+    second = np.broadcast_to(second, first.shape)
+    n_rows = first.shape[0]
+
+    both = ~np.isnan(first) & ~np.isnan(second)
+
+    rows = np.broadcast_to(np.arange(n_rows)[:, None], first.shape)[both]
+    codes = rows * n_categories ** 2 + first[both].astype(int) * n_categories + second[both].astype(int)
+
+    matrices = np.bincount(codes, minlength=n_rows * n_categories ** 2)
+
+    return matrices.reshape(n_rows, n_categories, n_categories)
+
+
+def kappa_from_matrices(matrices, weights=None):
+    """Calculates Cohen's kappa from confusion matrices with shape (..., n_categories, n_categories).
+
+    :argument
+    -matrices: numpy array of one or more confusion matrices
+    -weights: None (unweighted), "linear" or "quadratic"
+
+    :returns
+    -kappa: numpy array (NaN for empty matrices or when expected agreement is 1)
+    """
+
+    matrices = np.asarray(matrices, dtype=float)
+    n_categories = matrices.shape[-1]
+
+    total = matrices.sum(axis=(-2, -1))[..., None, None]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        observed = matrices / total
+        expected = matrices.sum(axis=-1)[..., :, None] * matrices.sum(axis=-2)[..., None, :] / np.square(total)
+
+        # Disagreement weights: 1 off the diagonal when unweighted
+        categories = np.arange(n_categories)
+        distance = np.abs(categories[:, None] - categories[None, :])
+
+        if weights is None:
+            weight_matrix = (distance > 0).astype(float)
+        if weights == "linear":
+            weight_matrix = distance.astype(float)
+        if weights == "quadratic":
+            weight_matrix = np.square(distance).astype(float)
+
+        kappa = 1 - np.sum(weight_matrix * observed, axis=(-2, -1)) / np.sum(weight_matrix * expected, axis=(-2, -1))
+
+    return kappa
+
+
+def agreement(matrices):
+    """Calculates agreement statistics from confusion matrices.
+
+    :argument
+    -matrices: dictionary of {pair name: confusion matrix} from confusion_matrices() or cohort_agreement()
+
+    :returns
+    -agreement_dict: dictionary of {pair name: {"Epochs", "Kappa", "Weighted kappa", "Percent agreement"}}.
+                     Weighted kappa uses linear weights. Values are None if they cannot be calculated.
+    """
+
+    def rounded(value):
+        """Rounds to 4 decimals; NaN becomes None."""
+        return None if np.isnan(value) else round(float(value), 4)
+
+    agreement_dict = {}
+
+    for pair, matrix in matrices.items():
+        total = int(matrix.sum())
+
+        agreement_dict[pair] = {"Epochs": total,
+                                "Kappa": rounded(kappa_from_matrices(matrix)),
+                                "Weighted kappa": rounded(kappa_from_matrices(matrix, weights="linear")),
+                                "Percent agreement": rounded(100 * np.trace(matrix) / total) if total > 0 else None}
+
+    return agreement_dict
+
+
+def cohort_agreement(subject_matrices):
+    """Cohort-level agreement from per-subject confusion matrices. Matrices are summed for each model pair rather
+       than concatenating epoch data.
+
+    :argument
+    -subject_matrices: list of dictionaries of {pair name: confusion matrix} (e.g. Stats.confusion_all)
+
+    :returns
+    -matrices: dictionary of summed confusion matrices
+    -agreement_dict: see agreement()
+    """
+
+    matrices = {}
+
+    for subject in subject_matrices:
+        for pair, matrix in subject.items():
+            matrices[pair] = matrices[pair] + matrix if pair in matrices else np.array(matrix)
+
+    return matrices, agreement(matrices)
@@ -0,0 +1,224 @@
+import ImportEDF
+import RunLength
+import Logger
+import numpy as np
+
+
+logger = Logger.get_logger(__name__)
+
+
+class AccelNonWear:
+    """Detects non-wear periods from raw GENEActiv acceleration and, optionally, temperature data.
+
+       Acceleration is read from a memory-mapped EDF file one block at a time. Each window_step period is reduced to
+       per-axis sums, sums of squares, minimums and maximums; window standard deviations and ranges are combined from
+       these so processing time scales linearly with file length.
+
+       A window is non-wear if at least n_axes axes have SD < sd_thresh and range < range_thresh
+       (van Hees et al., 2011). If temperature data is given, the mean temperature during the window must also be
+       below temp_thresh. A step is non-wear if any window that contains it is non-wear.
+
+       van Hees, V. et al. (2011). Estimation of Daily Energy Expenditure in Pregnant and Non-Pregnant Women Using a
+       Wrist-Worn Tri-Axial Accelerometer. PLoS ONE. 6(7). e22922.
+    """
+
+    def __init__(self, accel_filepath, epoch_timestamps=None, temperature_filepath=None,
+                 window_len=60, window_step=15, sd_thresh=0.013, range_thresh=0.05, n_axes=2, temp_thresh=25,
+                 block_steps=24):
+        """
+        :argument
+        -accel_filepath: full pathway to GENEActiv accelerometer EDF file
+        -epoch_timestamps: timestamp for start of each epoch. Wear status is calculated for each epoch if given.
+        -temperature_filepath: full pathway to GENEActiv temperature EDF file. Temperature is not used if None.
+        -window_len: window length in minutes
+        -window_step: step between windows in minutes. window_len must be a multiple of window_step.
+        -sd_thresh: SD threshold, G
+        -range_thresh: range threshold, G
+        -n_axes: number of axes that need to meet both thresholds
+        -temp_thresh: temperature threshold, degrees C
+        -block_steps: number of steps read from the file at a time
+        """
+
+        self.accel_filepath = accel_filepath
+        self.temperature_filepath = temperature_filepath
+
+        self.window_len = window_len
+        self.window_step = window_step
+        self.sd_thresh = sd_thresh
+        self.range_thresh = range_thresh
+        self.n_axes = n_axes
+        self.temp_thresh = temp_thresh
+        self.block_steps = block_steps
+
+        self.sample_rate = None
+        self.step_timestamps = None
+        self.step_nonwear = None
+        self.epoch_nonwear = None
+        self.wear_status = None
+        self.report = {"Non-wear hours": 0, "Non-wear %": 0, "Non-wear periods": 0,
+                       "Longest non-wear period (minutes)": 0}
+
+        # RUNS METHODS ===============================================================================================
+        self.step_timestamps, step_stats = self.calculate_step_stats()
+        self.step_nonwear = self.detect_nonwear(step_stats=step_stats)
+
+        if epoch_timestamps is not None:
+            self.epoch_nonwear = self.mark_epochs(epoch_timestamps=epoch_timestamps)
+            self.wear_status = ~self.epoch_nonwear
+
+        self.report = self.generate_report()
+
+    def calculate_step_stats(self):
+        """Reads acceleration in blocks of whole steps and reduces each step to per-axis sum, sum of squares,
+           minimum and maximum.
+
+        :returns
+        -step_timestamps: numpy datetime64 array of the start of each step
+        -step_stats: dictionary of arrays with shape (n_steps, 3) for "Sum", "Sum squares", "Min", "Max" and
+                     array of "Samples" per step
+        """
+
+        edf_file = ImportEDF.open_mapped(self.accel_filepath)
+
+        self.sample_rate = edf_file.sample_rates[0]
+        n_samples = edf_file.n_samples(0)
+
+        step_samples = int(self.window_step * 60 * self.sample_rate)
+        n_steps = int(np.ceil(n_samples / step_samples))
+
+        step_stats = {"Sum": np.zeros((n_steps, 3)), "Sum squares": np.zeros((n_steps, 3)),
+                      "Min": np.zeros((n_steps, 3)), "Max": np.zeros((n_steps, 3)),
+                      "Samples": np.zeros(n_steps)}
+
+        block_samples = step_samples * self.block_steps
+
+        for block_start in range(0, n_samples, block_samples):
+            first_step = block_start // step_samples
+
+            for axis in range(3):
+                data = edf_file.read_signal(chn=axis, start=block_start, n=block_samples)
+
+                # Pads final partial step with NaN so all steps reshape to the same length
+                n_block_steps = int(np.ceil(len(data) / step_samples))
+                padded = np.full(n_block_steps * step_samples, np.nan)
+                padded[:len(data)] = data
+                padded = padded.reshape(n_block_steps, step_samples)
+
+                steps = slice(first_step, first_step + n_block_steps)
+
+                step_stats["Sum"][steps, axis] = np.nansum(padded, axis=1)
+                step_stats["Sum squares"][steps, axis] = np.nansum(np.square(padded), axis=1)
+                step_stats["Min"][steps, axis] = np.nanmin(padded, axis=1)
+                step_stats["Max"][steps, axis] = np.nanmax(padded, axis=1)
+
+                if axis == 0:
+                    step_stats["Samples"][steps] = np.sum(~np.isnan(padded), axis=1)
+
+        step_timestamps = np.datetime64(edf_file.starttime, "ns") + \
+            (np.arange(n_steps) * self.window_step * 60 * 10**9).astype("timedelta64[ns]")
+
+        return step_timestamps, step_stats
+
+    def detect_nonwear(self, step_stats):
+        """Combines steps into windows and applies the SD/range (and temperature) criteria.
+
+        :returns
+        -step_nonwear: boolean array; True = step is non-wear
+        """
+
+        steps_per_window = int(self.window_len / self.window_step)
+        n_steps = len(step_stats["Samples"])
+        n_windows = max(n_steps - steps_per_window + 1, 0)
+
+        if n_windows == 0:
+            return np.zeros(n_steps, dtype=bool)
+
+        def window_sum(data):
+            """Sums data over each window of steps_per_window steps using a cumulative sum."""
+            cumulative = np.concatenate((np.zeros((1, ) + data.shape[1:]), np.cumsum(data, axis=0)))
+            return cumulative[steps_per_window:] - cumulative[:-steps_per_window]
+
+        n = window_sum(step_stats["Samples"])[:, None]
+        sums = window_sum(step_stats["Sum"])
+        sum_squares = window_sum(step_stats["Sum squares"])
+
+        sd = np.sqrt(np.clip((sum_squares - np.square(sums) / n) / (n - 1), 0, None))
+
+        # Window minimum and maximum from a sliding view over steps
+        window_index = np.arange(n_windows)[:, None] + np.arange(steps_per_window)[None, :]
+        value_range = step_stats["Max"][window_index].max(axis=1) - step_stats["Min"][window_index].min(axis=1)
+
+        window_nonwear = np.sum((sd < self.sd_thresh) & (value_range < self.range_thresh), axis=1) >= self.n_axes
+
+        if self.temperature_filepath is not None:
+            window_nonwear &= self.window_temperature(n_windows=n_windows,
+                                                      steps_per_window=steps_per_window) < self.temp_thresh
+
+        # Step is non-wear if any window containing it is non-wear
+        step_nonwear = np.convolve(window_nonwear.astype(int), np.ones(steps_per_window, dtype=int)) > 0
+
+        return step_nonwear[:n_steps]
+
+    def window_temperature(self, n_windows, steps_per_window):
+        """Calculates mean temperature during each window. Windows without temperature data are not excluded
+           (returned as -inf)."""
+
+        edf_file = ImportEDF.open_mapped(self.temperature_filepath)
+
+        temperature = edf_file.read_signal(chn=0)
+        temp_rate = edf_file.sample_rates[0] / ImportEDF.TEMPERATURE_DIVISOR
+
+        temp_times = (np.datetime64(edf_file.starttime, "ns") +
+                      (np.arange(len(temperature)) / temp_rate * 10**9).astype("timedelta64[ns]")).astype(np.int64)
+
+        # Index of first temperature sample in each step and after the last step
+        step_edges = np.concatenate((self.step_timestamps.astype(np.int64),
+                                     [self.step_timestamps[-1].astype(np.int64) + int(self.window_step * 60 * 10**9)]))
+        edge_index = np.searchsorted(temp_times, step_edges, side="left")
+
+        cumulative = np.concatenate(([0], np.cumsum(temperature)))
+
+        window_start = edge_index[:n_windows]
+        window_end = edge_index[steps_per_window:steps_per_window + n_windows]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            window_mean = (cumulative[window_end] - cumulative[window_start]) / (window_end - window_start)
+
+        window_mean[np.isnan(window_mean)] = -np.inf
+
+        return window_mean
+
+    def mark_epochs(self, epoch_timestamps):
+        """Maps step non-wear status onto epoch timestamps. Epochs outside the file are marked as non-wear.
+
+        :returns
+        -epoch_nonwear: boolean array; True = epoch is non-wear
+        """
+
+        epoch_times = np.asarray(epoch_timestamps, dtype="datetime64[ns]").astype(np.int64)
+        step_times = self.step_timestamps.astype(np.int64)
+
+        step_index = np.searchsorted(step_times, epoch_times, side="right") - 1
+
+        in_file = (step_index >= 0) & (step_index < len(self.step_nonwear))
+
+        epoch_nonwear = np.ones(len(epoch_times), dtype=bool)
+        epoch_nonwear[in_file] = self.step_nonwear[step_index[in_file]]
+
+        return epoch_nonwear
+
+    def generate_report(self):
+        """Summary of non-wear time from step data."""
+
+        nonwear_runs = RunLength.run_summary(data=self.step_nonwear, value=True, epoch_len=self.window_step * 60)
+
+        report = {"Non-wear hours": round(np.sum(self.step_nonwear) * self.window_step / 60, 2),
+                  "Non-wear %": round(100 * np.mean(self.step_nonwear), 1) if len(self.step_nonwear) > 0 else 0,
+                  "Non-wear periods": nonwear_runs["Runs"],
+                  "Longest non-wear period (minutes)": nonwear_runs["Longest (minutes)"]}
+
+        logger.info("Non-wear detection ({}): {} hours ({}%) in {} periods.".format(
+             self.accel_filepath.split("/")[-1], report["Non-wear hours"], report["Non-wear %"],
+             report["Non-wear periods"]))
+
+        return report
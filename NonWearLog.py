@@ -1,8 +1,15 @@
 import numpy as np
-from datetime import datetime
-from datetime import timedelta
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+import Logger
+import Timestamps
+
+
+logger = Logger.get_logger(__name__)
+
+
+# Sensor columns in removal log: left/right ankle, left/right wrist, heart rate (ECG)
+SENSORS = ("LA", "RA", "LW", "RW", "HR")
 
 
 class NonWear:
@@ -22,10 +29,19 @@ class NonWear:
         self.accel_object = accel_object
         self.plot = plot
 
+        self.removal_data = None
+
+        # Removal intervals for each sensor as sorted int64 (ns) start and end times: {sensor: (starts, ends)}
+        self.intervals = None
+
+        # Boolean array of shape (len(SENSORS), number of epochs). True = sensor worn during epoch.
+        self.wear_status = None
+
         self.removal_log = self.import_nonwearlog()
 
         if self.removal_log is not None:
             self.removal_data = self.format_removallog()
+            self.intervals = self.create_intervals()
             self.wear_status = self.mark_removal_epochs()
 
             if self.plot:
@@ -38,63 +54,94 @@ class NonWear:
         # Imports log if file is found
         try:
             removal_log = np.loadtxt(fname="{}/{}_SensRemLog.csv".format(self.file_loc, self.subjectID),
-                                     delimiter=",", dtype="str", skiprows=1, usecols=(3, 4, 5, 6, 7, 8, 9))
+                                     delimiter=",", dtype="str", skiprows=1, usecols=(3, 4, 5, 6, 7, 8, 9, 10),
+                                     ndmin=2)
 
         # Returns None if no log found
         except OSError:
-            print("\n" + "No removal log found.")
+            logger.info("No removal log found.")
             return None
 
         return removal_log
 
     def format_removallog(self):
-        """Formats timestamps for removal data. Returns a list of lists where each list is one day's worth of data.
-           Values correspond to removal and reattachment times."""
+        """Formats timestamps for removal data with one vectorized parse per column.
+
+        :returns
+        -removal_data: dictionary of "Removed" and "Reattached" (numpy datetime64 arrays; NaT if no data in cell)
+                       and a boolean array for each sensor of whether that sensor was removed
+        """
+
+        dates = np.char.strip(self.removal_log[:, 0])
+
+        removal_data = {}
 
-        all_data = []
+        for column, key in zip([1, 2], ["Removed", "Reattached"]):
+            stamps = np.char.add(np.char.add(dates, " "), np.char.strip(self.removal_log[:, column]))
+            removal_data[key] = Timestamps.parse_timestamps(stamps, fmt="%Y%b%d %H:%M")
 
-        # Loops through each day of data
-        for day in self.removal_log:
-            day_data = []
+        # Any entry other than blank/no in a sensor column marks that sensor as removed
+        sensor_flags = ~np.isin(np.char.lower(np.char.strip(self.removal_log[:, 3:3 + len(SENSORS)])),
+                                ["", "0", "n", "no", "n/a", "nan", "false"])
 
-            # Formats date stamp
-            date = datetime.strptime(day[0], "%Y%b%d").date()
+        # Rows without any sensor marked apply to all sensors
+        sensor_flags[~sensor_flags.any(axis=1)] = True
 
-            # Loops through other values for each day
-            for value in range(1, len(day)):
+        for i, sensor in enumerate(SENSORS):
+            removal_data[sensor] = sensor_flags[:, i]
 
-                # Formatting
-                try:
-                    # Combines date + time
-                    datestamp = datetime.strptime(str(date) + " " + day[value], "%Y-%m-%d %H:%M")
+        return removal_data
 
-                    # Extracts hour of day (integer)
-                    hour_of_day = datetime.strptime(day[value], "%H:%M").hour
+    def create_intervals(self):
+        """Converts removal periods for each sensor to sorted int64 start and end boundaries. Periods without both a
+           removal and reattachment time are ignored.
 
-                # Error handling if no data in cell
-                except ValueError:
-                    datestamp = "N/A"
+        :returns
+        -intervals: dictionary of {sensor: (starts, ends)}
+        """
 
-                day_data.append(datestamp)
+        removed = self.removal_data["Removed"]
+        reattached = self.removal_data["Reattached"]
 
-            all_data.append(day_data)
+        complete = ~np.isnat(removed) & ~np.isnat(reattached)
 
-        return all_data
+        intervals = {}
+
+        for sensor in SENSORS:
+            rows = complete & self.removal_data[sensor]
+
+            intervals[sensor] = (np.sort(removed[rows].astype(np.int64)), np.sort(reattached[rows].astype(np.int64)))
+
+        return intervals
 
     def mark_removal_epochs(self):
-        """Generates binary list for each epoch of whether device was worn on not. 1 = not worn."""
-        epoch_index = 0
+        """Generates boolean array for each sensor of whether device was worn during each epoch.
+           An epoch is not worn if removal time <= epoch timestamp <= reattachment time for any period.
+
+        :returns
+        -wear_status: boolean array of shape (len(SENSORS), number of epochs). True = worn.
+        """
+
+        epoch_times = np.asarray(self.accel_object.epoch.timestamps, dtype="datetime64[ns]").astype(np.int64)
+
+        wear_status = np.ones((len(SENSORS), len(epoch_times)), dtype=bool)
+
+        for i, sensor in enumerate(SENSORS):
+            starts, ends = self.intervals[sensor]
+
+            # Number of removal periods that contain each epoch
+            n_removed = np.searchsorted(starts, epoch_times, side="right") - \
+                np.searchsorted(ends, epoch_times, side="left")
+
+            wear_status[i] = n_removed <= 0
 
-        # Creates list of 0s corresponding to each epoch
-        epoch_list = np.zeros(len(self.accel_object.epoched.epoch))
+        return wear_status
 
-        for i, epoch_stamp in enumerate(self.accel_object.epoched.epoch_timestamps):
-            for removal in self.removal_data:
-                if removal[0] != "N/A" and removal[1] != "N/A":
-                    if removal[0] <= epoch_stamp <= removal[1]:
-                        epoch_list[i] = 1
+    def sensor_mask(self, sensor):
+        """Returns boolean wear status (True = worn) for one sensor in SENSORS. Can be passed to
+           ValidData.AllDevices.add_mask()."""
 
-        return epoch_list
+        return self.wear_status[SENSORS.index(sensor)]
 
     def plot_sleeplog(self):
         """Plots epoched accelerometer data with vertical lines marking removal log data"""
@@ -108,25 +155,23 @@ class NonWear:
 
         plt.title("Subject {}: Removal Log Data".format(self.subjectID))
 
-        ax1.plot(self.accel_object.epoched.epoch_timestamps[0:len(self.accel_object.epoched.epoch)],
-                 self.accel_object.epoched.epoch[0:len(self.accel_object.epoched.epoch_timestamps)], color='black')
+        ax1.plot(self.accel_object.epoch.timestamps[0:len(self.accel_object.epoch.svm)],
+                 self.accel_object.epoch.svm[0:len(self.accel_object.epoch.timestamps)], color='black')
 
         plt.ylabel("Counts")
         ax1.xaxis.set_major_formatter(xfmt)
         ax1.xaxis.set_major_locator(locator)
         plt.xticks(rotation=45, fontsize=8)
 
-        for removal in self.removal_data:
-            if removal[0] != "N/A":
-                plt.axvline(x=removal[0], color="red", label="Removed")
-            if removal[1] != "N/A":
-                plt.axvline(x=removal[1], color="green", label="Re-attached")
+        for removed in self.removal_data["Removed"][~np.isnat(self.removal_data["Removed"])]:
+            plt.axvline(x=removed, color="red", label="Removed")
+        for reattached in self.removal_data["Reattached"][~np.isnat(self.removal_data["Reattached"])]:
+            plt.axvline(x=reattached, color="green", label="Re-attached")
 
-        # Fills in region where participant was asleep
-        for removal in self.removal_data:
-            try:
-                plt.fill_betweenx(x1=removal[0], x2=removal[1], y=np.arange(0, max(self.accel_object.epoched.epoch)),
-                                  color='red', alpha=0.35)
+        # Fills in region where device was removed
+        complete = ~np.isnat(self.removal_data["Removed"]) & ~np.isnat(self.removal_data["Reattached"])
 
-            except AttributeError:
-                pass
+        for removed, reattached in zip(self.removal_data["Removed"][complete],
+                                       self.removal_data["Reattached"][complete]):
+            plt.fill_betweenx(x1=removed, x2=reattached, y=np.arange(0, max(self.accel_object.epoch.svm)),
+                              color='red', alpha=0.35)
@@ -61,11 +61,11 @@ class Data:
         fig, (ax1, ax2, ax3) = plt.subplots(3, sharex='col', figsize=(10, 7))
 
         # Raw accelerometer
-        ax1.plot(self.accel_raw.timestamps[::3], self.accel_raw.x[::3], color='purple',
+        ax1.plot(self.accel_raw.timestamps[::3], self.accel_raw.physical("x", step=3), color='purple',
                  label="X ({}Hz)".format(int(self.accel_raw.sample_rate / 3)))
-        ax1.plot(self.accel_raw.timestamps[::3], self.accel_raw.y[::3], color='blue',
+        ax1.plot(self.accel_raw.timestamps[::3], self.accel_raw.physical("y", step=3), color='blue',
                  label="Y ({}Hz)".format(int(self.accel_raw.sample_rate / 3)))
-        ax1.plot(self.accel_raw.timestamps[::3], self.accel_raw.z[::3], color='black',
+        ax1.plot(self.accel_raw.timestamps[::3], self.accel_raw.physical("z", step=3), color='black',
                  label="Z ({}Hz)".format(int(self.accel_raw.sample_rate / 3)))
         ax1.legend(loc='upper left')
         ax1.set_ylabel("G")
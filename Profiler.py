@@ -0,0 +1,225 @@
+import csv
+import json
+import time
+import sys
+from contextlib import contextmanager
+from functools import wraps
+import pandas as pd
+import Logger
+
+# Not available on Windows; peak RSS is then only available from /proc
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+logger = Logger.get_logger(__name__)
+
+
+# Columns of each stage record
+FIELDNAMES = ["Stage", "Depth", "Wall time (s)", "CPU time (s)", "Peak RSS (MB)", "RSS change (MB)"]
+
+
+def current_rss_mb():
+    """Current resident set size in MB. Uses /proc on Linux; returns peak RSS elsewhere."""
+
+    try:
+        with open("/proc/self/status", "r") as infile:
+            for line in infile:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except (IOError, OSError):
+        pass
+
+    return max_rss_mb()
+
+
+def max_rss_mb():
+    """Peak resident set size of the process in MB. Uses the resettable high-water mark on Linux."""
+
+    try:
+        with open("/proc/self/status", "r") as infile:
+            for line in infile:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except (IOError, OSError):
+        pass
+
+    if resource is None:
+        return 0
+
+    # ru_maxrss is in bytes on macOS and KB on Linux
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return max_rss / 1024 / 1024 if sys.platform == "darwin" else max_rss / 1024
+
+
+def reset_peak_rss():
+    """Resets the RSS high-water mark so each stage's peak can be measured (Linux only).
+       Returns whether it was reset."""
+
+    try:
+        with open("/proc/self/clear_refs", "w") as outfile:
+            outfile.write("5")
+        return True
+    except (IOError, OSError):
+        return False
+
+
+class Profile:
+
+    def __init__(self, name=None):
+        """Class that records wall time, CPU time and peak memory of processing stages.
+
+        :argument
+        -name: name of profile (e.g. subject ID)
+        """
+
+        self.name = name
+
+        # One dictionary per stage in order of start time; see FIELDNAMES
+        self.stages = []
+
+        # Stages in progress: [stage name, running peak RSS]
+        self.stack = []
+
+    @contextmanager
+    def stage(self, stage_name):
+        """Context manager that records a stage. Stages can be nested; nested stage names are joined with "/".
+           Yields the stage record, which is filled in when the stage ends.
+
+        If the RSS high-water mark cannot be reset, peak RSS is the process peak at the end of the stage.
+        """
+
+        # Parent's peak so far is kept before the high-water mark is reset
+        if len(self.stack) > 0:
+            self.stack[-1][1] = max(self.stack[-1][1], max_rss_mb())
+
+        reset_peak_rss()
+
+        record = {"Stage": "/".join([stage[0] for stage in self.stack] + [stage_name]), "Depth": len(self.stack)}
+        self.stages.append(record)
+        self.stack.append([stage_name, 0])
+
+        rss_start = current_rss_mb()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+
+        try:
+            yield record
+
+        finally:
+            peak = max(self.stack.pop()[1], max_rss_mb())
+
+            record["Wall time (s)"] = round(time.perf_counter() - wall_start, 3)
+            record["CPU time (s)"] = round(time.process_time() - cpu_start, 3)
+            record["Peak RSS (MB)"] = round(peak, 1)
+            record["RSS change (MB)"] = round(current_rss_mb() - rss_start, 1)
+
+            if len(self.stack) > 0:
+                self.stack[-1][1] = max(self.stack[-1][1], peak)
+
+    def timed(self, stage_name):
+        """Decorator version of stage()."""
+
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(stage_name):
+                    return function(*args, **kwargs)
+            return wrapper
+
+        return decorator
+
+    def summary(self):
+        """Prints wall time, CPU time and peak RSS of each stage."""
+
+        logger.info("Processing profile{}:".format("" if self.name is None else " ({})".format(self.name)))
+
+        for record in self.stages:
+            logger.info("{}-{}: {} s wall, {} s CPU, {} MB peak".format("  " * record["Depth"],
+                                                                        record["Stage"].split("/")[-1],
+                                                                        record["Wall time (s)"], record["CPU time (s)"],
+                                                                        record["Peak RSS (MB)"]))
+
+    def write(self, file_prefix):
+        """Writes stage records to file_prefix + "_Profile.json" and file_prefix + "_Profile.csv"."""
+
+        with open(file_prefix + "_Profile.json", "w") as outfile:
+            json.dump({"Name": self.name, "Stages": self.stages}, outfile, indent=4, default=str)
+
+        with open(file_prefix + "_Profile.csv", "w") as outfile:
+            writer = csv.DictWriter(outfile, fieldnames=FIELDNAMES, lineterminator="\n")
+            writer.writeheader()
+            writer.writerows(self.stages)
+
+        logger.info("Complete. File {} saved.".format(file_prefix + "_Profile.json"))
+
+
+# Profile that module-level stage() and timed() record to. Set with set_active() (e.g. by Subject).
+ACTIVE = Profile()
+
+
+def set_active(profile):
+    """Sets the profile that stage() and timed() record to."""
+
+    global ACTIVE
+    ACTIVE = profile
+
+
+@contextmanager
+def stage(stage_name):
+    """Records a stage in the active profile. See Profile.stage()."""
+
+    with ACTIVE.stage(stage_name) as record:
+        yield record
+
+
+def timed(stage_name):
+    """Decorator that records a function as a stage in the profile that is active when it is called."""
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def aggregate_profiles(filepaths):
+    """Combines profiles written by Profile.write() from a cohort run.
+
+    :argument
+    -filepaths: list of "_Profile.json" files
+
+    :returns
+    -stages: pandas DataFrame of all stage records with a "Name" column
+    -summary: pandas DataFrame with one row per stage: number of runs and total/mean/max wall time, total CPU time and
+              mean/max peak RSS; sorted by total wall time
+    """
+
+    records = []
+
+    for filepath in filepaths:
+        with open(filepath, "r") as infile:
+            profile = json.load(infile)
+
+        for record in profile["Stages"]:
+            records.append(dict(record, Name=profile["Name"]))
+
+    stages = pd.DataFrame(records, columns=["Name"] + FIELDNAMES)
+
+    grouped = stages.groupby("Stage")
+
+    summary = pd.DataFrame({"Runs": grouped["Name"].count(),
+                            "Total wall time (s)": grouped["Wall time (s)"].sum(),
+                            "Mean wall time (s)": grouped["Wall time (s)"].mean().round(3),
+                            "Max wall time (s)": grouped["Wall time (s)"].max(),
+                            "Total CPU time (s)": grouped["CPU time (s)"].sum(),
+                            "Mean peak RSS (MB)": grouped["Peak RSS (MB)"].mean().round(1),
+                            "Max peak RSS (MB)": grouped["Peak RSS (MB)"].max()})
+
+    return stages, summary.sort_values(by="Total wall time (s)", ascending=False)
@@ -0,0 +1,212 @@
+import ROC
+import ECG
+import numpy as np
+import pandas as pd
+
+
+# Columns of rows written by QualityCheckValidation.qc_check(). Rows written before features were stored unrounded
+# have HR, Max RR Interval, RR Ratio and Voltage Range rounded to 0.1; see recompute_features().
+QC_COLUMNS = ("ID", "Index", "Valid Period",
+              "HR Valid", "HR", "Max RR Interval Valid", "Max RR Interval", "RR Ratio Valid", "RR Ratio",
+              "Voltage Range Valid", "Voltage Range", "Correlation Valid", "Correlation", "ExpertDecision")
+
+# Thresholds tested for each rule in ROC.RULES: 9 x 8 x 9 x 11 x 9 x 9 = 577,368 combinations
+DEFAULT_GRIDS = {"HR Min": np.arange(30, 52.5, 2.5),
+                 "HR Max": np.arange(150, 230, 10),
+                 "Max RR Interval": np.arange(2, 4.25, 0.25),
+                 "RR Ratio": np.arange(1.5, 4.25, 0.25),
+                 "Voltage Range": np.arange(100, 550, 50),
+                 "Correlation": np.arange(0.5, 0.95, 0.05)}
+
+# Number of set bits in each byte value
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def load_labelled(filepath, header=False, raw_edf_folder=None, epoch_len=15):
+    """Reads expert-labelled windows written by QualityCheckValidation.qc_check().
+
+    :argument
+    -filepath: .csv file of qc_check() rows, or .xlsx tracking sheet with QC_COLUMNS headers
+    -header: whether the .csv file has a header row
+    -raw_edf_folder: folder of raw ECG EDF files. If given, features are re-calculated from the raw data so windows
+                     near a threshold are not misclassified by rounded values; see recompute_features().
+    -epoch_len: window length in seconds used by qc_check()
+
+    :returns
+    -data: pandas DataFrame with QC_COLUMNS. Features of windows with too few beats are NaN.
+    """
+
+    if filepath.endswith(".csv"):
+        data = pd.read_csv(filepath_or_buffer=filepath, header=0 if header else None,
+                           names=None if header else list(QC_COLUMNS))
+    else:
+        data = pd.read_excel(io=filepath, header=0, index_col=None)
+
+    for column in ("HR", "Max RR Interval", "RR Ratio", "Voltage Range", "Correlation"):
+        data[column] = pd.to_numeric(data[column], errors="coerce")
+
+    if raw_edf_folder is not None:
+        data = recompute_features(data=data, raw_edf_folder=raw_edf_folder, epoch_len=epoch_len)
+
+    return data
+
+
+def recompute_features(data, raw_edf_folder, epoch_len=15):
+    """Re-runs the quality check on each labelled window to get unrounded rule values. Each window is read from the
+       raw EDF file exactly as qc_check() read it, so values match what the expert was shown.
+
+    :argument
+    -data: pandas DataFrame with "ID" and "Index" (start index of window in file)
+    -raw_edf_folder: folder of raw ECG EDF files (OND07_WTL_<ID>_01_BF.EDF)
+    -epoch_len: window length in seconds
+
+    :returns
+    -data: copy of data with HR, Max RR Interval, RR Ratio, Voltage Range and Correlation replaced
+    """
+
+    features = []
+
+    for subjectID, start_index in zip(data["ID"], data["Index"]):
+        window = ECG.ECGWindow(filepath=raw_edf_folder + "OND07_WTL_{}_01_BF.EDF".format(subjectID),
+                               start_index=int(start_index), epoch_len=epoch_len)
+
+        features.append(ECG.CheckQuality(ecg_object=window, start_index=0, epoch_len=epoch_len).features())
+
+    features = np.array(features, dtype=ECG.FEATURE_DTYPE)
+
+    data = data.copy()
+
+    for column in ("HR", "Max RR Interval", "RR Ratio", "Voltage Range", "Correlation"):
+        data[column] = features[column]
+
+    return data
+
+
+def pass_matrices(data, grids):
+    """Calculates whether each window passes each rule at each grid threshold. Windows are packed 8 per byte so
+       combinations of rules are evaluated with bytewise AND.
+
+    :argument
+    -data: pandas DataFrame from load_labelled()
+    -grids: dictionary of {rule in ROC.RULES: 1-D array of thresholds}
+
+    :returns
+    -packed: dictionary of {rule: uint8 array with shape (n_thresholds, n_bytes)}
+    """
+
+    packed = {}
+
+    for rule, thresholds in grids.items():
+        feature, comparison, default = ROC.RULES[rule]
+
+        values = np.asarray(data[feature], dtype=float)
+
+        with np.errstate(invalid="ignore"):
+            passes = getattr(np, comparison)(values[None, :], np.asarray(thresholds, dtype=float)[:, None])
+
+        packed[rule] = np.packbits(passes, axis=1)
+
+    return packed
+
+
+def grid_search(data, grids=None, expert_col="ExpertDecision", chunk_size=50000):
+    """Evaluates every combination of rule thresholds against expert decisions.
+
+       Rule passes are calculated once per rule and threshold. Combinations are evaluated in chunks: the packed pass
+       rows for each rule are combined with bytewise AND, and true/false positives are counted with a popcount
+       lookup table, so run time scales with n_combinations x n_windows / 8.
+
+    :argument
+    -data: pandas DataFrame from load_labelled()
+    -grids: dictionary of {rule in ROC.RULES: 1-D array of thresholds}. Rules not in grids use their default
+            threshold. Uses DEFAULT_GRIDS if None.
+    -expert_col: column of expert decisions (1 = valid)
+    -chunk_size: number of combinations evaluated at once
+
+    :returns
+    -results: pandas DataFrame with one row per combination: threshold of each rule, "Sensitivity", "Specificity"
+              and "Distance" (distance to top-left corner of ROC space)
+    """
+
+    grids = dict(DEFAULT_GRIDS) if grids is None else dict(grids)
+
+    for rule, (feature, comparison, default) in ROC.RULES.items():
+        if rule not in grids:
+            grids[rule] = np.array([default])
+
+    rules = list(grids.keys())
+    shape = tuple(len(grids[rule]) for rule in rules)
+    n_combinations = int(np.prod(shape))
+
+    packed = pass_matrices(data=data, grids=grids)
+
+    expert = np.asarray(data[expert_col]).astype(bool)
+    expert_pos = np.packbits(expert)
+    expert_neg = np.packbits(~expert)
+
+    n_pos = np.sum(expert)
+    n_neg = np.sum(~expert)
+
+    true_pos = np.zeros(n_combinations, dtype=np.int64)
+    false_pos = np.zeros(n_combinations, dtype=np.int64)
+
+    for chunk_start in range(0, n_combinations, chunk_size):
+        combinations = np.arange(chunk_start, min(chunk_start + chunk_size, n_combinations))
+        threshold_index = np.unravel_index(combinations, shape)
+
+        passed = packed[rules[0]][threshold_index[0]]
+
+        for rule, index in zip(rules[1:], threshold_index[1:]):
+            passed = passed & packed[rule][index]
+
+        true_pos[combinations] = POPCOUNT[passed & expert_pos].sum(axis=1)
+        false_pos[combinations] = POPCOUNT[passed & expert_neg].sum(axis=1)
+
+    threshold_index = np.unravel_index(np.arange(n_combinations), shape)
+
+    results = pd.DataFrame({rule: np.asarray(grids[rule])[index] for rule, index in zip(rules, threshold_index)})
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        results["Sensitivity"] = true_pos / n_pos
+        results["Specificity"] = 1 - false_pos / n_neg
+
+    results["Distance"] = np.sqrt(np.square(1 - results["Sensitivity"]) + np.square(1 - results["Specificity"]))
+
+    return results
+
+
+def pareto_front(results):
+    """Returns the combinations where sensitivity cannot be improved without lowering specificity.
+       Combinations with identical sensitivity and specificity are represented by the first one found.
+
+    :argument
+    -results: pandas DataFrame from grid_search()
+
+    :returns
+    -front: pandas DataFrame sorted by descending sensitivity
+    """
+
+    sens = results["Sensitivity"].values
+    spec = results["Specificity"].values
+
+    # Descending sensitivity, then descending specificity
+    order = np.lexsort((-spec, -sens))
+
+    # A point is on the front if its specificity beats every point with higher (or equal) sensitivity
+    best_spec = np.maximum.accumulate(spec[order])
+    previous_best = np.concatenate(([-np.inf], best_spec[:-1]))
+
+    on_front = spec[order] > previous_best
+
+    return results.iloc[order[on_front]].reset_index(drop=True)
+
+
+def print_front(front, n_rows=10):
+    """Prints the combinations on the Pareto front closest to perfect sensitivity and specificity."""
+
+    print("\n" + "Pareto front: {} threshold combinations".format(len(front)))
+
+    for index, row in front.sort_values(by="Distance").head(n_rows).iterrows():
+        print("-Sensitivity = {}, specificity = {}: {}".format(
+              round(row["Sensitivity"], 3), round(row["Specificity"], 3),
+              ", ".join(["{} = {}".format(rule, round(row[rule], 3)) for rule in ROC.RULES])))
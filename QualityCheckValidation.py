@@ -32,8 +32,7 @@ def qc_check(raw_edf_folder='/Users/kyleweber/Desktop/Data/OND07/EDF/',
     print("Using file {}".format(ecg_filepath))
 
     if subject_num is None and start is None:
-        file_start, file_end = ImportEDF.check_file(ecg_filepath, print_summary=False)
-        file_duration = ((file_end - file_start).days * 86400 + (file_end - file_start).seconds) * 250
+        file_duration = ImportEDF.open_mapped(ecg_filepath).n_samples(0)
 
         start_index = randint(0, file_duration - epoch_len * sample_rate)
         start_index -= start_index % (sample_rate * epoch_len)
@@ -44,13 +43,14 @@ def qc_check(raw_edf_folder='/Users/kyleweber/Desktop/Data/OND07/EDF/',
     print("Testing index {}-{} ({}-second window).".format(start_index, start_index + epoch_len * sample_rate,
                                                            epoch_len))
 
-    ecg_object = ECG.ECG(filepath=ecg_filepath, age=0, start_offset=start_index, end_offset=epoch_len*sample_rate,
-                         epoch_len=15, load_raw=True, from_processed=False, write_results=False)
+    # Only decodes the EDF data records that cover the window
+    ecg_object = ECG.ECGWindow(filepath=ecg_filepath, start_index=start_index, epoch_len=epoch_len)
 
     ecg_object.subjectID = subjectID
 
     plt.ion()
-    validity_data = ECG.ECG.plot_random_qc(self=ecg_object, input_index=0).rule_check_dict
+    qc = ECG.ECG.plot_random_qc(self=ecg_object, input_index=0)
+    validity_data = qc.rule_check_dict
     plt.show(block=True)
     plt.ioff()
     plt.close()
@@ -62,13 +62,16 @@ def qc_check(raw_edf_folder='/Users/kyleweber/Desktop/Data/OND07/EDF/',
     else:
         user_entry = 0
 
+    # Unrounded rule values (rule_check_dict values are rounded for display) so thresholds can be tuned exactly
+    hr, max_rr, rr_ratio, volt_range, correlation = qc.features()[:5]
+
     output_data = [subjectID, start_index,
                    validity_data["Valid Period"],
-                   validity_data["HR Valid"], validity_data["HR"],
-                   validity_data["Max RR Interval Valid"], validity_data["Max RR Interval"],
-                   validity_data["RR Ratio Valid"], validity_data["RR Ratio"],
-                   validity_data["Voltage Range Valid"], validity_data["Voltage Range"],
-                   validity_data["Correlation Valid"], validity_data["Correlation"], user_entry]
+                   validity_data["HR Valid"], hr,
+                   validity_data["Max RR Interval Valid"], max_rr,
+                   validity_data["RR Ratio Valid"], rr_ratio,
+                   validity_data["Voltage Range Valid"], volt_range,
+                   validity_data["Correlation Valid"], correlation, user_entry]
 
     if write_results:
         with open(output_file, "a") as outfile:
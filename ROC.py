@@ -1,71 +1,183 @@
 import matplotlib.pyplot as plt
-from sklearn.metrics import roc_curve
-from sklearn.metrics import roc_auc_score
 import pandas as pd
 import numpy as np
 
 
-# Function to generate outcome measure
-def run_algorithm(threshold):
+# Orphanidou rules from ECG.CheckQuality.apply_rules: {rule: (feature column, comparison to pass, default threshold)}
+RULES = {"HR Min": ("HR", "greater_equal", 40),
+         "HR Max": ("HR", "less_equal", 180),
+         "Max RR Interval": ("Max RR Interval", "less", 3),
+         "RR Ratio": ("RR Ratio", "less", 2.5),
+         "Voltage Range": ("Voltage Range", "greater", 250),
+         "Correlation": ("Correlation", "greater_equal", 0.66)}
 
-    output = []
 
-    for i in range(len(data)):
+def rule_passes(data, rule_thresholds=None):
+    """Calculates whether each window passes each Orphanidou rule as boolean arrays.
 
-        if data["Valid HR"][i] and data["Valid RR Interval"][i] and data["Valid Voltage"][i] \
-                and data['Valid Correlation'][i] and data["RR Ratio"][i] <= threshold:
-            output.append(True)
-        else:
-            output.append(False)
+    :argument
+    -data: pandas DataFrame (or dictionary of arrays) with the feature columns in RULES
+    -rule_thresholds: dictionary of {rule: threshold} to override defaults in RULES
 
-    return output
+    :returns
+    -passes: dictionary of {rule: boolean array}. Missing feature values (too few beats) fail the rule.
+    """
 
+    rule_thresholds = {} if rule_thresholds is None else rule_thresholds
 
-# Data file
-results_file = "/Users/kyleweber/Desktop/Data/OND07/Tabular Data/QualityControl_Testing.xlsx"
+    passes = {}
 
-# Reads in data file
-data = pd.read_excel(io=results_file, header=0, index_col=None, sheet_name="ThresholdTesting",
-                     usecols=(1, 2, 4, 5, 6, 7))
+    for rule, (feature, comparison, default) in RULES.items():
+        values = np.asarray(data[feature], dtype=float)
 
-expert_decision = np.array(data["ExpertDecision"])
+        with np.errstate(invalid="ignore"):
+            passes[rule] = getattr(np, comparison)(values, rule_thresholds.get(rule, default))
 
-# Threshold value, false positive rate, true positive rate, area under curve
-thresh, fpr, tpr, auc, distance = [], [], [], [], []
+    return passes
 
-# Use np.arange to set thresholds to test
-for i in np.arange(1, 20, 0.1):
 
-    thresh.append(i)
+def threshold_sweep(values, expert_decision, thresholds, comparison, other_pass=None):
+    """Calculates sensitivity, specificity and AUC of a rule for every threshold using sorting and cumulative counts
+       instead of re-running the algorithm for each threshold.
 
-    cur_fpr, cur_tpr, _ = roc_curve(y_score=run_algorithm(threshold=i), y_true=expert_decision)
+       A window is predicted valid if it passes all other rules and values <comparison> threshold.
 
-    fpr.append(cur_fpr[1])
-    tpr.append(cur_tpr[1])
+    :argument
+    -values: feature value for each window
+    -expert_decision: expert rating of each window; True/1 = valid
+    -thresholds: 1-D array of thresholds to evaluate
+    -comparison: "less", "less_equal", "greater" or "greater_equal"
+    -other_pass: boolean array of windows that pass all other rules. All windows pass if None.
 
-    sens = cur_tpr[1]
-    spec = 1 - cur_fpr[1]
+    :returns
+    -sweep: pandas DataFrame with columns "Threshold", "Sensitivity", "Specificity", "FPR", "Distance" and "AUC".
+            Distance is the distance to the top-left corner of ROC space. AUC is the area under the ROC curve of the
+            binary prediction at that threshold.
+    """
 
-    distance.append(((1 - sens) ** 2 + (1 - spec) ** 2) ** (1/2))
+    values = np.asarray(values, dtype=float)
+    expert_decision = np.asarray(expert_decision).astype(bool)
+    thresholds = np.asarray(thresholds, dtype=float)
 
-    auc.append(roc_auc_score(y_score=run_algorithm(threshold=i), y_true=expert_decision))
+    if other_pass is None:
+        other_pass = np.ones(len(values), dtype=bool)
 
-# Finds index that corresponds to largest AUC
-max_auc_index = auc.index(max(auc))
+    # Windows that fail other rules (or have no value) are never predicted valid
+    eligible = np.asarray(other_pass, dtype=bool) & ~np.isnan(values)
 
-plt.plot(fpr, tpr, color='black')
-plt.plot(fpr[max_auc_index], tpr[max_auc_index],
-         marker="o", color='green', label="(FPR = {}, TPR = {})".format(round(fpr[max_auc_index], 3),
-                                                                        round(tpr[max_auc_index], 3)))
+    def n_predicted(sorted_values):
+        """Number of sorted_values that pass the rule at each threshold."""
 
-plt.title("ROC Curve: sensitivity = {} , specificity = {}, "
-          "AUC = {}, threshold = {}".format(round(tpr[max_auc_index], 3), round(1-fpr[max_auc_index], 3),
-                                            round(auc[max_auc_index], 3), round(thresh[max_auc_index]), 5))
+        if comparison == "less":
+            return np.searchsorted(sorted_values, thresholds, side="left")
+        if comparison == "less_equal":
+            return np.searchsorted(sorted_values, thresholds, side="right")
+        if comparison == "greater":
+            return len(sorted_values) - np.searchsorted(sorted_values, thresholds, side="right")
+        if comparison == "greater_equal":
+            return len(sorted_values) - np.searchsorted(sorted_values, thresholds, side="left")
 
-plt.plot(np.arange(0, 1, 0.05), np.arange(0, 1, 0.05), linestyle='dashed', color='red')
-plt.legend(loc='upper right')
-plt.xlabel('False Positive Rate')
-plt.ylabel('True Positive Rate')
-plt.ylim(0, 1)
-plt.xlim(0, 1)
-plt.show()
+        raise ValueError("Comparison must be 'less', 'less_equal', 'greater' or 'greater_equal'.")
+
+    true_pos = n_predicted(np.sort(values[eligible & expert_decision]))
+    false_pos = n_predicted(np.sort(values[eligible & ~expert_decision]))
+
+    n_pos = np.sum(expert_decision)
+    n_neg = np.sum(~expert_decision)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sens = true_pos / n_pos
+        fpr = false_pos / n_neg
+
+    spec = 1 - fpr
+
+    sweep = pd.DataFrame({"Threshold": thresholds, "Sensitivity": sens, "Specificity": spec, "FPR": fpr,
+                          "Distance": np.sqrt(np.square(1 - sens) + np.square(1 - spec)),
+                          "AUC": (sens + spec) / 2})
+
+    return sweep
+
+
+def sweep_rule(data, rule, thresholds, expert_col="ExpertDecision", rule_thresholds=None):
+    """Sweeps the threshold of one rule in RULES while the other rules use their (default or given) thresholds.
+
+    :argument
+    -data: pandas DataFrame with the feature columns in RULES and expert_col
+    -rule: rule name in RULES
+    -thresholds: 1-D array of thresholds to evaluate
+    -expert_col: column of expert decisions
+    -rule_thresholds: dictionary of {rule: threshold} for the other rules
+
+    :returns
+    -sweep: see threshold_sweep()
+    """
+
+    passes = rule_passes(data=data, rule_thresholds=rule_thresholds)
+
+    other_pass = np.ones(len(data), dtype=bool)
+
+    for other_rule, rule_pass in passes.items():
+        if other_rule != rule:
+            other_pass &= rule_pass
+
+    feature, comparison, default = RULES[rule]
+
+    return threshold_sweep(values=data[feature], expert_decision=data[expert_col], thresholds=thresholds,
+                           comparison=comparison, other_pass=other_pass)
+
+
+def curve_auc(sweep):
+    """Area under the ROC curve traced by all thresholds in a sweep (trapezoidal rule), including the (0, 0) and
+       (1, 1) end points."""
+
+    points = sweep.sort_values(by=["FPR", "Sensitivity"])
+
+    fpr = np.concatenate(([0], points["FPR"], [1]))
+    tpr = np.concatenate(([0], points["Sensitivity"], [1]))
+
+    return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+
+
+def plot_roc(sweep):
+    """Plots ROC curve from a sweep and marks the threshold with the largest AUC."""
+
+    best = sweep["AUC"].idxmax()
+
+    plt.plot(sweep["FPR"], sweep["Sensitivity"], color='black')
+    plt.plot(sweep["FPR"][best], sweep["Sensitivity"][best],
+             marker="o", color='green', label="(FPR = {}, TPR = {})".format(round(sweep["FPR"][best], 3),
+                                                                            round(sweep["Sensitivity"][best], 3)))
+
+    plt.title("ROC Curve: sensitivity = {} , specificity = {}, "
+              "AUC = {}, threshold = {}".format(round(sweep["Sensitivity"][best], 3),
+                                                round(sweep["Specificity"][best], 3),
+                                                round(sweep["AUC"][best], 3), round(sweep["Threshold"][best], 5)))
+
+    plt.plot(np.arange(0, 1, 0.05), np.arange(0, 1, 0.05), linestyle='dashed', color='red')
+    plt.legend(loc='upper right')
+    plt.xlabel('False Positive Rate')
+    plt.ylabel('True Positive Rate')
+    plt.ylim(0, 1)
+    plt.xlim(0, 1)
+    plt.show()
+
+
+if __name__ == "__main__":
+
+    # Data file
+    results_file = "/Users/kyleweber/Desktop/Data/OND07/Tabular Data/QualityControl_Testing.xlsx"
+
+    # Reads in data file
+    data = pd.read_excel(io=results_file, header=0, index_col=None, sheet_name="ThresholdTesting",
+                         usecols=(1, 2, 4, 5, 6, 7))
+
+    # Other rules' results are already in the sheet
+    other_pass = np.array(data["Valid HR"] & data["Valid RR Interval"] & data["Valid Voltage"] &
+                          data["Valid Correlation"], dtype=bool)
+
+    rr_sweep = threshold_sweep(values=data["RR Ratio"], expert_decision=data["ExpertDecision"],
+                               thresholds=np.arange(1, 20, 0.1), comparison="less_equal", other_pass=other_pass)
+
+    print("Area under ROC curve: {}".format(round(curve_auc(rr_sweep), 3)))
+
+    plot_roc(rr_sweep)
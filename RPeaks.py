@@ -0,0 +1,209 @@
+import numpy as np
+import pandas as pd
+import Logger
+
+
+logger = Logger.get_logger(__name__)
+
+
+def peak_filepaths(file_prefix):
+    """Returns pathways of the R-peak index file and per-epoch offsets file for a file prefix
+       (e.g. output_dir + "Model Output/" + filename)."""
+
+    return file_prefix + "_RPeaks.npy", file_prefix + "_RPeakOffsets.npy"
+
+
+def write_peaks(file_prefix, peaks, peak_offsets):
+    """Writes R-peak sample indexes and per-epoch offsets to uncompressed .npy files that can be memory-mapped.
+
+    :argument
+    -file_prefix: pathway and filename without extension
+    -peaks: int32/int64 array of R-peak sample indexes
+    -peak_offsets: int64 array; peaks in epoch i are peaks[peak_offsets[i]:peak_offsets[i+1]]
+    """
+
+    peak_file, offset_file = peak_filepaths(file_prefix)
+
+    np.save(peak_file, peaks)
+    np.save(offset_file, peak_offsets)
+
+    logger.info("Complete. File {} saved.".format(peak_file))
+
+
+def load_peaks(file_prefix, mmap=True):
+    """Reads R-peak sample indexes and per-epoch offsets written by write_peaks().
+
+    :argument
+    -file_prefix: pathway and filename without extension
+    -mmap: whether peaks are memory-mapped instead of read into memory
+
+    :returns
+    -peaks, peak_offsets
+    """
+
+    peak_file, offset_file = peak_filepaths(file_prefix)
+
+    return np.load(peak_file, mmap_mode="r" if mmap else None), np.load(offset_file)
+
+
+def interior_peaks(peaks, n_samples, median_rr=None):
+    """Removes peaks within median RR / 2 samples of either edge of a separately detected window of data.
+
+    :argument
+    -peaks: R-peak sample indexes in the window
+    -n_samples: window length in samples
+    -median_rr: median RR interval in samples. Calculated from peaks if None.
+
+    :returns
+    -peaks: numpy array of peaks away from the window edges. Empty if fewer than 2 peaks.
+    """
+
+    peaks = np.asarray(peaks, dtype=np.int64)
+
+    if len(peaks) < 2:
+        return peaks[:0]
+
+    if median_rr is None:
+        median_rr = int(np.median(np.diff(peaks)))
+
+    edge = median_rr / 2 + 1
+
+    return peaks[(peaks >= edge) & (n_samples - peaks >= edge)]
+
+
+class PeakStore:
+
+    def __init__(self, peaks, peak_offsets, sample_rate, epoch_len=15, epoch_validity=None, rr_range=(300, 2000)):
+        """Beat-level R-peak data for a recording with time-domain HRV metrics calculated over any windows.
+
+        :argument
+        -peaks: R-peak sample indexes in recording order. Peaks near epoch edges should already be removed
+                (see ECG.CheckQuality.interior_peaks()).
+        -peak_offsets: peaks in epoch i are peaks[peak_offsets[i]:peak_offsets[i+1]]
+        -sample_rate: ECG sample rate, Hz
+        -epoch_len: epoch length in seconds
+        -epoch_validity: binary list (0=valid; 1=invalid) for each epoch. All epochs are used if None.
+        -rr_range: RR intervals outside of this range (ms) are excluded as missed or extra beats
+        """
+
+        self.peaks = np.asarray(peaks)
+        self.peak_offsets = np.asarray(peak_offsets)
+        self.sample_rate = sample_rate
+        self.epoch_len = epoch_len
+        self.epoch_validity = epoch_validity
+        self.rr_range = rr_range
+
+        self.n_epochs = len(self.peak_offsets) - 1
+
+        # RUNS METHODS ===============================================================================================
+        self.rr, self.rr_end, self.rr_valid = self.rr_intervals()
+
+    def epoch_peaks(self, epoch):
+        """Returns R-peak sample indexes in one epoch."""
+
+        return self.peaks[self.peak_offsets[epoch]:self.peak_offsets[epoch + 1]]
+
+    def rr_intervals(self):
+        """Calculates all RR intervals in the recording.
+
+        :returns
+        -rr: RR intervals in ms
+        -rr_end: sample index of the second peak of each interval
+        -rr_valid: boolean array; False if the peaks are in different epochs, either peak is in an invalid epoch or
+                   the interval is outside rr_range. Peaks in different epochs were detected separately and edge
+                   peaks are removed, so intervals across epoch boundaries are not beat-to-beat intervals.
+        """
+
+        peaks = np.asarray(self.peaks, dtype=np.int64)
+
+        rr = np.diff(peaks) / self.sample_rate * 1000
+        rr_end = peaks[1:]
+
+        peak_epoch = np.repeat(np.arange(self.n_epochs), np.diff(self.peak_offsets))
+
+        rr_valid = (rr >= self.rr_range[0]) & (rr <= self.rr_range[1]) & (peak_epoch[:-1] == peak_epoch[1:])
+
+        if self.epoch_validity is not None:
+            valid_epoch = np.asarray(self.epoch_validity)[:self.n_epochs] == 0
+
+            rr_valid &= valid_epoch[peak_epoch[:-1]] & valid_epoch[peak_epoch[1:]]
+
+        return rr, rr_end, rr_valid
+
+    def hrv(self, window_starts, window_ends):
+        """Calculates time-domain HRV metrics for any windows (which can overlap) using cumulative sums, so each
+           window costs two searchsorted lookups regardless of length. RR intervals are in a window if their second
+           peak is; successive differences need both intervals in the window and valid.
+
+        :argument
+        -window_starts, window_ends: sample indexes of the start (inclusive) and end (exclusive) of each window
+
+        :returns
+        -hrv: pandas DataFrame with "Start index", "End index", "RR intervals", "Mean RR (ms)", "Mean HR (bpm)",
+              "SDNN (ms)", "RMSSD (ms)" and "pNN50 (%)". Metrics are NaN if a window does not have enough intervals.
+        """
+
+        window_starts = np.asarray(window_starts, dtype=np.int64)
+        window_ends = np.asarray(window_ends, dtype=np.int64)
+
+        def cumulative(data):
+            return np.concatenate(([0], np.cumsum(data)))
+
+        rr = np.where(self.rr_valid, self.rr, 0)
+
+        # Successive differences between interval j and j + 1
+        pair_valid = self.rr_valid[:-1] & self.rr_valid[1:]
+        diff = np.where(pair_valid, np.diff(self.rr), 0)
+
+        cum_n = cumulative(self.rr_valid)
+        cum_rr = cumulative(rr)
+        cum_rr_sq = cumulative(np.square(rr))
+
+        cum_pairs = cumulative(pair_valid)
+        cum_diff_sq = cumulative(np.square(diff))
+        cum_nn50 = cumulative(pair_valid & (np.abs(diff) > 50))
+
+        # Intervals [first, last) in each window; pairs [first, last - 1)
+        first = np.searchsorted(self.rr_end, window_starts, side="left")
+        last = np.searchsorted(self.rr_end, window_ends, side="left")
+        last_pair = np.maximum(last - 1, first)
+
+        n = cum_n[last] - cum_n[first]
+        rr_sum = cum_rr[last] - cum_rr[first]
+        rr_sq_sum = cum_rr_sq[last] - cum_rr_sq[first]
+
+        n_pairs = cum_pairs[last_pair] - cum_pairs[first]
+        diff_sq_sum = cum_diff_sq[last_pair] - cum_diff_sq[first]
+        nn50 = cum_nn50[last_pair] - cum_nn50[first]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean_rr = rr_sum / n
+            sdnn = np.sqrt(np.clip((rr_sq_sum - np.square(rr_sum) / n) / (n - 1), 0, None))
+            rmssd = np.sqrt(diff_sq_sum / n_pairs)
+            pnn50 = 100 * nn50 / n_pairs
+
+        sdnn[n < 2] = np.nan
+
+        hrv = pd.DataFrame({"Start index": window_starts, "End index": window_ends, "RR intervals": n,
+                            "Mean RR (ms)": np.round(mean_rr, 1), "Mean HR (bpm)": np.round(60000 / mean_rr, 1),
+                            "SDNN (ms)": np.round(sdnn, 1), "RMSSD (ms)": np.round(rmssd, 1),
+                            "pNN50 (%)": np.round(pnn50, 1)})
+
+        return hrv
+
+    def hrv_windows(self, window_len=300, window_step=None):
+        """Calculates HRV metrics over regular windows from the start of the recording.
+
+        :argument
+        -window_len: window length in seconds
+        -window_step: seconds between window starts. Windows do not overlap if None.
+        """
+
+        window_step = window_len if window_step is None else window_step
+
+        n_samples = self.n_epochs * self.epoch_len * self.sample_rate
+
+        window_starts = np.arange(0, n_samples, int(window_step * self.sample_rate))
+        window_ends = window_starts + int(window_len * self.sample_rate)
+
+        return self.hrv(window_starts=window_starts, window_ends=window_ends)
@@ -0,0 +1,99 @@
+import numpy as np
+
+
+# Gap length histogram bin edges in minutes; the last bin has no upper limit
+GAP_BIN_EDGES = (0, 1, 5, 15, 30, 60, 120, 240)
+
+
+def run_length_encode(data):
+    """Run-length encodes a sequence in one vectorized pass.
+
+    :argument
+    -data: list or numpy array of values (e.g. epoch validity, sleep status, wear status)
+
+    :returns
+    -starts: index of first epoch in each run
+    -lengths: number of epochs in each run
+    -values: value of each run
+    """
+
+    data = np.asarray(data)
+
+    if len(data) == 0:
+        return np.array([], dtype=int), np.array([], dtype=int), data
+
+    # Indexes where the value differs from the previous value
+    change = np.flatnonzero(data[1:] != data[:-1]) + 1
+
+    starts = np.concatenate(([0], change))
+    lengths = np.diff(np.concatenate((starts, [len(data)])))
+
+    return starts, lengths, data[starts]
+
+
+def find_runs(data, value):
+    """Returns start indexes and lengths (epochs) of runs where data == value."""
+
+    starts, lengths, values = run_length_encode(data)
+
+    return starts[values == value], lengths[values == value]
+
+
+def runs_to_intervals(data, value):
+    """Returns list of [start index, end index] pairs (end inclusive) of runs where data == value."""
+
+    starts, lengths = find_runs(data, value)
+
+    return [[int(start), int(start + length - 1)] for start, length in zip(starts, lengths)]
+
+
+def run_summary(data, value, epoch_len=15):
+    """Summary of run durations where data == value.
+
+    :argument
+    -data: list or numpy array of values
+    -value: value of runs to summarize
+    -epoch_len: epoch length in seconds
+
+    :returns
+    -summary: dictionary of number of runs, longest run in epochs and longest/mean/median run durations in minutes
+    """
+
+    starts, lengths = find_runs(data, value)
+
+    durations = lengths * epoch_len / 60
+
+    summary = {"Runs": len(durations),
+               "Longest (epochs)": int(lengths.max()) if len(lengths) > 0 else 0,
+               "Longest (minutes)": round(float(durations.max()), 2) if len(durations) > 0 else 0,
+               "Mean (minutes)": round(float(durations.mean()), 2) if len(durations) > 0 else 0,
+               "Median (minutes)": round(float(np.median(durations)), 2) if len(durations) > 0 else 0}
+
+    return summary
+
+
+def gap_histogram(data, value=1, epoch_len=15, bin_edges=GAP_BIN_EDGES):
+    """Histogram of run (gap) durations where data == value.
+
+    :argument
+    -data: list or numpy array of values
+    -value: value that marks a gap (e.g. 1 for invalid ECG epochs)
+    -epoch_len: epoch length in seconds
+    -bin_edges: bin edges in minutes. Last bin includes all longer gaps.
+
+    :returns
+    -histogram: dictionary of {"lower-upper min": number of gaps}
+    """
+
+    starts, lengths = find_runs(data, value)
+
+    durations = lengths * epoch_len / 60
+
+    # Bin index of each gap; gaps at or above the last edge go in the last bin
+    bin_index = np.searchsorted(bin_edges, durations, side="right") - 1
+    counts = np.bincount(bin_index, minlength=len(bin_edges))
+
+    labels = ["{}-{} min".format(low, high) for low, high in zip(bin_edges[:-1], bin_edges[1:])]
+    labels.append("{}+ min".format(bin_edges[-1]))
+
+    return {label: int(count) for label, count in zip(labels, counts)}
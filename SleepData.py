@@ -5,6 +5,11 @@ from datetime import timedelta
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import os
+import Logger
+import Timestamps
+
+
+logger = Logger.get_logger(__name__)
 
 
 class Sleep:
@@ -19,8 +24,7 @@ class Sleep:
 
     def __init__(self, subject_object):
 
-        print()
-        print("=========================================== SLEEP LOG DATA ===========================================")
+        logger.info("SLEEP LOG DATA")
 
         self.file_loc = subject_object.sleeplog_file
         self.subject_object = subject_object
@@ -129,21 +133,17 @@ class Sleep:
         # Creates list of 0s corresponding to each epoch
         epoch_list = np.zeros(self.data_len + 1)
 
-        for i, epoch_stamp in enumerate(self.epoch_timestamps):
-            try:
-                epoch_stamp = datetime.strptime(str(epoch_stamp)[:-3], "%Y-%m-%dT%H:%M:%S.%f")
-            except ValueError:
-                epoch_stamp = datetime.strptime(str(epoch_stamp).split(".")[0], "%Y-%m-%d %H:%M:%S")
-
-            for asleep, awake in zip(self.data[:], self.data[1:]):
-                # Overnight sleep
-                if asleep[3] != "N/A" and awake[0] != "N/A":
-                    if asleep[3] <= epoch_stamp <= awake[0]:
-                        epoch_list[i] = 2
-                # Naps
-                if asleep[1] != "N/A" and asleep[2] != "N/A":
-                    if asleep[1] <= epoch_stamp <= asleep[2]:
-                        epoch_list[i] = 1
+        epoch_stamps = Timestamps.parse_timestamps(self.epoch_timestamps)[:len(epoch_list)]
+        status = epoch_list[:len(epoch_stamps)]
+
+        # Later days overwrite earlier ones, and naps overwrite overnight sleep from the same day
+        for asleep, awake in zip(self.data[:], self.data[1:]):
+            # Overnight sleep
+            if asleep[3] != "N/A" and awake[0] != "N/A":
+                status[(epoch_stamps >= np.datetime64(asleep[3])) & (epoch_stamps <= np.datetime64(awake[0]))] = 2
+            # Naps
+            if asleep[1] != "N/A" and asleep[2] != "N/A":
+                status[(epoch_stamps >= np.datetime64(asleep[1])) & (epoch_stamps <= np.datetime64(asleep[2]))] = 1
 
         return epoch_list
 
@@ -175,18 +175,18 @@ class Sleep:
                   "AvgNapDuration": round(sum(nap_durations) / len(nap_durations), 1)
                   if len(nap_durations) != 0 else 0}
 
-        print("\n" + "SLEEP REPORT")
+        logger.info("SLEEP REPORT")
 
-        print("-Total time asleep: {} minutes ({}%)".format(report["SleepDuration"], report["Sleep%"]))
+        logger.info("-Total time asleep: {} minutes ({}%)".format(report["SleepDuration"], report["Sleep%"]))
 
-        print("\n" + "-Total overnight sleep: {} minutes ({}%)".format(report["OvernightSleepDuration"],
-                                                                       report["OvernightSleep%"]))
-        print("-Overnight sleep durations: {} minutes".format(report["OvernightSleepDurations"]))
-        print("-Average overnight sleep duration: {} minutes".format(report["AvgSleepDuration"]))
+        logger.info("-Total overnight sleep: {} minutes ({}%)".format(report["OvernightSleepDuration"],
+                                                                      report["OvernightSleep%"]))
+        logger.info("-Overnight sleep durations: {} minutes".format(report["OvernightSleepDurations"]))
+        logger.info("-Average overnight sleep duration: {} minutes".format(report["AvgSleepDuration"]))
 
-        print("\n" + "-Total napping time: {} minutes ({}%)".format(report["NapDuration"], report["Nap%"]))
-        print("-Nap durations: {} minutes".format(report["NapDurations"]))
-        print("-Average nap duration: {} minutes".format(report["AvgNapDuration"]))
+        logger.info("-Total napping time: {} minutes ({}%)".format(report["NapDuration"], report["Nap%"]))
+        logger.info("-Nap durations: {} minutes".format(report["NapDurations"]))
+        logger.info("-Average nap duration: {} minutes".format(report["AvgNapDuration"]))
 
         return report
 
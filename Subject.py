@@ -9,17 +9,22 @@ import ImportCropIndexes
 import ImportEDF
 import HRAcc
 import DailyReports
+import NonWearDetection
+import EpochTable
+import Profiler
+import Logger
 
 import os
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
-from datetime import datetime
 import warnings
 from pandas.plotting import register_matplotlib_converters
 register_matplotlib_converters()
 warnings.filterwarnings("ignore")
 
+logger = Logger.get_logger(__name__)
+
 
 # ====================================================================================================================
 # ================================================== SUBJECT CLASS ===================================================
@@ -42,14 +47,19 @@ class Subject:
                  crop_index_file=None, filter_ecg=False,
                  output_dir=desktop_path, processed_folder=None,
                  write_results=False, treadmill_log_file=None,
-                 demographics_file=None, sleeplog_file=None):
+                 demographics_file=None, sleeplog_file=None, precision="float64",
+                 ecg_low_memory=False, detect_nonwear=False, temperature_files=None, incremental=False,
+                 epoch_dataset_dir=None):
 
-        print()
-        print("========================================= SUBJECT #{} "
-              "=============================================".format(subjectID))
-        print()
+        # Subject ID is added to log records and progress events
+        Logger.set_context(Subject=subjectID)
+        logger.info("SUBJECT #{}".format(subjectID))
+
+        progress = Logger.Progress(stage="Subject", total=1, unit="subjects")
 
-        processing_start = datetime.now()
+        # Stage timing and memory; written with results. See Profiler.aggregate_profiles() for cohort runs.
+        self.profile = Profiler.Profile(name=subjectID)
+        Profiler.set_active(self.profile)
 
         # Model objects
         self.wrist = None
@@ -66,9 +76,12 @@ class Subject:
         self.rest_hr_window = rest_hr_window  # Number of epochs over which rolling average HR is calculated
         self.n_epochs_rest_hr = n_epochs_rest_hr  # Number of epochs over which resting HR is calculate
         self.hracc_threshold = hracc_threshold  # Threshold for HR-Acc model
+        self.precision = precision  # Storage precision of raw data: "float64", "float32" or "int16"
+        self.incremental = incremental  # Only processes data added to the EDF files since the last incremental run
 
         self.from_processed = from_processed  # Whether to import already-processed data
         self.write_results = write_results  # Whether to write results to CSV
+        self.epoch_dataset_dir = epoch_dataset_dir  # Cohort Parquet dataset the epoch table is added to (optional)
 
         if self.from_processed:
             self.write_results = False
@@ -100,12 +113,18 @@ class Subject:
         self.ecg_filepath=None
         self.load_raw_ecg = load_raw_ecg
         self.filter_ecg = filter_ecg
+        self.ecg_low_memory = ecg_low_memory  # Block-wise ECG quality check without full-length raw/filtered data
 
         if not self.load_ecg and self.load_ankle and self.load_wrist:
             self.accel_only = True
         if self.load_ecg:
             self.accel_only = False
 
+        # Non-wear detection from raw accelerometer (and temperature) data
+        self.detect_nonwear = detect_nonwear
+        self.temperature_files = temperature_files if temperature_files is not None else {}  # {"Wrist": filepath}
+        self.nonwear = None
+
         self.valid_all = None
         self.valid_accelonly = None
 
@@ -115,36 +134,50 @@ class Subject:
         self.daily_summary = None
 
         # =============================================== RUNS METHODS ================================================
-        self.wrist_filepath, self.ankle_filepath, self.ecg_filepath = self.get_raw_filepaths()
+        with Profiler.stage("Subject") as total_time:
+            self.wrist_filepath, self.ankle_filepath, self.ecg_filepath = self.get_raw_filepaths()
 
-        ImportDemographics.import_demographics(subject_object=self)
+            ImportDemographics.import_demographics(subject_object=self)
 
-        self.get_raw_filepaths()
-        self.crop_files()
-        self.create_objects()
+            self.get_raw_filepaths()
+            self.crop_files()
+            self.create_objects()
 
-        self.sleep = SleepData.Sleep(subject_object=self)
+            if self.detect_nonwear:
+                self.find_nonwear()
 
-        self.update_ecg_with_sleep_data()
+            with Profiler.stage("Sleep"):
+                self.sleep = SleepData.Sleep(subject_object=self)
 
-        self.create_hracc()
+            self.update_ecg_with_sleep_data()
 
-        self.check_validity()
+            self.create_hracc()
 
-        # Runs stats if multiple devices available
-        if self.load_wrist + self.load_ecg + self.load_ankle > 1:
-            # Runs statistical analysis
-            self.stats = ModelStats.Stats(subject_object=self)
+            self.check_validity()
 
-        # Runs daily summary measures
-        self.daily_summary = DailyReports.DailyReport(subject_object=self)
+            # Runs stats if multiple devices available
+            if self.load_wrist + self.load_ecg + self.load_ankle > 1:
+                # Runs statistical analysis
+                with Profiler.stage("Stats"):
+                    self.stats = ModelStats.Stats(subject_object=self)
 
-        processing_end = datetime.now()
+            # Runs daily summary measures
+            with Profiler.stage("Daily report"):
+                self.daily_summary = DailyReports.DailyReport(subject_object=self)
 
-        print()
-        print("======================================================================================================")
-        print("TOTAL PROCESSING TIME = {} SECONDS.".format(round((processing_end-processing_start).seconds, 1)))
-        print("======================================================================================================")
+            # One typed epoch-level table of all devices and models
+            if self.write_results:
+                with Profiler.stage("Epoch table"):
+                    EpochTable.write_epoch_table(subject_object=self, dataset_dir=self.epoch_dataset_dir)
+
+        self.profile.summary()
+
+        if self.write_results:
+            self.profile.write(file_prefix="{}Model Output/OND07_WTL_{}_01".format(self.output_dir, self.subjectID))
+
+        logger.info("TOTAL PROCESSING TIME = {} SECONDS.".format(round(total_time["Wall time (s)"], 1)))
+
+        progress.finish()
 
     def get_raw_filepaths(self):
         """Retrieves filenames associated with current subject."""
@@ -164,7 +197,7 @@ class Subject:
             if len(wrist_filenames) == 1:
                 wrist_filename = wrist_filenames[0]
             if len(wrist_filenames) == 0:
-                print("Could not find the correct wrist accelerometer file.")
+                logger.warning("Could not find the correct wrist accelerometer file.")
                 wrist_filename = None
 
         if self.load_ankle:
@@ -175,26 +208,27 @@ class Subject:
             if len(ankle_filenames) == 1:
                 ankle_filename = ankle_filenames[0]
             if len(ankle_filenames) == 0:
-                print("Could not find the correct ankle accelerometer file.")
+                logger.warning("Could not find the correct ankle accelerometer file.")
                 ankle_filename = None
 
         if self.load_ecg:
             ecg_filename = [self.raw_edf_folder + i for i in subject_file_list if "BF" in i][0]
             if len([self.raw_edf_folder + i for i in subject_file_list if "BF" in i]) == 0:
-                print("Could not find the correct ECG file.")
+                logger.warning("Could not find the correct ECG file.")
                 ecg_filename = None
 
         return wrist_filename, ankle_filename, ecg_filename
 
+    @Profiler.timed("Crop")
     def crop_files(self):
 
         if self.from_processed:
-            print("Data is being imported from processed. Skipping file crop.")
+            logger.info("Data is being imported from processed. Skipping file crop.")
             return None
 
         if not self.from_processed:
             # File summaries
-            print("Raw EDF file summaries...")
+            logger.info("Raw EDF file summaries...")
             ImportEDF.check_file(self.ankle_filepath)
             ImportEDF.check_file(self.wrist_filepath)
             ImportEDF.check_file(self.ecg_filepath)
@@ -214,8 +248,7 @@ class Subject:
 
                 # Reads data from raw if crop file not available or no data found for participant
                 if self.crop_index_file is None or not self.crop_indexes_found:
-                    self.start_offset_dict = DeviceSync.crop_start(subject_object=self)
-                    self.end_offset_dict = DeviceSync.crop_end(subject_object=self)
+                    self.start_offset_dict, self.end_offset_dict = DeviceSync.sync_subject(subject_object=self)
 
             # If ECG not available but wrist and ankle accelerometers are
             if self.ecg_filepath is None and self.wrist_filepath is not None and self.ankle_filepath is not None:
@@ -227,70 +260,96 @@ class Subject:
 
                 # Reads from raw if participant not found in csv or csv does not exist
                 if not self.crop_indexes_found:
-                    print("Crop file not entered/found. Ankle treadmill protocol indexes may be incorrect.")
-                    self.start_offset_dict = DeviceSync.crop_start(subject_object=self)
+                    logger.warning("Crop file not entered/found. Ankle treadmill protocol indexes may be incorrect.")
+                    self.start_offset_dict, self.end_offset_dict = DeviceSync.sync_subject(subject_object=self)
 
                 # Overwrites end indexes with values from raw accel files (excludes ECG)
-                self.end_offset_dict = DeviceSync.crop_end(subject_object=self)
+                if self.crop_indexes_found:
+                    self.end_offset_dict = DeviceSync.crop_end(subject_object=self)
 
             # Sets to default values if reading from processed (values not used) if not raw data is read in
             if self.from_processed and not self.load_raw_ecg and not self.load_raw_ankle and not self.load_raw_wrist:
                 self.start_offset_dict = {"Ankle": 0, "Wrist": 0, "ECG": 0}
                 self.end_offset_dict = {"Ankle": 0, "Wrist": 0, "ECG": 0}
 
-            print("Start indexes: ankle = {}, wrist = {}, ECG = {}".format(self.start_offset_dict["Ankle"],
-                                                                           self.start_offset_dict["Wrist"],
-                                                                           self.start_offset_dict["ECG"]))
-            print("Data points to be read: ankle = {}, wrist = {}, ECG = {}".format(self.end_offset_dict["Ankle"],
-                                                                                    self.end_offset_dict["Wrist"],
-                                                                                    self.end_offset_dict["ECG"]))
+            logger.info("Start indexes: ankle = {}, wrist = {}, ECG = {}".format(self.start_offset_dict["Ankle"],
+                                                                                 self.start_offset_dict["Wrist"],
+                                                                                 self.start_offset_dict["ECG"]))
+            logger.info("Data points to be read: ankle = {}, wrist = {}, ECG = {}".format(self.end_offset_dict["Ankle"],
+                                                                                          self.end_offset_dict["Wrist"],
+                                                                                          self.end_offset_dict["ECG"]))
 
     def create_objects(self):
 
         if self.ecg_filepath is not None:
-            self.ecg = ECG.ECG(filepath=self.ecg_filepath,
-                               from_processed=self.from_processed, load_raw=self.load_raw_ecg,
-                               filter=self.filter_ecg,
-                               output_dir=self.output_dir, write_results=self.write_results, epoch_len=self.epoch_len,
-                               start_offset=self.start_offset_dict["ECG"], end_offset=self.end_offset_dict["ECG"],
-                               age=self.demographics["Age"],
-                               rest_hr_window=self.rest_hr_window, n_epochs_rest=self.n_epochs_rest_hr)
+            with Profiler.stage("ECG"):
+                self.ecg = ECG.ECG(filepath=self.ecg_filepath,
+                                   from_processed=self.from_processed, load_raw=self.load_raw_ecg,
+                                   filter=self.filter_ecg,
+                                   output_dir=self.output_dir, write_results=self.write_results,
+                                   epoch_len=self.epoch_len,
+                                   start_offset=self.start_offset_dict["ECG"], end_offset=self.end_offset_dict["ECG"],
+                                   age=self.demographics["Age"],
+                                   rest_hr_window=self.rest_hr_window, n_epochs_rest=self.n_epochs_rest_hr,
+                                   precision=self.precision, low_memory=self.ecg_low_memory,
+                                   incremental=self.incremental)
 
         # Objects from Accelerometer script
         if self.wrist_filepath is not None:
-            self.wrist = Accelerometer.Wrist(subjectID=self.subjectID,
-                                             filepath=self.wrist_filepath, load_raw=self.load_raw_wrist,
-                                             output_dir=self.output_dir, accel_only=self.accel_only,
-                                             processed_folder=self.processed_folder, from_processed=self.from_processed,
-                                             write_results=self.write_results,
-                                             start_offset=self.start_offset_dict["Wrist"],
-                                             end_offset=self.end_offset_dict["Wrist"],
-                                             ecg_object=self.ecg)
+            with Profiler.stage("Wrist"):
+                self.wrist = Accelerometer.Wrist(subjectID=self.subjectID,
+                                                 filepath=self.wrist_filepath, load_raw=self.load_raw_wrist,
+                                                 output_dir=self.output_dir, accel_only=self.accel_only,
+                                                 processed_folder=self.processed_folder,
+                                                 from_processed=self.from_processed,
+                                                 write_results=self.write_results,
+                                                 start_offset=self.start_offset_dict["Wrist"],
+                                                 end_offset=self.end_offset_dict["Wrist"],
+                                                 ecg_object=self.ecg, precision=self.precision,
+                                                 incremental=self.incremental)
 
         if self.ankle_filepath is not None:
-            self.ankle = Accelerometer.Ankle(subjectID=self.subjectID,
-                                             filepath=self.ankle_filepath, load_raw=self.load_raw_ankle,
-                                             output_dir=self.output_dir, accel_only=self.accel_only,
-                                             remove_baseline=self.remove_epoch_baseline,
-                                             processed_folder=self.processed_folder, from_processed=self.from_processed,
-                                             treadmill_log_file=self.treadmill_log_file,
-                                             write_results=self.write_results,
-                                             start_offset=self.start_offset_dict["Ankle"],
-                                             end_offset=self.end_offset_dict["Ankle"],
-                                             age=self.demographics["Age"], rvo2=self.demographics["RestVO2"],
-                                             ecg_object=self.ecg)
+            with Profiler.stage("Ankle"):
+                self.ankle = Accelerometer.Ankle(subjectID=self.subjectID,
+                                                 filepath=self.ankle_filepath, load_raw=self.load_raw_ankle,
+                                                 output_dir=self.output_dir, accel_only=self.accel_only,
+                                                 remove_baseline=self.remove_epoch_baseline,
+                                                 processed_folder=self.processed_folder,
+                                                 from_processed=self.from_processed,
+                                                 treadmill_log_file=self.treadmill_log_file,
+                                                 write_results=self.write_results,
+                                                 start_offset=self.start_offset_dict["Ankle"],
+                                                 end_offset=self.end_offset_dict["Ankle"],
+                                                 age=self.demographics["Age"], rvo2=self.demographics["RestVO2"],
+                                                 ecg_object=self.ecg, precision=self.precision,
+                                                 incremental=self.incremental)
 
         if self.ankle_filepath is None and self.wrist_filepath is None and self.ecg_filepath is None:
-            print("No files were imported.")
+            logger.warning("No files were imported.")
             return None
 
+    @Profiler.timed("Non-wear")
+    def find_nonwear(self):
+        """Runs non-wear detection on each loaded accelerometer. Wear status is calculated for each epoch."""
+
+        self.nonwear = {}
+
+        for device, filepath, accel_object in zip(["Wrist", "Ankle"], [self.wrist_filepath, self.ankle_filepath],
+                                                  [self.wrist, self.ankle]):
+            if filepath is None or accel_object is None:
+                continue
+
+            self.nonwear[device] = NonWearDetection.AccelNonWear(accel_filepath=filepath,
+                                                                 epoch_timestamps=accel_object.epoch.timestamps,
+                                                                 temperature_filepath=self.temperature_files.get(
+                                                                     device, None))
+
+    @Profiler.timed("ECG intensity")
     def update_ecg_with_sleep_data(self):
 
         # Adds data to self.ecg since it relies on self.sleep to be complete
         if self.load_ecg:
-            print()
-            print("========================================= MORE ECG DATA "
-                  "=============================================")
+            logger.info("MORE ECG DATA")
 
             self.ecg.rolling_avg_hr, self.ecg.rest_hr, self.ecg.awake_hr \
                 = self.ecg.find_resting_hr(window_size=self.ecg.rest_hr_window, n_windows=self.ecg.n_epochs_rest,
@@ -299,11 +358,13 @@ class Subject:
             self.ecg.perc_hrr = self.ecg.calculate_percent_hrr()
             self.ecg.epoch_intensity, self.ecg.intensity_totals = self.ecg.calculate_intensity()
 
+    @Profiler.timed("HR-Acc")
     def create_hracc(self):
 
         if self.ankle_filepath is not None and self.ecg_filepath is not None:
             self.hr_acc = HRAcc.HRAcc(subject_object=self)
 
+    @Profiler.timed("Validity")
     def check_validity(self):
 
         # Validity check if ECG + at least one accelerometer is available
@@ -619,20 +680,20 @@ class Subject:
         ax1.set_title("Participant {}: Movement's effect on ECG validity".format(self.subjectID))
 
         if self.wrist_filepath is not None and self.load_raw_wrist:
-            ax1.plot(self.wrist.raw.timestamps[::3], self.wrist.raw.x[::3], color='black',
+            ax1.plot(self.wrist.raw.timestamps[::3], self.wrist.raw.physical("x", step=3), color='black',
                      label='Wrist ({}Hz)'.format(int(self.wrist.raw.sample_rate) / 3))
             ax1.set_ylabel("G's")
             ax1.legend(loc='upper left')
             ax1.set_ylim(-8, 8)
 
         if self.ankle_filepath is not None and self.load_raw_ankle:
-            ax2.plot(self.ankle.raw.timestamps[::3], self.ankle.raw.x[::3], color='black',
+            ax2.plot(self.ankle.raw.timestamps[::3], self.ankle.raw.physical("x", step=3), color='black',
                      label='Ankle ({}Hz'.format(int(self.ankle.raw.sample_rate) / 3))
             ax2.set_ylabel("G's")
             ax2.legend(loc='upper left')
             ax2.set_ylim(-8, 8)
 
-        if self.ecg_filepath is not None and self.load_raw_ecg:
+        if self.ecg_filepath is not None and self.load_raw_ecg and self.ecg.filtered is not None:
             ax3.plot(self.ecg.timestamps[::5], self.ecg.filtered[::5], color='red',
                      label='ECG ({}Hz, filtered)'.format(int(self.ecg.sample_rate) / 5))
             ax3.set_ylabel("Voltage")
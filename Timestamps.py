@@ -0,0 +1,78 @@
+import re
+from datetime import datetime
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+
+# Timestamp formats found in processed files and logs, in the order they are tried. str() of numpy datetime64[ns]
+# values (written by the CSV writers) has 9 fractional digits, which pandas parses with %f.
+FORMATS = ("%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S",
+           "%Y-%m-%d %H:%M", "%Y%b%d %H:%M", "%Y/%b/%d %H:%M", "%Y-%m-%d")
+
+# ISO 8601 formats that numpy parses directly
+ISO_FORMATS = FORMATS[:5] + ("%Y-%m-%d",)
+
+
+@lru_cache(maxsize=64)
+def detect_format(sample):
+    """Returns the format in FORMATS that parses a sample timestamp string. Memoized, so columns with the same layout
+       are only tested once.
+
+    :raises
+    -ValueError if no format matches
+    """
+
+    for fmt in FORMATS:
+        try:
+            # strptime's %f takes at most 6 digits; the digits do not change the format
+            datetime.strptime(re.sub(r"(\.\d{6})\d+$", r"\1", sample), fmt)
+            return fmt
+        except ValueError:
+            pass
+
+    raise ValueError("Unknown timestamp format: {}".format(sample))
+
+
+def parse_timestamps(values, fmt=None, as_int=False):
+    """Parses a whole column of timestamps at once. The format is detected once from the first non-empty value.
+
+    :argument
+    -values: array-like of strings, datetime objects or datetime64 values
+    -fmt: strptime format of the strings. Detected if None.
+    -as_int: whether nanoseconds since 1970-01-01 (int64) are returned instead of datetime64
+
+    :returns
+    -timestamps: numpy datetime64[ns] array (or int64 if as_int). Empty/unparseable strings are NaT.
+    """
+
+    values = np.asarray(values)
+
+    if values.dtype.kind in ("U", "S"):
+        values = np.char.strip(values.astype(str))
+        non_empty = values[values != ""]
+
+        if fmt is None and len(non_empty) > 0:
+            fmt = detect_format(str(non_empty[0]))
+
+        try:
+            # numpy's ISO 8601 parser is fastest but fails on any empty or malformed value
+            if fmt not in ISO_FORMATS:
+                raise ValueError
+            timestamps = values.astype("datetime64[ns]")
+        except ValueError:
+            timestamps = np.asarray(pd.to_datetime(values, format=fmt, errors="coerce"), dtype="datetime64[ns]")
+
+    else:
+        # datetime objects and datetime64 values of any unit
+        timestamps = np.asarray(pd.to_datetime(values), dtype="datetime64[ns]")
+
+    return timestamps.view(np.int64) if as_int else timestamps
+
+
+def epoch_length(timestamps):
+    """Returns epoch length in seconds from the first two timestamps."""
+
+    timestamps = np.asarray(timestamps, dtype="datetime64[ns]")
+
+    return int((timestamps[1] - timestamps[0]) / np.timedelta64(1, "s"))
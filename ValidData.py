@@ -2,19 +2,170 @@ from matplotlib import pyplot as plt
 import matplotlib.dates as mdates
 import numpy as np
 import csv
-import statistics as stats
 import scipy.stats
+import Logger
+import RunLength
+
+
+logger = Logger.get_logger(__name__)
+
+
+def activity_totals(model, intensity, epoch_len=15):
+    """Calculates minutes and proportion of valid epochs in each intensity category using np.bincount.
+
+    :argument
+    -model: model name written in "Model" column
+    -intensity: list/array of intensity categories (0-3); None or NaN = invalid epoch
+    -epoch_len: epoch length in seconds
+
+    :returns
+    -totals: dictionary of minutes and proportion of valid epochs in each intensity
+    """
+
+    totals = {"Model": model,
+              "Sedentary": 0, "Sedentary%": 0,
+              "Light": 0, "Light%": 0,
+              "Moderate": 0, "Moderate%": 0,
+              "Vigorous": 0, "Vigorous%": 0}
+
+    if intensity is None:
+        return totals
+
+    intensity = np.asarray(intensity, dtype=float)
+    intensity = intensity[~np.isnan(intensity)].astype(int)
+
+    if len(intensity) == 0:
+        return totals
+
+    epoch_to_minutes = 60 / epoch_len
+    counts = np.bincount(intensity, minlength=4)
+
+    for category, count in zip(["Sedentary", "Light", "Moderate", "Vigorous"], counts[:4]):
+        totals[category] = count / epoch_to_minutes
+        totals[category + "%"] = round(count / len(intensity), 3)
+
+    return totals
+
+
+def compare_counts(valid_data, invalid_data):
+    """Compares counts during valid and invalid ECG epochs: mean, SEM, independent t-test and effect sizes.
+
+    :argument
+    -valid_data, invalid_data: numpy arrays of counts
+
+    :returns
+    -comparison: dictionary. Statistics are None if either group has fewer than 2 epochs.
+    """
+
+    comparison = {"Valid mean": None, "Valid SEM": None, "Invalid mean": None, "Invalid SEM": None,
+                  "t": None, "p": None, "Cohen's d": None, "Hedges' g": None}
+
+    n_valid = len(valid_data)
+    n_invalid = len(invalid_data)
+
+    if n_valid > 0:
+        comparison["Valid mean"] = round(float(valid_data.mean()), 1)
+    if n_invalid > 0:
+        comparison["Invalid mean"] = round(float(invalid_data.mean()), 1)
+
+    if n_valid < 2 or n_invalid < 2:
+        return comparison
+
+    valid_sd = valid_data.std(ddof=1)
+    invalid_sd = invalid_data.std(ddof=1)
+
+    comparison["Valid SEM"] = valid_sd / n_valid ** (1/2)
+    comparison["Invalid SEM"] = invalid_sd / n_invalid ** (1/2)
+
+    ttest_result = scipy.stats.ttest_ind(valid_data, invalid_data)
+
+    comparison["t"] = round(float(ttest_result[0]), 2)
+    comparison["p"] = round(float(ttest_result[1]), 5)
+
+    # Cohen's d with pooled SD; Hedges' g corrects d for small-sample bias
+    pooled_sd = (((n_valid - 1) * valid_sd ** 2 + (n_invalid - 1) * invalid_sd ** 2) /
+                 (n_valid + n_invalid - 2)) ** (1/2)
+
+    if pooled_sd > 0:
+        d = (valid_data.mean() - invalid_data.mean()) / pooled_sd
+        comparison["Cohen's d"] = round(float(d), 3)
+        comparison["Hedges' g"] = round(float(d * (1 - 3 / (4 * (n_valid + n_invalid) - 9))), 3)
+
+    return comparison
+
+
+def group_breakdown(counts, invalid, valid, groups, n_groups):
+    """Breaks down ECG validity and counts by group (e.g. intensity category, hour of day) using np.bincount.
+
+    :argument
+    -counts: numpy array of accelerometer counts
+    -invalid, valid: boolean arrays of invalid/valid ECG epochs
+    -groups: array of integer group for each epoch (NaN = no group). Returns None if None.
+    -n_groups: number of groups
+
+    :returns
+    -breakdown: dictionary of lists (one value per group) of number of epochs, percent of epochs with invalid ECG,
+                and mean counts during valid/invalid ECG
+    """
+
+    if groups is None:
+        return None
+
+    groups = np.asarray(groups, dtype=float)
+    has_group = ~np.isnan(groups)
+    groups = groups[has_group].astype(int)
+    counts = counts[has_group]
+    invalid = invalid[has_group]
+    valid = valid[has_group]
+
+    n_epochs = np.bincount(groups, minlength=n_groups)
+    n_invalid = np.bincount(groups, weights=invalid, minlength=n_groups)
+    n_valid = np.bincount(groups, weights=valid, minlength=n_groups)
+    invalid_sum = np.bincount(groups, weights=counts * invalid, minlength=n_groups)
+    valid_sum = np.bincount(groups, weights=counts * valid, minlength=n_groups)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        breakdown = {"Epochs": n_epochs.tolist(),
+                     "Invalid %": np.round(100 * n_invalid / n_epochs, 1).tolist(),
+                     "Valid Counts": np.round(valid_sum / n_valid, 1).tolist(),
+                     "Invalid Counts": np.round(invalid_sum / n_invalid, 1).tolist()}
+
+    return breakdown
+
+
+def hour_of_day(timestamps):
+    """Returns integer hour of day for each timestamp (datetime objects or numpy datetime64)."""
+
+    timestamps = np.asarray(timestamps, dtype="datetime64[s]")
+
+    return ((timestamps - timestamps.astype("datetime64[D]")) // np.timedelta64(1, "h")).astype(int)
+
+
+def sleep_intervals(sleep_status, timestamps):
+    """Returns start and end timestamps of each period of consecutive sleep epochs (naps and overnight sleep).
+
+    :argument
+    -sleep_status: SleepData.Sleep.status; 0 = awake, 1 = nap, 2 = overnight sleep
+    -timestamps: epoch timestamps
+
+    :returns
+    -intervals: list of [start, end] timestamps. End is the first awake epoch (last epoch if asleep at the end).
+    """
+
+    asleep = np.asarray(sleep_status)[:len(timestamps)] > 0
+
+    return [[timestamps[start], timestamps[min(end + 1, len(timestamps) - 1)]]
+            for start, end in RunLength.runs_to_intervals(asleep, True)]
 
 
 class AllDevices:
 
     def __init__(self, subject_object=None, write_results=False):
         """Generates a class instance that creates and stores data where all devices/models generated valid data.
-           Removes periods of invalid ECG data, sleep, and non-wear (NOT CURRENTLY IMPLEMENTED)"""
+           Removes periods of invalid ECG data, sleep, and non-wear (Subject.detect_nonwear)"""
 
-        print()
-        print("====================================== REMOVING INVALID DATA ========================================")
-        print("\n" + "Using ECG and sleep data to find valid epochs...")
+        logger.info("REMOVING INVALID DATA")
+        logger.info("Using ECG and sleep data to find valid epochs...")
 
         self.subject_object = subject_object
         self.write_results = write_results
@@ -33,7 +184,15 @@ class AllDevices:
         self.hr_validity = None
         self.sleep_validity = None
 
-        # Data that only contains valid epochs
+        # Intensity data as float arrays (NaN = no data) for each model: "Ankle", "Wrist", "HR", "HR-Acc"
+        self.intensity_arrays = {}
+
+        # Validity criteria as boolean masks (True = valid epoch); combined with logical AND into valid_mask
+        self.validity_masks = {}
+        self.valid_mask = None
+
+        # Data that only contains valid epochs: float arrays, NaN = invalid epoch. Same arrays as valid_intensity
+        self.valid_intensity = {}
         self.ankle = None
         self.wrist = None
         self.hr = None
@@ -53,6 +212,7 @@ class AllDevices:
         self.validity_dict = None
 
         self.hr_validity_counts = None
+        self.ecg_validity_breakdown = None
 
         # =============================================== RUNS METHODS ================================================
 
@@ -68,6 +228,10 @@ class AllDevices:
         if self.subject_object.sleeplog_file is not None:
             self.remove_invalid_sleep()
 
+        # Removal based on detected non-wear
+        if self.subject_object.nonwear:
+            self.remove_nonwear()
+
         self.recalculate_activity_totals()
 
         self.generate_validity_report()
@@ -81,6 +245,7 @@ class AllDevices:
             self.write_activity_totals()
             self.write_validity_report()
             self.write_valid_epochs()
+            self.write_ecg_validity_breakdown()
 
     def organize_data(self):
 
@@ -144,100 +309,103 @@ class AllDevices:
             self.sleep_validity = self.subject_object.sleep.status if \
                 self.subject_object.sleep.status is not None else None
 
-    def remove_invalid_hr(self):
-        """Removes invalid epochs from Ankle and Wrist data based on HR validity."""
+        # Intensity arrays; None values become NaN
+        for model, intensity in zip(["Ankle", "Wrist", "HR", "HR-Acc"],
+                                    [self.ankle_intensity, self.wrist_intensity,
+                                     self.hr_intensity, self.hracc_intensity]):
+            if intensity is not None:
+                self.intensity_arrays[model] = np.array(intensity[:self.data_len], dtype=float)
 
-        print("\n" + "Removing invalid HR epochs...")
+        self.apply_masks()
 
-        self.hr = self.hr_intensity
+    def add_mask(self, name, mask):
+        """Adds a validity criterion and re-applies all criteria to every model's intensity data.
 
-        if self.ankle_intensity is not None:
-            self.ankle = [self.ankle_intensity[i] if self.hr_validity[i] == 0 else None for i in range(self.data_len)]
+        :argument
+        -name: name of criterion (e.g. "HR Valid", "Awake", "Worn")
+        -mask: boolean array-like with one value per epoch; True = valid epoch. Epochs past the end of mask are invalid.
+        """
 
-        if self.wrist_intensity is not None:
-            self.wrist = [self.wrist_intensity[i] if self.hr_validity[i] == 0 else None for i in range(self.data_len)]
+        mask = np.asarray(mask, dtype=bool)[:self.data_len]
 
-        if self.hracc_intensity is not None:
-            self.hr_acc = [self.hracc_intensity[i] if self.hr_validity[i] == 0 else None for i in range(self.data_len)]
+        self.validity_masks[name] = np.zeros(self.data_len, dtype=bool)
+        self.validity_masks[name][:len(mask)] = mask
 
-        print("Complete.")
+        self.apply_masks()
 
-    def remove_invalid_sleep(self):
-        """Removes invalid epochs from Ankle, Wrist, and HR data based on sleep validity.
-           If invalid data has been removed using HR data, this method further removes invalid periods due to sleep.
-           If invalid data has not been removed using HR data, this method removes invalid periods due to sleep from
-           the "raw" data.
-        """
+    def apply_masks(self):
+        """Combines all validity masks into valid_mask and applies it to each model's intensity data in one step.
+           Invalid epochs are NaN in valid_intensity (and the ankle/wrist/hr/hr_acc arrays)."""
 
-        print("\n" + "Removing epochs during sleep...")
+        self.valid_mask = np.ones(self.data_len, dtype=bool)
 
-        # Ankle -------------------------------------------------------------------------------------------------------
-        # If ankle data available and invalid data was not removed using HR
-        if self.ankle_intensity is not None and self.ankle is None:
-            self.ankle = [self.ankle_intensity[i] if self.sleep_validity[i] == 0 else None
-                          for i in range(self.data_len)]
+        for mask in self.validity_masks.values():
+            self.valid_mask &= mask
 
-        # If ankle data available and invalid data was removed
-        if self.ankle_intensity is not None and self.ankle is not None:
-            self.ankle = [self.ankle[i] if self.sleep_validity[i] == 0 else None for i in range(self.data_len)]
+        self.valid_intensity = {model: np.where(self.valid_mask[:len(intensity)], intensity, np.nan)
+                                for model, intensity in self.intensity_arrays.items()}
 
-        # Wrist ------------------------------------------------------------------------------------------------------
-        # If wrist data available and invalid data was not removed using HR
-        if self.wrist_intensity is not None and self.wrist is None:
-            self.wrist = [self.wrist_intensity[i] if self.sleep_validity[i] == 0 else None
-                          for i in range(self.data_len)]
+        self.ankle = self.valid_intensity.get("Ankle", None)
+        self.wrist = self.valid_intensity.get("Wrist", None)
+        self.hr = self.valid_intensity.get("HR", None)
+        self.hr_acc = self.valid_intensity.get("HR-Acc", None)
 
-        # If wrist data available and invalid data was removed using HR
-        if self.wrist_intensity is not None and self.wrist is not None:
-            self.wrist = [self.wrist[i] if self.sleep_validity[i] == 0 else None for i in range(self.data_len)]
+    def valid_list(self, model):
+        """Returns a model's valid intensity data as a list of integers with None for invalid epochs, as written by
+           write_valid_epochs(). Returns None if the model has no data."""
 
-        # Heart Rate -------------------------------------------------------------------------------------------------
-        if self.hr_intensity is not None and self.hr is None:
-            self.hr = [self.hr_intensity[i] if self.sleep_validity[i] == 0 else None for i in range(self.data_len)]
+        if model not in self.valid_intensity:
+            return None
 
-        if self.hr_intensity is not None and self.hr is not None:
-            self.hr = [self.hr[i] if self.sleep_validity[i] == 0 else None for i in range(self.data_len)]
+        intensity = self.valid_intensity[model]
+        valid = ~np.isnan(intensity)
 
-        # HR-ACC -----------------------------------------------------------------------------------------------------
-        if self.hracc_intensity is not None:
-            self.hr_acc = [self.hracc_intensity[i] if self.sleep_validity[i] == 0 else None
-                           for i in range(self.data_len)]
+        values = np.where(valid, intensity, 0).astype(int).astype(object)
+        values[~valid] = None
 
-        print("Complete.")
+        return values.tolist()
 
-    def generate_validity_report(self):
+    def remove_invalid_hr(self):
+        """Removes invalid epochs from all models based on HR validity."""
 
-        try:
-            self.percent_valid = round(100 * (self.data_len - self.ankle.count(None)) / self.data_len, 1)
+        logger.info("Removing invalid HR epochs...")
 
-            self.hours_valid = round((len(self.ankle) * self.subject_object.epoch_len / 3600) *
-                                     (self.percent_valid / 100), 2)
+        self.add_mask(name="HR Valid", mask=np.asarray(self.hr_validity) == 0)
 
-            self.final_epoch_validity = ["Invalid" if i is None else "Valid" for i in self.ankle]
+        logger.info("Complete.")
 
-        except (TypeError, AttributeError):
+    def remove_invalid_sleep(self):
+        """Removes epochs during sleep from all models. Combined with any other validity criteria already added."""
 
-            try:
-                self.percent_valid = round(100 * (self.data_len - self.wrist.count(None)) / self.data_len, 1)
+        logger.info("Removing epochs during sleep...")
+
+        self.add_mask(name="Awake", mask=np.asarray(self.sleep_validity) == 0)
+
+        logger.info("Complete.")
+
+    def remove_nonwear(self):
+        """Removes epochs where any accelerometer was not worn (NonWearDetection) from all models."""
 
-                self.hours_valid = round((len(self.wrist) * self.subject_object.epoch_len / 3600) *
-                                         (self.percent_valid / 100), 2)
+        logger.info("Removing non-wear epochs...")
 
-                self.final_epoch_validity = ["Invalid" if i is None else "Valid" for i in self.wrist]
+        for device, nonwear in self.subject_object.nonwear.items():
+            self.add_mask(name="{} Worn".format(device), mask=nonwear.wear_status)
 
-            except (TypeError, AttributeError):
+        logger.info("Complete.")
 
-                self.percent_valid = round(100 * (self.data_len - self.hr.count(None)) / self.data_len, 1)
+    def generate_validity_report(self):
 
-                self.hours_valid = round((len(self.hr) * self.subject_object.epoch_len / 3600) *
-                                         (self.percent_valid / 100), 2)
+        # Validity is taken from the first available of the ankle, wrist and HR models
+        intensity = [data for data in (self.ankle, self.wrist, self.hr) if data is not None][0]
+        valid = ~np.isnan(intensity)
 
-                self.final_epoch_validity = ["Invalid" if i is None else "Valid" for i in self.hr]
+        self.percent_valid = round(100 * np.count_nonzero(valid) / self.data_len, 1)
+        self.hours_valid = round(np.count_nonzero(valid) * self.subject_object.epoch_len / 3600, 2)
 
-            self.hours_valid = round(self.final_epoch_validity.count("Valid") * self.subject_object.epoch_len / 3600, 2)
+        self.final_epoch_validity = np.where(valid, "Valid", "Invalid").tolist()
 
-            print("\n" + "Validity check complete. {}% of the original "
-                         "data is valid ({} hours).".format(self.percent_valid, self.hours_valid))
+        logger.info("Validity check complete. {}% of the original "
+                    "data is valid ({} hours).".format(self.percent_valid, self.hours_valid))
 
         if self.subject_object.sleeplog_file is None:
             self.validity_dict = {"Valid ECG %": 100 - self.subject_object.ecg.quality_report["Percent invalid"],
@@ -257,93 +425,79 @@ class AllDevices:
                                   "Total Hours Valid": self.hours_valid}
 
     def check_ecgvalidity_activitylevel(self):
+        """Compares accelerometer counts during valid and invalid ECG epochs for each accelerometer. Reports mean/SEM,
+           independent t-test and effect sizes, plus breakdowns by the accelerometer's intensity category and by hour
+           of day. Uses boolean masks over count arrays."""
 
-        print("\n" + "Checking accelerometer data to determine if invalid "
-                     "ECG periods were during more/less movement...")
+        logger.info("Checking accelerometer data to determine if invalid "
+                    "ECG periods were during more/less movement...")
 
         self.hr_validity_counts = {"Wrist valid": None, "Wrist invalid": None,
                                    "Ankle valid": None, "Ankle invalid": None}
-
-        wrist_ttest_t = None
-        wrist_ttest_p = None
-        ankle_ttest_t = None
-        ankle_ttest_p = None
-
-        if self.subject_object.wrist_filepath is not None:
-
-            wrist_valid_data = [self.subject_object.wrist.epoch.svm[i]
-                                for i in range(0, self.data_len)
-                                if self.hr_validity[i] == 0]
-
-            wrist_invalid_data = [self.subject_object.wrist.epoch.svm[i]
-                                  for i in range(0, self.data_len)
-                                  if self.hr_validity[i] == 1]
-
-            valid_mean = stats.mean(wrist_valid_data)
-            valid_sem = stats.stdev(wrist_valid_data) / (len(wrist_valid_data) ** (1/2))
-            invalid_mean = stats.mean(wrist_invalid_data)
-            invalid_sem = stats.stdev(wrist_invalid_data) / (len(wrist_invalid_data) ** (1/2))
-
-            self.hr_validity_counts["Wrist valid"] = round(stats.mean(wrist_valid_data), 1)
-            self.hr_validity_counts["Wrist valid SEM"] = valid_sem
-            self.hr_validity_counts["Wrist invalid"] = round(stats.mean(wrist_invalid_data), 1)
-            self.hr_validity_counts["Wrist invalid SEM"] = invalid_sem
-
-            ttest_result = scipy.stats.ttest_ind(wrist_valid_data, wrist_invalid_data)
-
-            wrist_ttest_t = round(ttest_result[0], 2)
-            wrist_ttest_p = round(ttest_result[1], 5)
-
-            if wrist_ttest_p < .05:
-                print("-Wrist activity may have had a statistically significant effect on ECG validity:")
-            if wrist_ttest_p >= .05:
-                print("-Wrist activity does not appear to have had a statistically significant effect on ECG validity:")
-
-            print("    - Valid counts = {}; invalid counts = {} "
-                  "(t = {}, p ~ {})".format(self.hr_validity_counts["Wrist valid"],
-                                            self.hr_validity_counts["Wrist invalid"], wrist_ttest_t, wrist_ttest_p))
-
-        if self.subject_object.ankle_filepath is not None:
-            ankle_valid_data = [self.subject_object.ankle.epoch.svm[i]
-                                for i in range(0, self.data_len)
-                                if self.hr_validity[i] == 0]
-
-            ankle_invalid_data = [self.subject_object.ankle.epoch.svm[i]
-                                  for i in range(0, self.data_len)
-                                  if self.hr_validity[i] == 1]
-
-            valid_mean = stats.mean(ankle_valid_data)
-            valid_sem = stats.stdev(ankle_valid_data) / (len(ankle_valid_data) ** (1/2))
-            invalid_mean = stats.mean(ankle_valid_data)
-            invalid_sem = stats.stdev(ankle_invalid_data) / (len(ankle_invalid_data) ** (1/2))
-
-            self.hr_validity_counts["Ankle valid"] = round(stats.mean(ankle_valid_data), 1)
-            self.hr_validity_counts["Ankle valid SEM"] = valid_sem
-            self.hr_validity_counts["Ankle invalid"] = round(stats.mean(ankle_invalid_data), 1)
-            self.hr_validity_counts["Ankle invalid SEM"] = invalid_sem
-
-            ttest_result = scipy.stats.ttest_ind(ankle_valid_data, ankle_invalid_data)
-
-            ankle_ttest_t = round(ttest_result[0], 2)
-            ankle_ttest_p = round(ttest_result[1], 5)
-
-            if ankle_ttest_p < .05:
-                print("-Ankle activity may have had a statistically significant effect on ECG validity:")
-            if ankle_ttest_p >= .05:
-                print("-Ankle activity does not appear to have had a statistically significant effect on ECG validity:")
-
-            print("    - Valid counts = {}; invalid counts = {} "
-                  "(t = {}, p ~ {})".format(self.hr_validity_counts["Ankle valid"],
-                                            self.hr_validity_counts["Ankle invalid"], ankle_ttest_t, ankle_ttest_p))
-
-        self.validity_dict["Ankle Valid Counts"] = self.hr_validity_counts["Ankle valid"]
-        self.validity_dict["Ankle Invalid Counts"] = self.hr_validity_counts["Ankle invalid"]
-        self.validity_dict["Ankle Counts (t)"] = ankle_ttest_t
-        self.validity_dict["Ankle Counts (p)"] = ankle_ttest_p
-        self.validity_dict["Wrist Valid Counts"] = self.hr_validity_counts["Wrist valid"]
-        self.validity_dict["Wrist Invalid Counts"] = self.hr_validity_counts["Wrist invalid"]
-        self.validity_dict["Wrist Counts (t)"] = wrist_ttest_t
-        self.validity_dict["Wrist Counts (p)"] = wrist_ttest_p
+        self.ecg_validity_breakdown = {}
+
+        hr_validity = np.asarray(self.hr_validity[:self.data_len])
+        hours = hour_of_day(self.epoch_timestamps[:self.data_len])
+
+        for device, filepath in zip(["Wrist", "Ankle"],
+                                    [self.subject_object.wrist_filepath, self.subject_object.ankle_filepath]):
+
+            self.validity_dict["{} Valid Counts".format(device)] = None
+            self.validity_dict["{} Invalid Counts".format(device)] = None
+            self.validity_dict["{} Counts (t)".format(device)] = None
+            self.validity_dict["{} Counts (p)".format(device)] = None
+            self.validity_dict["{} Counts (d)".format(device)] = None
+            self.validity_dict["{} Counts (g)".format(device)] = None
+
+            if filepath is None:
+                continue
+
+            device_object = self.subject_object.wrist if device == "Wrist" else self.subject_object.ankle
+            counts = np.asarray(device_object.epoch.svm[:self.data_len], dtype=float)
+
+            n = min(len(counts), len(hr_validity))
+            counts = counts[:n]
+            invalid = hr_validity[:n] == 1
+            valid = hr_validity[:n] == 0
+
+            comparison = compare_counts(valid_data=counts[valid], invalid_data=counts[invalid])
+
+            self.hr_validity_counts["{} valid".format(device)] = comparison["Valid mean"]
+            self.hr_validity_counts["{} valid SEM".format(device)] = comparison["Valid SEM"]
+            self.hr_validity_counts["{} invalid".format(device)] = comparison["Invalid mean"]
+            self.hr_validity_counts["{} invalid SEM".format(device)] = comparison["Invalid SEM"]
+
+            self.validity_dict["{} Valid Counts".format(device)] = comparison["Valid mean"]
+            self.validity_dict["{} Invalid Counts".format(device)] = comparison["Invalid mean"]
+            self.validity_dict["{} Counts (t)".format(device)] = comparison["t"]
+            self.validity_dict["{} Counts (p)".format(device)] = comparison["p"]
+            self.validity_dict["{} Counts (d)".format(device)] = comparison["Cohen's d"]
+            self.validity_dict["{} Counts (g)".format(device)] = comparison["Hedges' g"]
+
+            # Breakdowns by accelerometer intensity category and hour of day
+            intensity = self.intensity_arrays.get(device, None)
+
+            self.ecg_validity_breakdown[device] = {
+                "Intensity": group_breakdown(counts=counts, invalid=invalid, valid=valid,
+                                             groups=intensity[:n] if intensity is not None else None, n_groups=4),
+                "Hour": group_breakdown(counts=counts, invalid=invalid, valid=valid,
+                                        groups=hours[:n], n_groups=24)}
+
+            if comparison["p"] is None:
+                logger.info("-{} activity: not enough valid and invalid epochs for comparison.".format(device))
+                continue
+
+            if comparison["p"] < .05:
+                logger.info("-{} activity may have had a statistically significant effect on "
+                            "ECG validity:".format(device))
+            if comparison["p"] >= .05:
+                logger.info("-{} activity does not appear to have had a statistically significant effect on "
+                            "ECG validity:".format(device))
+
+            logger.info("    - Valid counts = {}; invalid counts = {} "
+                        "(t = {}, p ~ {}, d = {}, g = {})".format(comparison["Valid mean"], comparison["Invalid mean"],
+                                                                  comparison["t"], comparison["p"],
+                                                                  comparison["Cohen's d"], comparison["Hedges' g"]))
 
     def plot_validity_comparison(self):
 
@@ -375,22 +529,11 @@ class AllDevices:
         if self.subject_object.sleeplog_file is not None:
             ax1.set_title("Participant {}: Valid Data ({}% valid) (green = sleep)".format(self.subject_object.subjectID,
                                                                                           self.percent_valid))
-            for day1, day2 in zip(self.subject_object.sleep.data[:], self.subject_object.sleep.data[1:]):
-                try:
-                    # Overnight sleep
-                    ax1.fill_betweenx(x1=day1[3], x2=day2[0], y=np.arange(0, 4), color='green', alpha=0.35)
-                    ax2.fill_betweenx(x1=day1[3], x2=day2[0], y=np.arange(0, 4), color='green', alpha=0.35)
-                    ax3.fill_betweenx(x1=day1[3], x2=day2[0], y=np.arange(0, 4), color='green', alpha=0.35)
-                    ax4.fill_betweenx(x1=day1[3], x2=day2[0], y=np.arange(0, 4), color='green', alpha=0.35)
-
-                    # Daytime naps
-                    ax1.fill_betweenx(x1=day1[2], x2=day1[1], y=np.arange(0, 4), color='green', alpha=0.35)
-                    ax2.fill_betweenx(x1=day1[2], x2=day1[1], y=np.arange(0, 4), color='green', alpha=0.35)
-                    ax3.fill_betweenx(x1=day1[2], x2=day1[1], y=np.arange(0, 4), color='green', alpha=0.35)
-                    ax4.fill_betweenx(x1=day1[2], x2=day1[1], y=np.arange(0, 4), color='green', alpha=0.35)
-
-                except (AttributeError, TypeError):
-                    pass
+            # Epochs marked as sleep (naps and overnight sleep)
+            for start, end in sleep_intervals(sleep_status=self.subject_object.sleep.status,
+                                              timestamps=self.epoch_timestamps[:self.data_len]):
+                for ax in (ax1, ax2, ax3, ax4):
+                    ax.fill_betweenx(x1=start, x2=end, y=np.arange(0, 4), color='green', alpha=0.35)
 
         if self.ankle_intensity is not None:
             ax1.plot(self.epoch_timestamps[:self.data_len], self.ankle[:self.data_len], color='#606060', label='Ankle')
@@ -424,90 +567,14 @@ class AllDevices:
 
     def recalculate_activity_totals(self):
 
-        # ANKLE -------------------------------------------------------------------------------------------------------
-        if self.ankle is not None:
-            epoch_to_minutes = 60 / self.subject_object.ankle.epoch_len
-
-            n_valid_epochs = len(self.ankle) - self.ankle.count(None)
-
-            self.ankle_totals = {"Model": "Ankle",
-                                 "Sedentary": self.ankle.count(0) / epoch_to_minutes,
-                                 "Sedentary%": round(self.ankle.count(0) / n_valid_epochs, 3),
-                                 "Light": (self.ankle.count(1)) / epoch_to_minutes,
-                                 "Light%": round(self.ankle.count(1) / n_valid_epochs, 3),
-                                 "Moderate": self.ankle.count(2) / epoch_to_minutes,
-                                 "Moderate%": round(self.ankle.count(2) / n_valid_epochs, 3),
-                                 "Vigorous": self.ankle.count(3) / epoch_to_minutes,
-                                 "Vigorous%": round(self.ankle.count(3) / n_valid_epochs, 3)}
-
-        if self.ankle is None:
-            self.ankle_totals = {"Model": "Ankle",
-                                 "Sedentary": 0, "Sedentary%": 0,
-                                 "Light": 0, "Light%": 0,
-                                 "Moderate": 0, "Moderate%": 0,
-                                 "Vigorous": 0, "Vigorous%": 0}
-
-        # WRIST -------------------------------------------------------------------------------------------------------
-        if self.wrist is not None:
-            epoch_to_minutes = 60 / self.subject_object.wrist.epoch_len
-
-            n_valid_epochs = len(self.wrist) - self.wrist.count(None)
-
-            self.wrist_totals = {"Model": "Wrist",
-                                 "Sedentary": self.wrist.count(0) / epoch_to_minutes,
-                                 "Sedentary%": round(self.wrist.count(0) / n_valid_epochs, 3),
-                                 "Light": (self.wrist.count(1)) / epoch_to_minutes,
-                                 "Light%": round(self.wrist.count(1) / n_valid_epochs, 3),
-                                 "Moderate": self.wrist.count(2) / epoch_to_minutes,
-                                 "Moderate%": round(self.wrist.count(2) / n_valid_epochs, 3),
-                                 "Vigorous": self.wrist.count(3) / epoch_to_minutes,
-                                 "Vigorous%": round(self.wrist.count(3) / n_valid_epochs, 3)}
-
-            if self.wrist is None:
-                self.wrist_totals = {"Model": "Wrist",
-                                     "Sedentary": 0, "Sedentary%": 0,
-                                     "Light": 0, "Light%": 0,
-                                     "Moderate": 0, "Moderate%": 0,
-                                     "Vigorous": 0, "Vigorous%": 0}
-
-        # HEART RATE --------------------------------------------------------------------------------------------------
-        if self.hr is not None:
-            epoch_to_minutes = 60 / self.subject_object.ecg.epoch_len
-
-            n_valid_epochs = len(self.hr) - self.hr.count(None)
-
-            self.hr_totals = {"Model": "HR",
-                              "Sedentary": self.hr.count(0) / epoch_to_minutes,
-                              "Sedentary%": round(self.hr.count(0) / n_valid_epochs, 3),
-                              "Light": (self.hr.count(1)) / epoch_to_minutes,
-                              "Light%": round(self.hr.count(1) / n_valid_epochs, 3),
-                              "Moderate": self.hr.count(2) / epoch_to_minutes,
-                              "Moderate%": round(self.hr.count(2) / n_valid_epochs, 3),
-                              "Vigorous": self.hr.count(3) / epoch_to_minutes,
-                              "Vigorous%": round(self.hr.count(3) / n_valid_epochs, 3)}
-
-        if self.hr is None:
-            self.hr_totals = {"Model": "HR",
-                              "Sedentary": 0, "Sedentary%": 0,
-                              "Light": 0, "Light%": 0,
-                              "Moderate": 0, "Moderate%": 0,
-                              "Vigorous": 0, "Vigorous%": 0}
-
-        # HR-ACC ------------------------------------------------------------------------------------------------------
-        if self.hr_acc is not None:
-            epoch_to_minutes = 60 / self.subject_object.hr_acc.epoch_len
-
-            n_valid_epochs = len(self.hr_acc) - self.hr_acc.count(None)
-
-            self.hracc_totals = {"Model": "HR-Acc",
-                                 "Sedentary": self.hr_acc.count(0) / epoch_to_minutes,
-                                 "Sedentary%": round(self.hr_acc.count(0) / n_valid_epochs, 3),
-                                 "Light": (self.hr_acc.count(1)) / epoch_to_minutes,
-                                 "Light%": round(self.hr_acc.count(1) / n_valid_epochs, 3),
-                                 "Moderate": self.hr_acc.count(2) / epoch_to_minutes,
-                                 "Moderate%": round(self.hr_acc.count(2) / n_valid_epochs, 3),
-                                 "Vigorous": self.hr_acc.count(3) / epoch_to_minutes,
-                                 "Vigorous%": round(self.hr_acc.count(3) / n_valid_epochs, 3)}
+        self.ankle_totals = activity_totals(model="Ankle", intensity=self.ankle,
+                                            epoch_len=self.subject_object.epoch_len)
+        self.wrist_totals = activity_totals(model="Wrist", intensity=self.wrist,
+                                            epoch_len=self.subject_object.epoch_len)
+        self.hr_totals = activity_totals(model="HR", intensity=self.hr,
+                                         epoch_len=self.subject_object.epoch_len)
+        self.hracc_totals = activity_totals(model="HR-Acc", intensity=self.hr_acc,
+                                            epoch_len=self.subject_object.epoch_len)
 
     def write_activity_totals(self):
 
@@ -532,10 +599,9 @@ class AllDevices:
             if self.subject_object.ankle is not None and self.subject_object.ecg is not None:
                 writer.writerow(self.hracc_totals)
 
-            print()
-            print("Saved activity profiles from valid data to file "
-                  "{}Model Output/OND07_WTL_{}_01_Valid_Activity_Totals.csv".format(self.subject_object.output_dir,
-                                                                                    self.subject_object.subjectID))
+            logger.info("Saved activity profiles from valid data to file "
+                        "{}Model Output/OND07_WTL_{}_01_Valid_Activity_Totals.csv".format(
+                            self.subject_object.output_dir, self.subject_object.subjectID))
 
     def write_valid_epochs(self):
 
@@ -547,28 +613,18 @@ class AllDevices:
 
             writer.writerow(["Timestamp", "Validity", "Wrist", "Ankle", "HR"])
 
-            # Prevents TypeError during writing to .csv if object is None
-            if self.wrist_intensity is None:
-                wrist_intensity = [None for i in range(len(self.epoch_timestamps))]
-            if self.wrist_intensity is not None:
-                wrist_intensity = self.wrist
-
-            if self.ankle_intensity is None:
-                ankle_intensity = [None for i in range(len(self.epoch_timestamps))]
-            if self.ankle_intensity is not None:
-                ankle_intensity = self.ankle
-
-            if self.hr_intensity is None:
-                hr_intensity = [None for i in range(len(self.epoch_timestamps))]
-            if self.hr_intensity is not None:
-                hr_intensity = self.hr
+            # Invalid epochs and missing models are written as blank values
+            columns = [self.valid_list(model) for model in ("Wrist", "Ankle", "HR")]
+            wrist_intensity, ankle_intensity, hr_intensity = \
+                [column if column is not None else [None for i in range(len(self.epoch_timestamps))]
+                 for column in columns]
 
             writer.writerows(zip(self.epoch_timestamps, self.final_epoch_validity,
                                  wrist_intensity, ankle_intensity, hr_intensity))
 
-        print("\n" + "Saved epoch-by-epoch intensity data to file "
-                     "{}Model Output/OND07_WTL_{}_01_Valid_EpochIntensityData.csv"
-              .format(self.subject_object.output_dir, self.subject_object.subjectID))
+        logger.info("Saved epoch-by-epoch intensity data to file "
+                    "{}Model Output/OND07_WTL_{}_01_Valid_EpochIntensityData.csv"
+             .format(self.subject_object.output_dir, self.subject_object.subjectID))
 
     def calculate_hr_hracc_diff(self):
         """Calculates difference between HR-Acc and ankle models for each intensity. Positive value indicates
@@ -687,9 +743,9 @@ class AllDevices:
                   "_ValidityData.csv", "w") as outfile:
             fieldnames = ['Valid ECG %', 'ECG Hours Lost',
                           'Ankle Valid Counts', 'Ankle Invalid Counts',
-                          'Ankle Counts (t)', 'Ankle Counts (p)',
+                          'Ankle Counts (t)', 'Ankle Counts (p)', 'Ankle Counts (d)', 'Ankle Counts (g)',
                           'Wrist Valid Counts', 'Wrist Invalid Counts',
-                          'Wrist Counts (t)', 'Wrist Counts (p)',
+                          'Wrist Counts (t)', 'Wrist Counts (p)', 'Wrist Counts (d)', 'Wrist Counts (g)',
                           'Sleep %', 'Sleep Hours Lost',
                           'Total Valid %', "Total Hours Valid"]
 
@@ -698,8 +754,33 @@ class AllDevices:
             writer.writeheader()
             writer.writerow(self.validity_dict)
 
-        print("\n" + "Saved validity summary data to file {}".format(self.subject_object.output_dir) +
-              str(self.subject_object.subjectID) + "_ValidityData.csv")
+        logger.info("Saved validity summary data to file {}".format(self.subject_object.output_dir) +
+             str(self.subject_object.subjectID) + "_ValidityData.csv")
+
+    def write_ecg_validity_breakdown(self):
+        """Writes ECG validity and accelerometer counts by intensity category and hour of day."""
+
+        if not self.ecg_validity_breakdown:
+            return None
+
+        with open(self.subject_object.output_dir + str(self.subject_object.subjectID) +
+                  "_ECGValidityBreakdown.csv", "w") as outfile:
+            writer = csv.writer(outfile, delimiter=",", lineterminator="\n")
+
+            writer.writerow(["Device", "Group", "Level", "Epochs", "Invalid %", "Valid Counts", "Invalid Counts"])
+
+            for device, breakdowns in self.ecg_validity_breakdown.items():
+                for group, breakdown in breakdowns.items():
+                    if breakdown is None:
+                        continue
+
+                    for level in range(len(breakdown["Epochs"])):
+                        writer.writerow([device, group, level, breakdown["Epochs"][level],
+                                         breakdown["Invalid %"][level], breakdown["Valid Counts"][level],
+                                         breakdown["Invalid Counts"][level]])
+
+        logger.info("Saved ECG validity breakdown to file {}".format(self.subject_object.output_dir) +
+             str(self.subject_object.subjectID) + "_ECGValidityBreakdown.csv")
 
 
 class AccelOnly:
@@ -708,9 +789,8 @@ class AccelOnly:
         """Generates a class instance that creates and stores data where all devices/models generated valid data.
            Removes periods of invalid ECG data, sleep, and non-wear (NOT CURRENTLY IMPLEMENTED)"""
 
-        print()
-        print("====================================== REMOVING INVALID DATA ========================================")
-        print("\n" + "Using only sleep to find valid epochs in accelerometer data...")
+        logger.info("REMOVING INVALID DATA")
+        logger.info("Using only sleep to find valid epochs in accelerometer data...")
 
         self.subject_object = subject_object
         self.write_results = write_results
@@ -808,7 +888,7 @@ class AccelOnly:
         """
 
         if self.subject_object.sleeplog_file is not None:
-            print("\n" + "Removing epochs during sleep...")
+            logger.info("Removing epochs during sleep...")
 
             # Ankle --------------------------------------------------------------------------------------------------
             if self.ankle_intensity is not None and self.ankle is None:
@@ -820,10 +900,10 @@ class AccelOnly:
                 self.wrist = [self.wrist_intensity[i] if self.sleep_validity[i] == 0 else None
                               for i in range(self.data_len)]
 
-            print("Complete.")
+            logger.info("Complete.")
 
         if self.subject_object.sleeplog_file is None:
-            print("No sleep data. Cannot remove sleep periods.")
+            logger.warning("No sleep data. Cannot remove sleep periods.")
 
             self.ankle = self.ankle_intensity
             self.wrist = self.wrist_intensity
@@ -844,8 +924,8 @@ class AccelOnly:
 
         self.hours_valid = round(self.final_epoch_validity.count("Valid") * self.subject_object.epoch_len / 3600, 2)
 
-        print("\n" + "Validity check complete. {}% of the original "
-                     "data is valid ({} hours).".format(self.percent_valid, self.hours_valid))
+        logger.info("Validity check complete. {}% of the original "
+                    "data is valid ({} hours).".format(self.percent_valid, self.hours_valid))
 
         self.validity_dict = {"Valid ECG %": None,
                               "ECG Hours Lost": None,
@@ -873,18 +953,11 @@ class AccelOnly:
             ax1.set_title("Participant {}: Accel-Only Valid Data ({}% valid) "
                           "(green = sleep)".format(self.subject_object.subjectID, self.percent_valid))
 
-            for day1, day2 in zip(self.subject_object.sleep.data[:], self.subject_object.sleep.data[1:]):
-                try:
-                    # Overnight sleep
-                    ax1.fill_betweenx(x1=day1[3], x2=day2[0], y=np.arange(0, 4), color='green', alpha=0.35)
-                    ax2.fill_betweenx(x1=day1[3], x2=day2[0], y=np.arange(0, 4), color='green', alpha=0.35)
-
-                    # Daytime naps
-                    ax1.fill_betweenx(x1=day1[2], x2=day1[1], y=np.arange(0, 4), color='green', alpha=0.35)
-                    ax2.fill_betweenx(x1=day1[2], x2=day1[1], y=np.arange(0, 4), color='green', alpha=0.35)
-
-                except (AttributeError, TypeError):
-                    pass
+            # Epochs marked as sleep (naps and overnight sleep)
+            for start, end in sleep_intervals(sleep_status=self.subject_object.sleep.status,
+                                              timestamps=self.epoch_timestamps[:self.data_len]):
+                for ax in (ax1, ax2):
+                    ax.fill_betweenx(x1=start, x2=end, y=np.arange(0, 4), color='green', alpha=0.35)
 
         if self.ankle_intensity is not None:
             ax1.plot(self.epoch_timestamps[:self.data_len], self.ankle[:self.data_len], color='#606060', label='Ankle')
@@ -960,10 +1033,9 @@ class AccelOnly:
             if self.subject_object.wrist is not None:
                 writer.writerow(self.wrist_totals)
 
-            print()
-            print("Saved activity profiles from valid data to file "
-                  "{}OND07_WTL_{}_01_Valid_Activity_Totals_AccelOnly.csv".format(self.subject_object.output_dir,
-                                                                                 str(self.subject_object.subjectID)))
+            logger.info("Saved activity profiles from valid data to file "
+                        "{}OND07_WTL_{}_01_Valid_Activity_Totals_AccelOnly.csv".format(
+                            self.subject_object.output_dir, str(self.subject_object.subjectID)))
 
     def write_valid_epochs(self):
 
@@ -989,10 +1061,10 @@ class AccelOnly:
             writer.writerows(zip(self.epoch_timestamps, self.final_epoch_validity,
                                  wrist_intensity, ankle_intensity))
 
-        print("\n" + "Saved epoch-by-epoch intensity data to file "
-                     "{}OND07_WTL_{}_01_Valid_"
-                     "EpochIntensityData_AccelOnly.csv".format(self.subject_object.output_dir,
-                                                               str(self.subject_object.subjectID)))
+        logger.info("Saved epoch-by-epoch intensity data to file "
+                    "{}OND07_WTL_{}_01_Valid_"
+                    "EpochIntensityData_AccelOnly.csv".format(self.subject_object.output_dir,
+                                                              str(self.subject_object.subjectID)))
 
     def write_validity_report(self):
 
@@ -1007,5 +1079,5 @@ class AccelOnly:
             writer.writeheader()
             writer.writerow(self.validity_dict)
 
-        print("\n" + "Saved validity summary data to file {}".format(self.subject_object.output_dir) +
-              str(self.subject_object.subjectID) + "_ValidityData_AccelOnly.csv")
+        logger.info("Saved validity summary data to file {}".format(self.subject_object.output_dir) +
+             str(self.subject_object.subjectID) + "_ValidityData_AccelOnly.csv")